@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the cern-snow-client library.
+# Copyright (c) 2017 CERN
+# Authors:
+#  - James Clerc <james.clerc@cern.ch> <james.clerc@epitech.eu>
+#  - David Martin Clavo <david.martin.clavo@cern.ch>
+#
+# The cern-snow-client library is free software; you can redistribute it
+# and/or modify it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# The cern-snow-client library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with the cern-snow-client library.  If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+import base64
+import json
+import uuid
+
+from common import SnowClientException
+from record import SessionAware
+
+
+class RecordBatch(SessionAware):
+    """
+    Collects inserts and updates of Record objects (or of its subclasses: Task, Incident, Request...)
+    and sends them to ServiceNow together, through the Batch API (``/api/now/v1/batch``): each chunk of
+    operations is sent in a single HTTP round trip, instead of one POST or PUT per record.
+    After executing the batch, the attributes of each Record object are updated with the resulting values
+    from ServiceNow, as with ``Record.insert()`` and ``Record.update()``.
+
+    Args:
+        session (SnowRestSession): a cern_snow_client.session.SnowRestSession object, which will be used
+            to authenticate and communicate with ServiceNow
+        chunk_size (:obj:`int`, optional): the maximum number of operations sent in a single batch request.
+            By default, 50.
+
+    Raises:
+        SnowClientException : if any of the parameters is set incorrectly
+
+    Examples:
+        Reassigning many incidents, 50 per HTTP round trip:
+
+        >>> batch = RecordBatch(s)  # s is a SnowRestSession object
+        >>> for record in IncidentQuery(s).query(query_encoded="assignment_group=" + old_group):
+        >>>     record.assignment_group = new_group
+        >>>     batch.update(record)
+        >>> results = batch.execute()  # [True, True, ...]
+
+        Inserting new incidents, the batch is executed at the end of the ``with`` block:
+
+        >>> with RecordBatch(s) as batch:
+        >>>     for short_description in short_descriptions:
+        >>>         batch.insert(Incident(s, {'short_description': short_description}))
+    """
+
+    batch_url = '/api/now/v1/batch'
+
+    def __init__(self, session, chunk_size=50):
+        if not session:
+            raise SnowClientException('RecordBatch.__init__: To create a RecordBatch instance '
+                                      'you need to provide a non-empty SnowRestSession object.')
+        if chunk_size < 1:
+            raise SnowClientException('RecordBatch.__init__: chunk_size should be a positive integer')
+
+        super(RecordBatch, self).__init__(session)
+        self._chunk_size = chunk_size
+        self._operations = []
+        self._status_codes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.execute()
+
+    def insert(self, record):
+        """
+        Adds the insertion of a record to the batch.
+
+        Args:
+            record (Record): the record to insert. Its changed fields will be sent when executing the batch.
+
+        Raises:
+            SnowClientException: if the record is of a table where records cannot be inserted
+        """
+        self._operations.append(('POST', record, record._get_insert_url()))
+
+    def update(self, record, key=None):
+        """
+        Adds the update of a record to the batch.
+        If the ``sys_id`` or ``sys_class_name`` of the record are needed and not known, they are fetched
+        immediately from ServiceNow, as in ``Record.update()``.
+
+        Args:
+            record (Record): the record to update. Its changed fields will be sent when executing the batch.
+            key (:obj:`str`, :obj:`unicode` or :obj:`tuple`, optional): see ``Record.update()``
+
+        Returns:
+            bool: True if the update was added to the batch, False if the record does not exist
+
+        Raises:
+            SnowClientException: if no key is provided and the record has no ``sys_id``
+        """
+        url = record._get_update_url(key)
+        if not url:
+            return False
+        self._operations.append(('PUT', record, url))
+        return True
+
+    def execute(self):
+        """
+        Sends the operations of the batch to ServiceNow, in chunks of ``chunk_size`` operations,
+        and updates the records with the resulting values. The batch is then emptied.
+
+        Returns:
+            list: for each operation, in the order in which they were added, True if it succeeded,
+            False otherwise. See ``get_status_codes()`` for the details.
+
+        Raises:
+            SnowRestSessionException : if there is any authentication problem
+        """
+        operations = self._operations
+        self._operations = []
+        self._status_codes = []
+
+        results = []
+        for start in range(0, len(operations), self._chunk_size):
+            chunk_results, chunk_status_codes = self.__execute_chunk(operations[start:start + self._chunk_size])
+            results.extend(chunk_results)
+            self._status_codes.extend(chunk_status_codes)
+        return results
+
+    def get_status_codes(self):
+        """
+        Returns:
+            list: for each operation of the last ``execute()``, the HTTP status code returned by ServiceNow,
+            or None if ServiceNow did not execute the operation
+        """
+        return self._status_codes
+
+    def get_pending_count(self):
+        """
+        Returns:
+            int: the number of operations added to the batch and not yet executed
+        """
+        return len(self._operations)
+
+    def __execute_chunk(self, operations):
+        """
+        Sends a chunk of operations in a single batch request.
+
+        Returns:
+            tuple: (list of bool, list of status codes), one per operation
+        """
+        rest_requests = []
+        for index, (method, record, url) in enumerate(operations):
+            rest_requests.append({
+                'id': str(index),
+                'method': method,
+                'url': url + '?sysparm_display_value=all',
+                'headers': [
+                    {'name': 'Content-Type', 'value': 'application/json'},
+                    {'name': 'Accept', 'value': 'application/json'},
+                ],
+                'body': base64.b64encode(json.dumps(record.get_changed_fields())),
+            })
+        batch_request_id = str(uuid.uuid4())
+        data = json.dumps({'batch_request_id': batch_request_id, 'rest_requests': rest_requests})
+
+        self._info('RecordBatch.execute: sending a batch of %d operations', len(operations))
+        response = self._session.post(url=self.batch_url, data=data)
+
+        results = [False] * len(operations)
+        status_codes = [None] * len(operations)
+        try:
+            serviced_requests = json.loads(response.text).get('serviced_requests', [])
+        except ValueError:
+            serviced_requests = []
+        if response.status_code != 200:
+            self._error('RecordBatch.execute: the batch request failed with status code %d: %s',
+                        response.status_code, self._session._truncate_log_body(response.text))
+
+        for serviced_request in serviced_requests:
+            index = int(serviced_request['id'])
+            method, record, url = operations[index]
+            status_codes[index] = serviced_request.get('status_code')
+            body = base64.b64decode(serviced_request.get('body') or '')
+
+            if status_codes[index] in (200, 201):
+                try:
+                    result = json.loads(body)
+                except ValueError:
+                    self._warning('RecordBatch.execute: the result of the operation %s %s could not be parsed: %s',
+                                  method, url, self._session._truncate_log_body(body))
+                    continue
+                results[index] = record._set_result(result)
+            else:
+                self._warning('RecordBatch.execute: the operation %s %s failed with status code %s: %s', method, url,
+                              status_codes[index], self._session._truncate_log_body(body))
+
+        return results, status_codes
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the cern-snow-client library.
+# Copyright (c) 2017 CERN
+# Authors:
+#  - James Clerc <james.clerc@cern.ch> <james.clerc@epitech.eu>
+#  - David Martin Clavo <david.martin.clavo@cern.ch>
+#
+# The cern-snow-client library is free software; you can redistribute it
+# and/or modify it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# The cern-snow-client library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with the cern-snow-client library.  If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+import threading
+import time
+
+from common import SnowClientException
+
+
+class LRUCache(object):
+    """
+    A thread-safe cache with a maximum number of entries and a time to live.
+    When the cache is full, the least recently used entry is evicted. Entries older than ``ttl`` seconds
+    are not returned anymore.
+
+    Args:
+        max_entries (int): the maximum number of entries
+        ttl (:obj:`float`, optional): the number of seconds an entry is valid after being set.
+            If None, entries do not expire.
+
+    Raises:
+        SnowClientException : if any of the parameters is set incorrectly
+
+    Examples:
+        >>> cache = LRUCache(1000, ttl=300)
+        >>> cache.set(('incident', 'number', 'INC0426232'), ('c1c535ba85f45540adf94de5b835cd43', 'incident'))
+        >>> print cache.get(('incident', 'number', 'INC0426232'))[0]  # 'c1c535ba85f45540adf94de5b835cd43'
+    """
+
+    # positions in the entries, which are lists [previous entry, next entry, key, value, expiry time]
+    __PREVIOUS, __NEXT, __KEY, __VALUE, __EXPIRES_AT = range(5)
+
+    def __init__(self, max_entries, ttl=None):
+        if max_entries < 1:
+            raise SnowClientException('LRUCache.__init__: max_entries should be a positive integer')
+        if ttl is not None and ttl <= 0:
+            raise SnowClientException('LRUCache.__init__: ttl should be a positive number of seconds')
+
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        # the entries form a circular doubly linked list, from the most to the least recently used,
+        # around this root entry
+        self._root = []
+        self._root[:] = [self._root, self._root, None, None, None]
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def get(self, key, default=None):
+        """
+        Args:
+            key (object): a hashable key
+            default (:obj:`object`, optional): the value to return if the key is not in the cache
+
+        Returns:
+            object: the value set for the key, or ``default`` if there is none or it has expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return default
+            if entry[self.__EXPIRES_AT] is not None and entry[self.__EXPIRES_AT] <= time.time():
+                self.__remove_entry(entry)
+                self._expirations += 1
+                self._misses += 1
+                return default
+
+            self._hits += 1
+            self.__unlink(entry)
+            self.__link_first(entry)
+            return entry[self.__VALUE]
+
+    def set(self, key, value):
+        """
+        Sets the value of a key, evicting the least recently used entry if the cache is full.
+
+        Args:
+            key (object): a hashable key
+            value (object): the value
+        """
+        expires_at = None
+        if self._ttl is not None:
+            expires_at = time.time() + self._ttl
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.__unlink(entry)
+            else:
+                if len(self._entries) >= self._max_entries:
+                    self.__remove_entry(self._root[self.__PREVIOUS])
+                    self._evictions += 1
+                entry = [None, None, key, None, None]
+                self._entries[key] = entry
+
+            entry[self.__VALUE] = value
+            entry[self.__EXPIRES_AT] = expires_at
+            self.__link_first(entry)
+
+    def invalidate(self, key):
+        """
+        Removes a key from the cache, if present.
+
+        Args:
+            key (object): a hashable key
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.__remove_entry(entry)
+
+    def clear(self):
+        """
+        Removes all the entries of the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._root[:] = [self._root, self._root, None, None, None]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get_statistics(self):
+        """
+        Returns:
+            dict: the number of ``hits`` and ``misses`` of ``get``, the number of entries evicted because the cache
+            was full (``evictions``) or found expired (``expirations``), and the current number of ``entries``
+        """
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+                'entries': len(self._entries),
+            }
+
+    def get_max_entries(self):
+        """
+        Returns:
+            int: the maximum number of entries
+        """
+        return self._max_entries
+
+    def get_ttl(self):
+        """
+        Returns:
+            float: the number of seconds an entry is valid, or None if entries do not expire
+        """
+        return self._ttl
+
+    def __link_first(self, entry):
+        first = self._root[self.__NEXT]
+        entry[self.__PREVIOUS] = self._root
+        entry[self.__NEXT] = first
+        first[self.__PREVIOUS] = entry
+        self._root[self.__NEXT] = entry
+
+    def __unlink(self, entry):
+        entry[self.__PREVIOUS][self.__NEXT] = entry[self.__NEXT]
+        entry[self.__NEXT][self.__PREVIOUS] = entry[self.__PREVIOUS]
+
+    def __remove_entry(self, entry):
+        self.__unlink(entry)
+        del self._entries[entry[self.__KEY]]
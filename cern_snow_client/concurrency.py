@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the cern-snow-client library.
+# Copyright (c) 2017 CERN
+# Authors:
+#  - James Clerc <james.clerc@cern.ch> <james.clerc@epitech.eu>
+#  - David Martin Clavo <david.martin.clavo@cern.ch>
+#
+# The cern-snow-client library is free software; you can redistribute it
+# and/or modify it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# The cern-snow-client library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with the cern-snow-client library.  If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+import collections
+import threading
+import time
+
+from common import SnowClientException
+
+
+class AdaptiveConcurrencyLimiter(object):
+    """
+    Limits the number of REST operations sent to ServiceNow at the same time, adapting the limit to the load of
+    the instance with AIMD (additive increase, multiplicative decrease): the limit grows by ``increase`` operations
+    per round of operations while they succeed fast enough and the limit is reached, i.e. only when the limit is
+    what holds the operations back, and is multiplied by ``decrease_factor`` when an
+    operation fails with a 429 or 5xx status code or a connection error, or when the 95th percentile of the
+    latency of the last ``latency_window`` operations exceeds ``latency_tolerance`` times a baseline. The baseline
+    is the lowest 95th percentile observed, which slowly follows the current one after each window of operations
+    (by ``baseline_aging``), so that a permanent change of the latency of the instance is eventually accepted.
+
+    Once set on a SnowRestSession (see ``SnowRestSession.set_concurrency_limiter``), it applies to all the
+    operations of the session, e.g. of Record, RecordQuery with ``parallel_pages``, or RecordSet.update_all
+    with ``max_workers``: the number of threads is then the maximum, and the limiter the actual concurrency.
+    A streamed GET operation (``stream=True``) is in flight until its response is closed, which
+    ``ResultStreamParser`` does once the body has been parsed: its latency includes the time to read the body.
+
+    Args:
+        initial_limit (:obj:`int`, optional): the initial number of concurrent operations
+        min_limit (:obj:`int`, optional): the minimum number of concurrent operations
+        max_limit (:obj:`int`, optional): the maximum number of concurrent operations
+        increase (:obj:`float`, optional): the number of concurrent operations added after a round of
+            successful operations
+        decrease_factor (:obj:`float`, optional): the factor applied to the limit after a failure
+        latency_window (:obj:`int`, optional): the number of operations whose latency is used for the percentile
+        latency_tolerance (:obj:`float`, optional): how many times the baseline the current 95th percentile
+            can be before the limit is decreased. None to ignore the latency.
+        baseline_aging (:obj:`float`, optional): the fraction of the difference between the current 95th
+            percentile and the baseline added to the baseline after each window of operations. 0 to keep the
+            lowest 95th percentile ever observed.
+
+    Raises:
+        SnowClientException : if any of the parameters is set incorrectly
+
+    Examples:
+        >>> limiter = AdaptiveConcurrencyLimiter(initial_limit=4, max_limit=32)
+        >>> s.set_concurrency_limiter(limiter)  # s is a SnowRestSession object
+        >>> report = record_set.update_all({'assignment_group': group_sys_id}, max_workers=32)
+        >>> print limiter.get_limit()  # the number of concurrent operations currently allowed
+    """
+
+    def __init__(self, initial_limit=4, min_limit=1, max_limit=64, increase=1.0, decrease_factor=0.5,
+                 latency_window=100, latency_tolerance=2.0, baseline_aging=0.1):
+        if not 1 <= min_limit <= initial_limit <= max_limit:
+            raise SnowClientException('AdaptiveConcurrencyLimiter.__init__: the limits should verify '
+                                      '1 <= min_limit <= initial_limit <= max_limit')
+        if increase <= 0 or not 0 < decrease_factor < 1:
+            raise SnowClientException('AdaptiveConcurrencyLimiter.__init__: increase should be positive and '
+                                      'decrease_factor between 0 and 1')
+        if latency_window < 1:
+            raise SnowClientException('AdaptiveConcurrencyLimiter.__init__: latency_window should be positive')
+        if not 0 <= baseline_aging <= 1:
+            raise SnowClientException('AdaptiveConcurrencyLimiter.__init__: baseline_aging should be between '
+                                      '0 and 1')
+
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = float(increase)
+        self.decrease_factor = float(decrease_factor)
+        self.latency_window = latency_window
+        self.latency_tolerance = latency_tolerance
+        self.baseline_aging = float(baseline_aging)
+
+        self._condition = threading.Condition()
+        self._limit = float(initial_limit)
+        self._in_flight = 0
+        self._latencies = collections.deque(maxlen=latency_window)
+        self._baseline_p95_latency = None
+        # the number of latencies recorded since the baseline was last updated
+        self._latencies_since_baseline = 0
+        # operations are numbered in the order they are started
+        self._started_count = 0
+        self._started_count_at_decrease = 0
+        # the number of the last operation started while the limit was reached
+        self._started_count_at_limit = 0
+        self._decrease_count = 0
+
+    def acquire(self):
+        """
+        Waits until an operation can be sent.
+
+        Returns:
+            tuple: the number and start time of the operation, to be passed to ``release``
+        """
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                self._condition.wait()
+            self._in_flight += 1
+            self._started_count += 1
+            if self._in_flight >= int(self._limit):
+                self._started_count_at_limit = self._started_count
+            return self._started_count, time.time()
+
+    def release(self, operation, status_code=None, error=False):
+        """
+        Records the end of an operation, and adapts the limit.
+
+        Args:
+            operation (tuple): the value returned by ``acquire``
+            status_code (:obj:`int`, optional): the status code of the response
+            error (:obj:`bool`, optional): True if the operation failed without a response, e.g. connection error
+        """
+        number, started_at = operation
+        latency = time.time() - started_at
+        with self._condition:
+            self._in_flight -= 1
+
+            overloaded = error or status_code == 429 or (status_code is not None and status_code >= 500)
+            if not overloaded:
+                self._latencies.append(latency)
+                self._latencies_since_baseline += 1
+                overloaded = self.__latency_too_high()
+
+            if overloaded:
+                # the operations started before the last decrease were sent with the previous limit
+                if number > self._started_count_at_decrease:
+                    self._limit = max(float(self.min_limit), self._limit * self.decrease_factor)
+                    self._started_count_at_decrease = self._started_count
+                    self._decrease_count += 1
+                    self._latencies.clear()
+                    self._latencies_since_baseline = 0
+            elif number <= self._started_count_at_limit:
+                # the operation was in flight while the limit was reached: a higher limit could have been used
+                self._limit = min(float(self.max_limit), self._limit + self.increase / self._limit)
+
+            self._condition.notify_all()
+
+    def __latency_too_high(self):
+        if self.latency_tolerance is None or len(self._latencies) < self.latency_window:
+            return False
+        p95_latency = self.__get_p95_latency()
+        if self._baseline_p95_latency is None or p95_latency < self._baseline_p95_latency:
+            self._baseline_p95_latency = p95_latency
+            self._latencies_since_baseline = 0
+        elif self._latencies_since_baseline >= self.latency_window:
+            self._baseline_p95_latency += (p95_latency - self._baseline_p95_latency) * self.baseline_aging
+            self._latencies_since_baseline = 0
+        return p95_latency > self._baseline_p95_latency * self.latency_tolerance
+
+    def __get_p95_latency(self):
+        if not self._latencies:
+            return None
+        latencies = sorted(self._latencies)
+        return latencies[int(0.95 * (len(latencies) - 1))]
+
+    def get_limit(self):
+        """
+        Returns:
+            int: the number of operations which can currently be sent at the same time
+        """
+        return int(self._limit)
+
+    def get_statistics(self):
+        """
+        Returns:
+            dict: the current ``limit``, the number of operations ``in_flight``, the 95th percentile of the
+            recent latencies in seconds (``p95_latency``, None if unknown) and the number of ``decreases``
+            of the limit
+        """
+        with self._condition:
+            return {
+                'limit': int(self._limit),
+                'in_flight': self._in_flight,
+                'p95_latency': self.__get_p95_latency(),
+                'decreases': self._decrease_count,
+            }
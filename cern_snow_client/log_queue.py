@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the cern-snow-client library.
+# Copyright (c) 2017 CERN
+# Authors:
+#  - James Clerc <james.clerc@cern.ch> <james.clerc@epitech.eu>
+#  - David Martin Clavo <david.martin.clavo@cern.ch>
+#
+# The cern-snow-client library is free software; you can redistribute it
+# and/or modify it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# The cern-snow-client library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with the cern-snow-client library.  If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+import logging
+import Queue
+import threading
+
+
+class QueueHandler(logging.Handler):
+    """
+    A logging handler which only puts the records in a bounded queue, without blocking: the records are
+    written by a QueueListener in a background thread. When the queue is full, the records are dropped
+    and counted.
+    Equivalent to ``logging.handlers.QueueHandler`` of Python 3, which is not available in Python 2.
+
+    Args:
+        queue (Queue.Queue): the queue, shared with a QueueListener
+
+    Examples:
+        >>> queue = Queue.Queue(10000)
+        >>> logger.addHandler(QueueHandler(queue))
+        >>> listener = QueueListener(queue, RotatingFileHandler('log.txt', maxBytes=1000000, backupCount=9))
+        >>> listener.start()
+    """
+
+    def __init__(self, queue):
+        logging.Handler.__init__(self)
+        self.queue = queue
+        self._dropped_count = 0
+
+    def prepare(self, record):
+        """
+        Merges the arguments and the exception information into the message, so that the record does not refer
+        to objects which might change before it is written.
+
+        Args:
+            record (logging.LogRecord): the record to put in the queue
+
+        Returns:
+            logging.LogRecord : the record to put in the queue
+        """
+        record.msg = self.format(record)
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def emit(self, record):
+        try:
+            self.queue.put_nowait(self.prepare(record))
+        except Queue.Full:
+            with self.lock:
+                self._dropped_count += 1
+        except Exception:
+            self.handleError(record)
+
+    def get_dropped_count(self):
+        """
+        Returns:
+            int: the number of records dropped because the queue was full
+        """
+        return self._dropped_count
+
+
+class QueueListener(object):
+    """
+    Writes the records put in a queue by a QueueHandler with some handlers, such as a RotatingFileHandler,
+    in a background thread.
+    Equivalent to ``logging.handlers.QueueListener`` of Python 3, which is not available in Python 2.
+
+    Args:
+        queue (Queue.Queue): the queue, shared with a QueueHandler
+        *handlers (logging.Handler): the handlers writing the records
+    """
+
+    # put in the queue to stop the background thread
+    _sentinel = None
+
+    def __init__(self, queue, *handlers):
+        self.queue = queue
+        self.handlers = handlers
+        self._thread = None
+
+    def start(self):
+        """
+        Starts the background thread.
+        """
+        self._thread = threading.Thread(target=self.__monitor, name='snow-client-log-listener')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Writes the records still in the queue and stops the background thread.
+        """
+        if self._thread is None:
+            return
+        self.queue.put(self._sentinel)
+        self._thread.join()
+        self._thread = None
+
+    def flush(self):
+        """
+        Waits until the records in the queue are written.
+        """
+        if self._thread is not None:
+            self.queue.join()
+
+    def handle(self, record):
+        """
+        Writes a record with each handler whose level allows it.
+
+        Args:
+            record (logging.LogRecord): the record
+        """
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def __monitor(self):
+        while True:
+            record = self.queue.get()
+            try:
+                if record is self._sentinel:
+                    break
+                self.handle(record)
+            finally:
+                self.queue.task_done()
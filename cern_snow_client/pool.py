@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the cern-snow-client library.
+# Copyright (c) 2017 CERN
+# Authors:
+#  - James Clerc <james.clerc@cern.ch> <james.clerc@epitech.eu>
+#  - David Martin Clavo <david.martin.clavo@cern.ch>
+#
+# The cern-snow-client library is free software; you can redistribute it
+# and/or modify it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# The cern-snow-client library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with the cern-snow-client library.  If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+import Queue
+import threading
+import traceback
+
+from common import SnowClientException
+
+
+class SnowFuture(object):
+    """
+    The result of an operation which is executed in the background by a WorkerPool.
+
+    Examples:
+        >>> future = pool.submit(r.get, 'c1c535ba85f45540adf94de5b835cd43')  # pool is a WorkerPool
+        >>> found = future.result()  # waits until the operation is finished
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._done = False
+        self._running = False
+        self._cancelled = False
+        self._result = None
+        self._exception = None
+        self._traceback = None
+        self._callbacks = []
+
+    def done(self):
+        """
+        Returns:
+            bool: True if the operation has finished, successfully or not
+        """
+        return self._done
+
+    def cancelled(self):
+        """
+        Returns:
+            bool: True if the operation was cancelled before it started
+        """
+        return self._cancelled
+
+    def cancel(self):
+        """
+        Cancels the operation, if it has not started yet.
+
+        Returns:
+            bool: True if the operation was cancelled, False if it is already running or finished
+        """
+        with self._condition:
+            if self._running or self._done:
+                return False
+            self._cancelled = True
+            self._exception = SnowClientException("SnowFuture.cancel: the operation was cancelled")
+            callbacks = self.__finish()
+        self.__run_callbacks(callbacks)
+        return True
+
+    def result(self, timeout=None):
+        """
+        Waits until the operation has finished and returns its result.
+
+        Args:
+            timeout (:obj:`float`, optional): the maximum number of seconds to wait. By default, waits forever.
+
+        Returns:
+            object: the value returned by the operation
+
+        Raises:
+            SnowClientException: if the operation has not finished after ``timeout`` seconds
+            Exception: the exception raised by the operation, if any
+        """
+        self.__wait(timeout)
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self, timeout=None):
+        """
+        Waits until the operation has finished and returns the exception it raised.
+
+        Args:
+            timeout (:obj:`float`, optional): the maximum number of seconds to wait. By default, waits forever.
+
+        Returns:
+            Exception: the exception raised by the operation, or None if it finished successfully
+        """
+        self.__wait(timeout)
+        return self._exception
+
+    def get_traceback(self):
+        """
+        Returns:
+            str: the formatted traceback of the exception raised by the operation, if any
+        """
+        return self._traceback
+
+    def add_done_callback(self, callback):
+        """
+        Args:
+            callback (function): a function which will be called with this SnowFuture as argument when the operation
+                finishes, from the thread which executed it. If the operation has already finished, it is called
+                immediately.
+        """
+        with self._condition:
+            if not self._done:
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def _start(self):
+        """
+        Returns:
+            bool: False if the operation was cancelled and should not be executed
+        """
+        with self._condition:
+            if self._cancelled:
+                return False
+            self._running = True
+            return True
+
+    def _set_result(self, result):
+        with self._condition:
+            self._result = result
+            callbacks = self.__finish()
+        self.__run_callbacks(callbacks)
+
+    def _set_exception(self, exception, formatted_traceback=None):
+        with self._condition:
+            self._exception = exception
+            self._traceback = formatted_traceback
+            callbacks = self.__finish()
+        self.__run_callbacks(callbacks)
+
+    def __finish(self):
+        self._done = True
+        self._condition.notifyAll()
+        callbacks, self._callbacks = self._callbacks, []
+        return callbacks
+
+    def __run_callbacks(self, callbacks):
+        for callback in callbacks:
+            callback(self)
+
+    def __wait(self, timeout):
+        with self._condition:
+            if not self._done:
+                self._condition.wait(timeout)
+            if not self._done:
+                raise SnowClientException("SnowFuture.result: the operation did not finish after %s seconds" % timeout)
+
+
+class WorkerPool(object):
+    """
+    A fixed number of threads which execute the functions submitted to them, in order of submission.
+    Threads are started when needed, up to ``max_workers``.
+
+    Args:
+        max_workers (int): the maximum number of functions executed at the same time
+
+    Examples:
+        >>> with WorkerPool(8) as pool:
+        >>>     futures = [pool.submit(Incident(s).resolve, 'Solved', key=key) for key in keys]
+        >>>     results = [future.result() for future in futures]
+    """
+
+    def __init__(self, max_workers):
+        if not max_workers or max_workers < 1:
+            raise SnowClientException("WorkerPool.__init__: max_workers should be a positive integer")
+
+        self._max_workers = max_workers
+        self._queue = Queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Schedules the execution of ``function(*args, **kwargs)``.
+
+        Returns:
+            SnowFuture: the future result of the function
+
+        Raises:
+            SnowClientException: if the pool has been shut down
+        """
+        with self._lock:
+            if self._shutdown:
+                raise SnowClientException("WorkerPool.submit: the pool has been shut down")
+
+            future = SnowFuture()
+            self._queue.put((future, function, args, kwargs))
+            if len(self._threads) < self._max_workers:
+                thread = threading.Thread(target=self.__work, name='snow-client-worker-%d' % len(self._threads))
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+            return future
+
+    def shutdown(self, wait=True):
+        """
+        Stops the threads once the functions already submitted have been executed.
+
+        Args:
+            wait (:obj:`bool`, optional): if True (default), waits until all the threads have stopped
+        """
+        with self._lock:
+            if self._shutdown:
+                return
+            self._shutdown = True
+            for i in range(len(self._threads)):
+                self._queue.put(None)
+
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def get_max_workers(self):
+        """
+        Returns:
+            int: the maximum number of functions executed at the same time
+        """
+        return self._max_workers
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.shutdown(wait=True)
+        return False
+
+    def __work(self):
+        while True:
+            work_item = self._queue.get()
+            if work_item is None:
+                return
+
+            future, function, args, kwargs = work_item
+            if not future._start():
+                continue
+
+            try:
+                result = function(*args, **kwargs)
+            except Exception as e:
+                future._set_exception(e, traceback.format_exc())
+            else:
+                future._set_result(result)
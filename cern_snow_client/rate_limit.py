@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the cern-snow-client library.
+# Copyright (c) 2017 CERN
+# Authors:
+#  - James Clerc <james.clerc@cern.ch> <james.clerc@epitech.eu>
+#  - David Martin Clavo <david.martin.clavo@cern.ch>
+#
+# The cern-snow-client library is free software; you can redistribute it
+# and/or modify it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# The cern-snow-client library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with the cern-snow-client library.  If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+import os
+import re
+import threading
+import time
+
+from common import SnowClientException
+
+
+class TokenBucket(object):
+    """
+    A token bucket, refilled with ``rate`` tokens per second up to ``capacity`` tokens, shared by the threads
+    of a process. Taking a token when the bucket is empty reserves it: the caller waits until it is refilled,
+    so that the callers are served in order.
+
+    Args:
+        rate (float): the number of tokens added per second, i.e. the sustained number of operations per second
+        capacity (:obj:`float`, optional): the maximum number of tokens, i.e. the size of a burst of operations.
+            By default, one second of tokens (at least 1).
+
+    Raises:
+        SnowClientException : if any of the parameters is set incorrectly
+    """
+
+    def __init__(self, rate, capacity=None):
+        if not rate or rate <= 0:
+            raise SnowClientException('TokenBucket.__init__: rate should be a positive number')
+        if capacity is None:
+            capacity = max(1.0, float(rate))
+        if capacity <= 0:
+            raise SnowClientException('TokenBucket.__init__: capacity should be a positive number')
+
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._lock = threading.Lock()
+        self._tokens = self.capacity
+        self._updated_at = time.time()
+
+    def acquire(self, tokens=1):
+        """
+        Takes tokens from the bucket, waiting until they are available.
+
+        Args:
+            tokens (:obj:`float`, optional): the number of tokens to take
+
+        Returns:
+            float: the number of seconds waited
+        """
+        with self._lock:
+            self._tokens, self._updated_at, delay = self._reserve(self._tokens, self._updated_at, tokens)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def _reserve(self, available_tokens, updated_at, tokens):
+        """
+        Refills the bucket and takes tokens from it, possibly in advance.
+
+        Args:
+            available_tokens (float): the number of tokens in the bucket, negative if some were taken in advance
+            updated_at (float): the time when ``available_tokens`` was computed
+            tokens (float): the number of tokens to take
+
+        Returns:
+            tuple: (number of tokens left, current time, number of seconds to wait until the tokens are available)
+        """
+        now = time.time()
+        available_tokens = min(self.capacity, available_tokens + max(0.0, now - updated_at) * self.rate)
+        available_tokens -= tokens
+        delay = 0.0
+        if available_tokens < 0:
+            delay = -available_tokens / self.rate
+        return available_tokens, now, delay
+
+
+class FileTokenBucket(TokenBucket):
+    """
+    A TokenBucket whose state is kept in a file, locked with ``fcntl.flock`` while it is updated, so that
+    several processes of the same host can share it. Only available on Unix systems.
+
+    Args:
+        file_path (str): the path of the file, created if needed
+        rate (float): see TokenBucket
+        capacity (:obj:`float`, optional): see TokenBucket
+
+    Raises:
+        SnowClientException : if any of the parameters is set incorrectly, or fcntl is not available
+    """
+
+    def __init__(self, file_path, rate, capacity=None):
+        super(FileTokenBucket, self).__init__(rate, capacity)
+        try:
+            import fcntl
+        except ImportError:
+            raise SnowClientException('FileTokenBucket.__init__: file locks need the fcntl module, which is only '
+                                      'available on Unix systems')
+        self._fcntl = fcntl
+        self.file_path = file_path
+
+    def acquire(self, tokens=1):
+        """
+        See ``TokenBucket.acquire``
+        """
+        with self._lock:
+            fd = os.open(self.file_path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                self._fcntl.flock(fd, self._fcntl.LOCK_EX)
+                try:
+                    state = os.read(fd, 100).split()
+                    if len(state) == 2:
+                        available_tokens, updated_at = float(state[0]), float(state[1])
+                    else:
+                        available_tokens, updated_at = self.capacity, time.time()
+                    available_tokens, updated_at, delay = self._reserve(available_tokens, updated_at, tokens)
+
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    os.ftruncate(fd, 0)
+                    os.write(fd, '%r %r' % (available_tokens, updated_at))
+                finally:
+                    self._fcntl.flock(fd, self._fcntl.LOCK_UN)
+            finally:
+                os.close(fd)
+
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+
+class RateLimiter(object):
+    """
+    Limits the rate of the REST operations sent to ServiceNow, to stay under the rate limits of the instances
+    instead of being throttled. It can be shared by several SnowRestSession objects (see
+    ``SnowRestSession.set_rate_limiter``), and, with ``lock_directory``, by several processes of the same host.
+
+    Each instance has a budget of ``rate`` operations per second, and the operations on some tables can have
+    their own, lower budgets in ``table_rates``, e.g. to keep capacity for other tables.
+
+    Args:
+        rate (:obj:`float`, optional): the maximum number of operations per second to each instance.
+            If None, only the tables in ``table_rates`` are limited.
+        burst (:obj:`float`, optional): the number of operations which can be sent at once after a pause.
+            By default, one second of operations.
+        table_rates (:obj:`dict`, optional): the maximum number of operations per second on some tables, such as
+            ``{'incident': 5}``
+        lock_directory (:obj:`str`, optional): a directory where the state of the budgets is kept in files, to be
+            shared by all the processes using the same directory. By default, the budgets are kept in memory.
+
+    Raises:
+        SnowClientException : if any of the parameters is set incorrectly
+
+    Examples:
+        >>> limiter = RateLimiter(rate=20, table_rates={'incident': 5}, lock_directory='/var/tmp/snow-rate-limit')
+        >>> s1.set_rate_limiter(limiter)  # s1 and s2 are SnowRestSession objects
+        >>> s2.set_rate_limiter(limiter)
+    """
+
+    table_in_url_pattern = re.compile('/api/now/(?:v\d+/)?table/([^/?]+)')
+
+    def __init__(self, rate=None, burst=None, table_rates=None, lock_directory=None):
+        if rate is None and not table_rates:
+            raise SnowClientException('RateLimiter.__init__: a rate or table_rates is needed')
+        if lock_directory and not os.path.isdir(lock_directory):
+            os.makedirs(lock_directory)
+
+        self.rate = rate
+        self.burst = burst
+        self.table_rates = dict(table_rates or {})
+        self.lock_directory = lock_directory
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def acquire(self, instance, url):
+        """
+        Waits until an operation can be sent, according to the budgets of the instance and of the table.
+
+        Args:
+            instance (str): the instance, e.g. ``'https://cerntest.service-now.com'``
+            url (str): the URL of the operation
+
+        Returns:
+            float: the number of seconds waited
+        """
+        delay = 0.0
+        match = self.table_in_url_pattern.search(url)
+        if match and match.group(1) in self.table_rates:
+            table_name = match.group(1)
+            delay += self.__get_bucket(instance, table_name, self.table_rates[table_name]).acquire()
+        if self.rate is not None:
+            delay += self.__get_bucket(instance, None, self.rate).acquire()
+        return delay
+
+    def __get_bucket(self, instance, table_name, rate):
+        key = (instance, table_name)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                burst = self.burst if table_name is None else None
+                if self.lock_directory:
+                    file_name = re.sub('[^\\w.-]', '_', instance.replace('https://', ''))
+                    if table_name:
+                        file_name += '.' + table_name
+                    bucket = FileTokenBucket(os.path.join(self.lock_directory, file_name + '.bucket'), rate, burst)
+                else:
+                    bucket = TokenBucket(rate, burst)
+                self._buckets[key] = bucket
+            return bucket
@@ -21,10 +21,15 @@
 # as an Intergovernmental Organization or submit itself to any jurisdiction.
 
 from common import SnowClientException, TableClassMapping
+from pool import WorkerPool
+from streaming import ResultStreamParser
 
 import abc
+import base64
+import collections
 import inspect
 import json
+import logging
 import re
 
 
@@ -34,20 +39,23 @@ class SessionAware(object):
     def __init__(self, session):
         self._session = session
 
-    def _debug(self, message):
-        self._session._debug(message)
+    def _debug(self, message, *args):
+        self._session._debug(message, *args)
 
-    def _info(self, message):
-        self._session._info(message)
+    def _info(self, message, *args):
+        self._session._info(message, *args)
 
-    def _warning(self, message):
-        self._session._warning(message)
+    def _warning(self, message, *args):
+        self._session._warning(message, *args)
 
-    def _error(self, message):
-        self._session._error(message)
+    def _error(self, message, *args):
+        self._session._error(message, *args)
 
-    def _critical(self, message):
-        self._session._critical(message)
+    def _critical(self, message, *args):
+        self._session._critical(message, *args)
+
+    def _is_debug_enabled(self):
+        return self._session._is_log_enabled_for(logging.DEBUG)
 
 
 class Record(SessionAware):
@@ -82,6 +90,10 @@ class Record(SessionAware):
         >>> r = Record(s, 'u_request_fulfillment', values)  # record is created and ready for insert
     """
 
+    __protected_names_by_class = {}
+    # the fields compared to decide whether a cached record changed (see SnowRestSession.set_record_cache)
+    revalidation_fields = ('sys_mod_count', 'sys_updated_on')
+
     def __init__(self, session, table_name=None, values=None):
 
         if not session:
@@ -128,22 +140,64 @@ class Record(SessionAware):
         if initialized and not key.startswith('_'):
             self._changes[key] = value
 
+        raw_values = self.__dict__.get('_raw_values')
+        if raw_values:
+            raw_values.pop(key, None)
+
         object.__setattr__(self, key, value)
 
+    def __getattr__(self, key):
+        # only called when the attribute is not found: the field may not have been materialized yet
+        raw_values = self.__dict__.get('_raw_values')
+        if raw_values is None or key not in raw_values:
+            raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, key))
+
+        try:
+            value = RecordField(raw_values[key])
+        except KeyError:
+            # materialized in the meantime by another thread
+            return self.__dict__[key]
+        object.__setattr__(self, key, value)
+        raw_values.pop(key, None)
+        return value
+
+    def __dir__(self):
+        names = set(dir(type(self)))
+        names.update(self.__dict__)
+        names.update(self.__dict__.get('_raw_values') or [])
+        return sorted(names)
+
     def _set_values(self, values):
+        """
+        Sets the values of the fields of the record, as returned by ServiceNow.
+        Except for ``sys_id`` and ``sys_class_name``, the RecordField objects are only built when the fields
+        are accessed for the first time.
+
+        Args:
+            values (dict): the raw values of the fields, as returned by ServiceNow
+        """
+        raw_values = self.__dict__.get('_raw_values')
+        if raw_values is None:
+            raw_values = {}
+            object.__setattr__(self, '_raw_values', raw_values)
+        protected_names = self._get_protected_names()
+
         for key in values:
             # protect private attributes
             if key.startswith('_'):
                 continue
             # protect methods
-            elif key in dir(self) and inspect.ismethod(self.__getattribute__(key)):
+            elif key in protected_names:
                 continue
 
-            value = RecordField(values[key])
-
-            object.__setattr__(self, key, value)
+            if key == 'sys_id' or key == 'sys_class_name':
+                object.__setattr__(self, key, RecordField(values[key]))
+            else:
+                # replace the value of the field, if it was already materialized
+                self.__dict__.pop(key, None)
+                raw_values[key] = values[key]
 
-    def get(self, key):
+    def get(self, key, fields=None, display_value='all', exclude_reference_link=False):
         """
         Fetches from ServiceNow a record from the table specified in the constructor via the argument ``table_name``.
         The record may be fetched by its ``sys_id`` (ServiceNow unique identifier), or with a (field_name, field_value)
@@ -154,6 +208,18 @@ class Record(SessionAware):
         Args:
             key (:obj:`str`, :obj:`unicode` or :obj:`tuple`): a str/unicode value with the sys_id (ServiceNow unique identifier)
                 of the record to fetch; or a tuple (field_name, field_value), such as ('number', 'INC987654')
+            fields (:obj:`list`, optional): the names of the fields to fetch. By default, all the fields are fetched.
+                ``sys_id`` and ``sys_class_name`` are always fetched.
+            display_value (:obj:`str`, optional): ``'all'`` (default) to fetch both the value and the display value
+                of each field, ``'false'`` to fetch only the values, or ``'true'`` to fetch only the display values,
+                except for ``sys_id`` and ``sys_class_name`` (see ``Record._keep_display_values``)
+            exclude_reference_link (:obj:`bool`, optional): if True, the links of the reference fields are not
+                fetched. ``is_reference()`` and ``get_referenced_table()`` of the fields are then not available.
+
+        If the record cache of the session is enabled (see ``SnowRestSession.set_record_cache``), the record
+        is taken from it when possible, unless ``display_value`` or ``exclude_reference_link`` are set.
+        With revalidation, only ``sys_mod_count`` and ``sys_updated_on`` are fetched first, and the whole record
+        only if they changed.
 
         Returns:
             bool: True if a record was fetched succesfully, False if the record did not exist
@@ -192,8 +258,15 @@ class Record(SessionAware):
             >>> r = Record(s, 'u_request_fulfillment')  # s is a SnowRestSession object
             >>> if r.get(('number', 'RQF0746626')):
             >>>     print r.short_description
+
+            Getting only the values of a few fields of an incident:
+
+            >>> r = Record(s, 'incident')  # s is a SnowRestSession object
+            >>> if r.get(('number', 'INC0426232'), fields=['short_description', 'incident_state'],
+            >>>          display_value='false', exclude_reference_link=True):
+            >>>     print r.incident_state  # 7
         """
-        self._info("Record.get: Obtaining a record in table " + repr(self._table_name) + ' with key = ' + repr(key))
+        self._info('Record.get: Obtaining a record in table %r with key = %r', self._table_name, key)
 
         is_key_text = isinstance(key, str) or isinstance(key, unicode)
         is_key_tuple = isinstance(key, tuple) and len(key) == 2 and isinstance(key[0], str)
@@ -201,34 +274,111 @@ class Record(SessionAware):
         if not key or (not is_key_text and not is_key_tuple):
             raise SnowClientException("Record.get: the \"key\" parameter should be a non empty str/unicode value, "
                                       "or a tuple (field_name, field_value) where field_name is a str")
+
+        # the record cache only holds complete rows, with the values, display values and links
+        cache = self._session.get_record_cache()
+        if display_value != 'all' or exclude_reference_link:
+            cache = None
+        if cache is not None:
+            row = self.__get_cached_row(cache, key)
+            if row is not None and self._session.record_cache_revalidate:
+                row = self.__revalidate_cached_row(cache, row)
+            if row is not None:
+                if fields:
+                    required_fields = list(fields) + ['sys_id', 'sys_class_name']
+                    row = dict([(field, row[field]) for field in required_fields if field in row])
+                self._set_values(row)
+                return True
+
         url = '/api/now/v2/table/' + self._table_name
         if is_key_text:
             url = url + '/' + key
         elif is_key_tuple:
             url = url + '?sysparm_query=' + key[0] + '=' + key[1]
         
+        params = self._build_params(fields, display_value, exclude_reference_link)
+
         #  build the URL
-        result = self._session.get(url=url, params={'sysparm_display_value': 'all'})
+        result = self._session.get(url=url, params=params)
         #  execute a get
         result = json.loads(result.text)
         #  parse the JSON result
         if is_key_text:
-            if 'result' not in result:
-                return False
-            result = result['result']
+            result = result.get('result')
         elif is_key_tuple:
-            if 'result' not in result:
-                return False
-            result = result['result']
-            if len(result) > 0:
+            result = result.get('result')
+            if result:
                 result = result[0]
-            else:
-                return False
+        if not result:
+            # the record does not exist (anymore): the caches should not find it either
+            self._forget_key(key)
+            return False
+        if display_value == 'true':
+            result = self._keep_display_values(result)
         #  set the values inside the current object : _set_values()
         self._set_values(result)
+        self.__remember_key(key)
+        if cache is not None and not fields:
+            cache.set((self._table_name, self.sys_id.get_value()), dict(result))
         #  return True or False
         return True
 
+    def _resolve_key(self, key):
+        """
+        Sets the ``sys_id`` and ``sys_class_name`` of the record designated by ``key``, from the resolution cache
+        of the session (see ``SnowRestSession.set_resolution_cache``) or, if not found there, from ServiceNow.
+
+        Args:
+            key (:obj:`str`, :obj:`unicode` or :obj:`tuple`): see ``get``
+
+        Returns:
+            bool: True if the record was found, False if it does not exist
+        """
+        cache = self._session.get_resolution_cache()
+        if cache is not None:
+            resolution = cache.get(self.__get_key_cache_key(key))
+            if resolution:
+                sys_id, sys_class_name = resolution
+                values = {'sys_id': sys_id}
+                if sys_class_name:
+                    values['sys_class_name'] = sys_class_name
+                self._set_values(values)
+                return True
+
+        # only the sys_id and sys_class_name are needed
+        return self.get(key, fields=['sys_class_name'])
+
+    def __remember_key(self, key):
+        """
+        Stores the ``sys_id`` and ``sys_class_name`` of this record in the resolution cache of the session,
+        both for ``key`` and for its ``sys_id``.
+        """
+        cache = self._session.get_resolution_cache()
+        if cache is None or not self.sys_id:
+            return
+
+        resolution = (self.sys_id.get_value(), self.sys_class_name and self.sys_class_name.get_value())
+        cache.set(self.__get_key_cache_key(self.sys_id.get_value()), resolution)
+        if isinstance(key, tuple):
+            cache.set(self.__get_key_cache_key(key), resolution)
+
+    def _forget_key(self, key):
+        """
+        Removes the record designated by ``key`` from the resolution cache and, for a ``sys_id``, from the record
+        cache of the session.
+        """
+        resolution_cache = self._session.get_resolution_cache()
+        if resolution_cache is not None:
+            resolution_cache.invalidate(self.__get_key_cache_key(key))
+        record_cache = self._session.get_record_cache()
+        if record_cache is not None and not isinstance(key, tuple):
+            record_cache.invalidate((self._table_name, unicode(key)))
+
+    def __get_key_cache_key(self, key):
+        if isinstance(key, tuple):
+            return self._table_name, key[0], unicode(key[1])
+        return self._table_name, 'sys_id', unicode(key)
+
     def insert(self):
         """
         Inserts in ServiceNow a record into the table specified in the constructor via the argument ``table_name``.
@@ -267,26 +417,15 @@ class Record(SessionAware):
             >>> r.insert()
         """
 
-        if not self._can_insert:
-            class_name = type(self).__name__
-            raise SnowClientException('Record.insert: The current Record is of class ' + class_name + ', '
-                                      'which cannot be inserted. '
-                                      'You need to instantiate a subclass of ' + class_name + '.')
         #  build the URL
-        url = '/api/now/v2/table/' + self._table_name
+        url = self._get_insert_url()
         #  execute a post using the changed data : get_changed_fields()
         data = json.dumps(self._changes)
         result = self._session.post(url=url, data=data, params={'sysparm_display_value': 'all'})
         #  parse the JSON result
         result = json.loads(result.text)
-        self.reset_changed_values()
-        if 'result' not in result:
-            return False
-        #  reset the changed data : reset_changed_values()
-        #  set the values inside the current object: _set_values()
-        self._set_values(result['result'])
-        #  return True or False
-        return True
+        #  reset the changed data and set the values inside the current object
+        return self._set_result(result)
 
     def update(self, key=None):
         """
@@ -331,6 +470,58 @@ class Record(SessionAware):
             >>>                            # by ServiceNow
         """
 
+        # build the URL (using self.sys_class_name as table)
+        url = self._get_update_url(key)
+        if not url:
+            return False
+
+        #  execute a put using the changed data : get_changed_fields()
+        changed_fields = list(self._changes)
+        data = json.dumps(self._changes)
+        result = self._session.put(url=url, data=data, params={'sysparm_display_value': 'all'})
+        #  parse the JSON result
+        result = json.loads(result.text)
+        #  reset the changed data and set the values inside the current object
+        updated = self._set_result(result)
+
+        if not updated:
+            # the record was not found: its sys_id, or the key, might be cached with a record deleted since
+            self._forget_key(url.rsplit('/', 1)[1])
+            if key:
+                self._forget_key(key)
+        elif isinstance(key, tuple) and key[0] in changed_fields:
+            # the key does not designate this record anymore
+            self._forget_key(key)
+        return updated
+
+    def _get_insert_url(self):
+        """
+        Returns:
+            str: the relative URL where to POST the record to insert it
+
+        Raises:
+            SnowClientException: if the current record is of a table where records cannot be inserted
+        """
+        if not self._can_insert:
+            class_name = type(self).__name__
+            raise SnowClientException('Record.insert: The current Record is of class ' + class_name + ', '
+                                      'which cannot be inserted. '
+                                      'You need to instantiate a subclass of ' + class_name + '.')
+        return '/api/now/v2/table/' + self._table_name
+
+    def _get_update_url(self, key=None):
+        """
+        Finds the record to update, fetching its ``sys_id`` and ``sys_class_name`` from ServiceNow if needed.
+
+        Args:
+            key (:obj:`str`, :obj:`unicode` or :obj:`tuple`, optional): see ``update``
+
+        Returns:
+            str: the relative URL where to PUT the changes of the record, or None if the record does not exist
+
+        Raises:
+            SnowClientException: if no key is provided and the current record has no ``sys_id``
+        """
         is_key_text = isinstance(key, str) or isinstance(key, unicode)
         is_key_tuple = isinstance(key, tuple) and len(key) == 2 and isinstance(key[0], str)
 
@@ -343,47 +534,199 @@ class Record(SessionAware):
                                       "or a tuple (field_name, field_value) where field_name is a str")
 
         if is_key_tuple:
-            if self.get(key):
+            if self._resolve_key(key):
                 sys_id = self.sys_id
             else:
-                return False
+                return None
         else:
             if is_key_text:
                 sys_id = key
             else:
                 sys_id = self.sys_id
 
-            if not self.sys_class_name:
+            if not self.sys_class_name and not self._session.update_via_base_table:
                 table_class_mapping = TableClassMapping.get()
                 if (
                         self._table_name in table_class_mapping and
                         'is_base_table' in table_class_mapping[self._table_name] and
                         table_class_mapping[self._table_name]['is_base_table']
                 ):
-                    self.get(sys_id)
+                    self._resolve_key(sys_id)
 
-        # build the URL (using self.sys_class_name as table)
         if self.sys_class_name:
             url = '/api/now/v2/table/' + self.sys_class_name + '/'
         else:
             url = '/api/now/v2/table/' + self._table_name + '/'
 
-        url = url + sys_id
+        return url + sys_id
 
-        #  execute a put using the changed data : get_changed_fields()
-        data = json.dumps(self._changes)
-        result = self._session.put(url=url, data=data, params={'sysparm_display_value': 'all'})
-        #  parse the JSON result
-        result = json.loads(result.text)
-        #  reset the changed data : reset_changed_values()
+    def _set_result(self, result):
+        """
+        Resets the changed fields, and sets the values returned by ServiceNow after an insert or an update.
+
+        Args:
+            result (dict): the parsed JSON body of the response
+
+        Returns:
+            bool: True if the response contains a record, False otherwise
+        """
+        # the table where the record was sent, i.e. the one whose fields are returned
+        table_name = self.sys_class_name or self._table_name
         self.reset_changed_values()
         if 'result' not in result:
             return False
-        #  set the values inside the current object: __set_values()
         self._set_values(result['result'])
-        #  return True or False
+        self.__remember_key(self.sys_id)
+        self.__refresh_cached_row(table_name, result['result'])
         return True
 
+    def __get_cached_row(self, cache, key):
+        """
+        Returns:
+            dict: the row of the record designated by ``key`` in the record cache of the session, or None
+        """
+        if isinstance(key, tuple):
+            resolution_cache = self._session.get_resolution_cache()
+            resolution = resolution_cache and resolution_cache.get(self.__get_key_cache_key(key))
+            if not resolution:
+                return None
+            key = resolution[0]
+        return cache.get((self._table_name, unicode(key)))
+
+    def __revalidate_cached_row(self, cache, row):
+        """
+        Checks with a request fetching only ``sys_mod_count`` and ``sys_updated_on`` whether a cached row
+        is still up to date.
+
+        Returns:
+            dict: the cached row if the record did not change, or None if it changed (the row is then removed
+            from the cache)
+        """
+        sys_id = self.__get_raw_value(row.get('sys_id'))
+        cache_key = (self._table_name, sys_id)
+        url = '/api/now/v2/table/' + self._table_name + '/' + sys_id
+        params = {'sysparm_fields': ','.join(self.revalidation_fields), 'sysparm_display_value': 'false'}
+
+        result = json.loads(self._session.get(url=url, params=params).text)
+        current = result.get('result') or {}
+        for field in self.revalidation_fields:
+            if field not in row or self.__get_raw_value(row[field]) != current.get(field):
+                self._info('Record.get: the record %r of table %r changed since it was cached', sys_id,
+                           self._table_name)
+                cache.invalidate(cache_key)
+                return None
+
+        # still up to date: it can be kept for another time to live
+        cache.set(cache_key, row)
+        return row
+
+    @staticmethod
+    def __get_raw_value(raw_value):
+        """
+        Returns:
+            unicode: the value of a field as returned by ServiceNow, which is a dict if display values were fetched
+        """
+        if isinstance(raw_value, dict):
+            return raw_value.get('value')
+        return raw_value
+
+    def __refresh_cached_row(self, table_name, row):
+        """
+        Stores the row returned by an insert or an update in the record cache of the session, for the table
+        where the record was sent, and removes the rows of the same record cached for other tables.
+        """
+        cache = self._session.get_record_cache()
+        if cache is None or not self.sys_id:
+            return
+
+        sys_id = self.sys_id.get_value()
+        cache.set((table_name, sys_id), dict(row))
+        for other_table_name in (self._table_name, self.sys_class_name):
+            if other_table_name and other_table_name != table_name:
+                cache.invalidate((unicode(other_table_name), sys_id))
+
+    @classmethod
+    def _get_protected_names(cls):
+        """
+        Returns:
+            frozenset: the names of the public methods of the class, which cannot be overwritten by
+            the fields of a record. Computed once per class.
+        """
+        protected_names = cls.__protected_names_by_class.get(cls)
+        if protected_names is None:
+            protected_names = frozenset([name for name in dir(cls)
+                                         if not name.startswith('_') and inspect.ismethod(getattr(cls, name))])
+            cls.__protected_names_by_class[cls] = protected_names
+        return protected_names
+
+    @classmethod
+    def _build_params(cls, fields=None, display_value='all', exclude_reference_link=False, required_fields=None):
+        """
+        Builds the URL parameters of a GET operation which select the returned fields and their format.
+
+        Args:
+            fields (list, optional): the names of the fields to fetch. If not set, all the fields are fetched.
+                ``sys_id``, ``sys_class_name`` and the ``required_fields`` are always fetched.
+            display_value (str): ``'all'``, ``'true'`` or ``'false'``. For ``'true'``, both the values and the
+                display values are fetched, and the rows need to go through ``_keep_display_values``
+            exclude_reference_link (bool): if True, the links of the reference fields are not fetched
+            required_fields (list, optional): other fields to fetch when ``fields`` is set
+
+        Returns:
+            dict: the URL parameters
+
+        Raises:
+            SnowClientException : if any of the parameters is set incorrectly
+        """
+        if display_value not in ('all', 'true', 'false'):
+            raise SnowClientException("Record: the \"display_value\" parameter should be 'all', 'true' or 'false'")
+
+        # the display value of sys_class_name is the label of the table: its value is needed to update the record
+        if display_value == 'true':
+            params = {'sysparm_display_value': 'all'}
+        else:
+            params = {'sysparm_display_value': display_value}
+
+        if fields:
+            if isinstance(fields, str) or isinstance(fields, unicode):
+                fields = fields.split(',')
+            field_name_array = list(fields)
+            for field_name in ['sys_id', 'sys_class_name'] + list(required_fields or []):
+                if field_name not in field_name_array:
+                    field_name_array.append(field_name)
+            params['sysparm_fields'] = ','.join(field_name_array)
+
+        if exclude_reference_link:
+            params['sysparm_exclude_reference_link'] = 'true'
+
+        return params
+
+    @classmethod
+    def _keep_display_values(cls, row):
+        """
+        Converts a row fetched with ``sysparm_display_value=all`` to the row ServiceNow returns with
+        ``sysparm_display_value=true``, except for ``sys_id`` and ``sys_class_name``, which keep their values:
+        the display value of ``sys_class_name`` is the label of the table, e.g. ``Incident``, which cannot be used
+        to update or resolve the record.
+
+        Args:
+            row (dict): the raw values of a record, with both values and display values
+
+        Returns:
+            dict: the raw values of the record, with display values
+        """
+        display_row = {}
+        for field_name, raw_value in row.items():
+            if isinstance(raw_value, dict) and 'display_value' in raw_value:
+                if field_name in ('sys_id', 'sys_class_name'):
+                    raw_value = raw_value.get('value')
+                elif 'link' in raw_value:
+                    raw_value = {'display_value': raw_value['display_value'], 'link': raw_value['link']}
+                else:
+                    raw_value = raw_value['display_value']
+            display_row[field_name] = raw_value
+        return display_row
+
     def get_changed_fields(self):
         """
         Returns:
@@ -466,6 +809,14 @@ class RecordField(unicode):
 
     table_in_link_pattern = None
 
+    # the display value is only stored if it differs from the value, which is the unicode value itself
+    __slots__ = ('__display_value', '__referenced_table', '__record')
+
+    # short display values and referenced table names are shared between the fields, up to this number of values
+    intern_table_max_size = 10000
+    intern_max_length = 100
+    __intern_table = {}
+
     def __new__(cls, value, encoding='utf-8', errors='strict'):
 
         if isinstance(value, dict):
@@ -491,43 +842,20 @@ class RecordField(unicode):
 
     def __init__(self, value, encoding='utf-8', errors='strict'):
 
-        self.__value = u''
-        self.__display_value = u''
-        self.__is_reference = False
+        self.__display_value = None
         self.__referenced_table = None
+        self.__record = None
 
-        if isinstance(value, unicode):
-            self.__value = value
-            self.__display_value = self.__value
+        if type(value) is dict:
 
-        elif isinstance(value, str):
-            self.__value = unicode(value, encoding, errors)
-            self.__display_value = self.__value
-
-        elif type(value) is dict:
-
-            if 'value' in value:
-                inner_value = value['value']
-                if isinstance(inner_value, unicode):
-                    self.__value = inner_value
-                elif isinstance(inner_value, str):
-                    self.__value = unicode(inner_value, encoding, errors)
-                else:
-                    self.__value = unicode(inner_value)
-
-            if 'display_value' in value:
+            if 'value' in value and 'display_value' in value:
                 display_value = value['display_value']
-                if isinstance(display_value, unicode):
-                    self.__display_value = display_value
-                elif isinstance(display_value, str):
-                    self.__display_value = unicode(display_value, encoding, errors)
-                else:
-                    self.__display_value = unicode(display_value)
-
-            if 'value' in value and 'display_value' not in value:
-                self.__display_value = self.__value
-            elif 'display_value' in value and 'value' not in value:
-                self.__value = self.__display_value
+                if isinstance(display_value, str):
+                    display_value = unicode(display_value, encoding, errors)
+                elif not isinstance(display_value, unicode):
+                    display_value = unicode(display_value)
+                if display_value != self:
+                    self.__display_value = self.__intern(display_value)
 
             if 'link' in value:
                 link = value['link']
@@ -536,16 +864,19 @@ class RecordField(unicode):
                 if match:
                     matched_value = match.group(1)
                     if matched_value:
-                        if isinstance(matched_value, unicode):
-                            self.__is_reference = True
-                            self.__referenced_table = matched_value
-                        elif isinstance(matched_value, str):
-                            self.__is_reference = True
-                            self.__referenced_table = unicode(matched_value, encoding, errors)
+                        if isinstance(matched_value, str):
+                            matched_value = unicode(matched_value, encoding, errors)
+                        self.__referenced_table = self.__intern(matched_value)
 
-        else:
-            self.__value = unicode(value)
-            self.__display_value = self.__value
+    def __getnewargs__(self):
+        return unicode(self),
+
+    def __getstate__(self):
+        return self.__display_value, self.__referenced_table
+
+    def __setstate__(self, state):
+        self.__display_value, self.__referenced_table = state
+        self.__record = None
 
     def get_value(self):
         """
@@ -553,13 +884,15 @@ class RecordField(unicode):
             unicode : The internal value of the field. For choice or reference fields, such as Incident State or
             Functional Element, the internal value might be different from the display value.
         """
-        return self.__value
+        return unicode(self)
 
     def get_display_value(self):
         """
         Returns:
             unicode: The display value of the field, i.e. what a user sees in the ServiceNow web UI.
         """
+        if self.__display_value is None:
+            return unicode(self)
         return self.__display_value
 
     def is_reference(self):
@@ -567,7 +900,7 @@ class RecordField(unicode):
         Returns:
             bool: True if this field is a reference field (reference to another table), False otherwise.
         """
-        return self.__is_reference
+        return self.__referenced_table is not None
 
     def get_referenced_table(self):
         """
@@ -576,6 +909,37 @@ class RecordField(unicode):
         """
         return self.__referenced_table
 
+    def get_record(self):
+        """
+        Returns:
+            Record: If this field is a reference field whose referenced record was fetched with
+            ``RecordSet.prefetch``, that record. None otherwise.
+        """
+        return self.__record
+
+    def _set_record(self, record):
+        """
+        Args:
+            record (Record): the record referenced by this field, fetched with ``RecordSet.prefetch``
+        """
+        self.__record = record
+
+    @classmethod
+    def __intern(cls, value):
+        """
+        Returns:
+            unicode: an equal value already used by another field, if any, so that only one copy is kept
+            in memory. Values longer than ``intern_max_length`` are not shared.
+        """
+        if len(value) > cls.intern_max_length:
+            return value
+        interned_value = cls.__intern_table.get(value)
+        if interned_value is not None:
+            return interned_value
+        if len(cls.__intern_table) < cls.intern_table_max_size:
+            return cls.__intern_table.setdefault(value, value)
+        return value
+
     @classmethod
     def __get_table_in_link_re(cls):
         if not cls.table_in_link_pattern:
@@ -597,6 +961,7 @@ class RecordQuery(SessionAware):
     """
 
     sysparm_fields_in_url_params_pattern = None
+    default_page_size = 1000
 
     def __init__(self, session, table_name=None):
         if not session:
@@ -609,11 +974,22 @@ class RecordQuery(SessionAware):
         super(RecordQuery, self).__init__(session)
         self._table_name = table_name
 
-    def query(self, query_filter=None, query_encoded=None, url_params=None):
+    def query(self, query_filter=None, query_encoded=None, url_params=None, page_size=None, parallel_pages=None,
+              prefetch_pages=None, keyset=None, cursor=None, fields=None, display_value='all',
+              exclude_reference_link=False, stream=False):
         """
         Executes the query.
         At least a `query_filter` or `query_encoded` parameter need to be provided.
 
+        By default, all the records are fetched with a single GET operation. For big result sets, a ``page_size``
+        can be provided: the records are then fetched lazily, page by page, while iterating over the result.
+        With ``parallel_pages``, once the first page has been fetched, the next pages are fetched in parallel,
+        and the records are still returned in order.
+        With ``keyset``, the records are ordered by indexed fields, and each page continues after the last record
+        of the previous one (``field>last_value``) instead of using an offset. Deep scans stay fast, records
+        are neither skipped nor repeated when other records are inserted or deleted during the iteration,
+        and the iteration can be resumed later with a cursor.
+
         Args:
             query_filter (dict): a dictionary with field names and values. Only records where the fields have
                 the corresponding values will be returned
@@ -621,11 +997,48 @@ class RecordQuery(SessionAware):
                 See https://docs.servicenow.com/bundle/helsinki-servicenow-platform/page/use/using-lists/concept/c_EncodedQueryStrings.html
             url_params (str): additional URL parameters, as a string: param1=value1&param2=value2 ...
                 See https://docs.servicenow.com/bundle/geneva-servicenow-platform/page/integrate/inbound_rest/reference/r_TableAPI-GET.html
+            page_size (:obj:`int`, optional): if set, the number of records fetched by each GET operation
+                (``sysparm_limit``). The next page is fetched only when the records of the previous one
+                have been consumed. As the pages are fetched with offsets (``sysparm_offset``), ``ORDERBYsys_id``
+                is added at the end of the encoded query, so that every page uses the same order: the records
+                are ordered by ``sys_id`` unless the encoded query has its own ``ORDERBY``.
+            parallel_pages (:obj:`int`, optional): if set, the maximum number of pages fetched at the same time.
+                If ``page_size`` is not set, pages of ``RecordQuery.default_page_size`` records are used.
+                ServiceNow needs to return the ``X-Total-Count`` header; otherwise, pages are fetched one by one.
+                The offsets of the pages are computed from the total count of the first page, so records
+                inserted during the iteration may be missed. As with ``page_size``, ``ORDERBYsys_id`` is added at
+                the end of the encoded query, so that the pages fetched concurrently use the same order.
+            prefetch_pages (:obj:`int`, optional): with ``parallel_pages``, the maximum number of pages fetched
+                ahead of the page being iterated, which bounds the memory used when the records are consumed
+                more slowly than they are fetched. By default, the value of ``parallel_pages``.
+            keyset (:obj:`str` or :obj:`list`, optional): if set, the field, or list of fields, ordering
+                the records, such as ``'sys_id'`` or ``['sys_updated_on', 'sys_id']``. ``sys_id`` is added
+                as the last field if missing, so that the order is unique. The fields should be indexed.
+                If ``page_size`` is not set, pages of ``RecordQuery.default_page_size`` records are used.
+                Cannot be used with ``parallel_pages``, nor with an encoded query containing ``ORDERBY``
+                or ``^NQ``.
+            cursor (str, optional): a cursor returned by ``LazyRecordSet.get_cursor()`` in a previous
+                keyset query: the iteration starts after the last record returned with that cursor.
+                The keyset fields are taken from the cursor if ``keyset`` is not set.
+            fields (:obj:`list`, optional): the names of the fields to fetch. By default, all the fields
+                are fetched. ``sys_id`` and ``sys_class_name`` are always fetched, as well as the keyset fields.
+                Cannot be used together with ``sysparm_fields`` in ``url_params``.
+            display_value (:obj:`str`, optional): ``'all'`` (default) to fetch both the value and the display value
+                of each field, ``'false'`` to fetch only the values, or ``'true'`` to fetch only the display values,
+                except for ``sys_id`` and ``sys_class_name`` (see ``Record._keep_display_values``)
+            exclude_reference_link (:obj:`bool`, optional): if True, the links of the reference fields are not
+                fetched
+            stream (:obj:`bool`, optional): if True, the records are parsed one by one while the response is being
+                downloaded (see ``cern_snow_client.streaming.ResultStreamParser``), instead of parsing the whole
+                response at once. The memory used does not grow with the size of the response, and the first records
+                are returned before the download finishes. Cannot be used with ``parallel_pages``.
 
         Returns:
             RecordSet : A RecordSet object, which is an iterable, and which will return in each iteration
             an instance of the class corresponding to the ``table_name`` provided in the constructor, if available;
             otherwise, an instance of the Record class.
+            If ``page_size``, ``parallel_pages``, ``keyset``, ``cursor`` or ``stream`` are set, a LazyRecordSet
+            object, which can only be iterated once.
 
         Raises:
             SnowClientException : if neither a query_filter nor a query_encoded parameter is provided.
@@ -645,21 +1058,133 @@ class RecordQuery(SessionAware):
             >>> record_set = r.query(
             >>>     query_encoded="u_functional_element=ea56fb210a0a8c0a015a591ddbed3676^"
             >>>                   "u_visibility=cern^active=false",
-            >>>     url_params="sysparm_fields=number,short_description")
+            >>>     fields=['number', 'short_description'])
             >>>
             >>> for record in record_set:
             >>>     print record.number + " " + record.short_description
             >>>     print record.sys_class_name  # will print 'incident' even if we did not request this field
             >>>     print type(record)  # will print the Incident class
+            >>>
+            >>> # Iterate over all the closed incidents, 1000 at a time
+            >>> for record in r.query(query_encoded="active=false", page_size=1000):
+            >>>     print record.number
+            >>>
+            >>> # Same, fetching up to 4 pages at the same time
+            >>> for record in r.query(query_encoded="active=false", page_size=1000, parallel_pages=4):
+            >>>     print record.number
+            >>>
+            >>> # Export all the closed incidents by last update, and resume from the cursor after a failure
+            >>> record_set = r.query(query_encoded="active=false", keyset=['sys_updated_on', 'sys_id'])
+            >>> try:
+            >>>     for record in record_set:
+            >>>         export(record)
+            >>> finally:
+            >>>     save_cursor(record_set.get_cursor())
+            >>> ...
+            >>> record_set = r.query(query_encoded="active=false", cursor=load_cursor())
         """
 
         if not query_filter and not query_encoded:
             raise SnowClientException("RecordQuery.query: "
                                       "needs either a value in the query_filter or the query_encoded parameters")
+        if page_size is not None and page_size < 1:
+            raise SnowClientException("RecordQuery.query: page_size should be a positive integer")
+        if parallel_pages is not None and parallel_pages < 1:
+            raise SnowClientException("RecordQuery.query: parallel_pages should be a positive integer")
+        if prefetch_pages is not None and (not parallel_pages or prefetch_pages < parallel_pages):
+            raise SnowClientException("RecordQuery.query: prefetch_pages needs parallel_pages, "
+                                      "and cannot be lower than parallel_pages")
+        if stream and parallel_pages:
+            raise SnowClientException("RecordQuery.query: stream cannot be used with parallel_pages")
+
+        if fields and url_params and self.__get_sysparm_fields_in_url_params_re().search(url_params):
+            raise SnowClientException("RecordQuery.query: the fields parameter cannot be used together with "
+                                      "sysparm_fields in the url_params parameter")
+
+        query_encoded = self.__build_encoded_query(query_filter, query_encoded)
+
+        if keyset or cursor:
+            if parallel_pages:
+                raise SnowClientException("RecordQuery.query: keyset and cursor cannot be used with parallel_pages")
+            if 'ORDERBY' in query_encoded or '^NQ' in query_encoded:
+                raise SnowClientException("RecordQuery.query: with keyset or cursor, the encoded query cannot "
+                                          "contain ORDERBY or ^NQ")
+
+            keyset_fields = self.__get_keyset_fields(keyset)
+            last_values = None
+            if cursor:
+                cursor_fields, last_values = self._decode_cursor(cursor)
+                if keyset_fields and keyset_fields != cursor_fields:
+                    raise SnowClientException("RecordQuery.query: the cursor was obtained with the keyset " +
+                                              repr(cursor_fields) + ', not ' + repr(keyset_fields))
+                keyset_fields = cursor_fields
+            params = Record._build_params(fields, display_value, exclude_reference_link, keyset_fields)
+            page_size = page_size or self.default_page_size
+            self._info('RecordQuery.query: querying the table %s with the encoded query %s, pages of %d records '
+                       'and keyset %s', self._table_name, query_encoded, page_size, ','.join(keyset_fields))
+            return LazyRecordSet(
+                self._session,
+                self.__query_pages_by_keyset(query_encoded, url_params, params, page_size, keyset_fields,
+                                             last_values, stream),
+                self._table_name, keyset_fields, last_values, display_value)
+
+        if page_size or parallel_pages:
+            # the pages are fetched with offsets: they need the same order in every GET operation
+            query_encoded = self.__add_order_tiebreaker(query_encoded)
+        url = self.__build_url(query_encoded, url_params)
+        params = Record._build_params(fields, display_value, exclude_reference_link)
+
+        if parallel_pages:
+            page_size = page_size or self.default_page_size
+            prefetch_pages = prefetch_pages or parallel_pages
+            self._info('RecordQuery.query: querying the table %s with URL %s, pages of %d records and %d parallel '
+                       'pages', self._table_name, url, page_size, parallel_pages)
+            return LazyRecordSet(
+                self._session,
+                self.__query_pages_in_parallel(url, params, page_size, parallel_pages, prefetch_pages),
+                self._table_name, display_value=display_value)
+
+        if page_size:
+            self._info('RecordQuery.query: querying the table %s with URL %s and pages of %d records',
+                       self._table_name, url, page_size)
+            return LazyRecordSet(self._session, self.__query_pages(url, params, page_size, stream=stream),
+                                 self._table_name, display_value=display_value)
+
+        if stream:
+            self._info('RecordQuery.query: querying the table %s with URL %s and streaming the result',
+                       self._table_name, url)
+            return LazyRecordSet(self._session, self.__query_all_streamed(url, params), self._table_name,
+                                 display_value=display_value)
 
-        #  build the URL
-        url = '/api/now/v2/table/' + self._table_name
+        #  execute a get
+        self._info('RecordQuery.query: querying the table %s with URL %s', self._table_name, url)
+        result = self._session.get(url, params=params)
+        if self._is_debug_enabled():
+            self._debug('RecordQuery.query: result of querying the table %s with URL %s: %s', self._table_name, url,
+                        self._session._truncate_log_body(result.text))
+
+        #  build an array of objects where each object represents a record
+        result_array = []
+        result = json.loads(result.text)
+        if 'result' not in result:
+            return RecordSet(self._session, result_array, self._table_name, display_value)
+        for record in result['result']:
+            result_array.append(record)
+
+        #  build a RecordSet passing the array
+        result = RecordSet(self._session, result_array, self._table_name, display_value)
+
+        #  return the RecordSet
+        return result
 
+    @classmethod
+    def __build_encoded_query(cls, query_filter, query_encoded):
+        """
+        Builds the encoded query of a query: the query filter is concatenated to the encoded query.
+
+        Returns:
+            str: the encoded query
+        """
         if query_filter:
             if query_encoded:
                 query_encoded = query_encoded + '^'
@@ -669,31 +1194,272 @@ class RecordQuery(SessionAware):
             for key in query_filter:
                 query.append(key + '=' + query_filter[key])
             query_encoded = query_encoded + '^'.join(query)
+
+        return query_encoded
+
+    @classmethod
+    def __add_order_tiebreaker(cls, query_encoded):
+        """
+        Adds ``ORDERBYsys_id`` at the end of an encoded query, after its own ``ORDERBY``, if any. ServiceNow does
+        not guarantee the order of the records otherwise, so the GET operations of a query paged with offsets
+        could skip or repeat records between pages.
+
+        Returns:
+            str: the encoded query, ordered by a unique field
+        """
+        if re.search(r'ORDERBY(DESC)?sys_id(\^|$)', query_encoded):
+            return query_encoded
+        return query_encoded + '^ORDERBYsys_id'
+
+    def __build_url(self, query_encoded, url_params, required_fields=None):
+        """
+        Builds the URL of a query.
+
+        Args:
+            required_fields (list): fields which should be returned even if ``url_params`` restricts the
+                returned fields with ``sysparm_fields``
+
+        Returns:
+            str: the relative URL of the query
+        """
+        url = '/api/now/v2/table/' + self._table_name
+
         if query_encoded:
             url = url + '?sysparm_query=' + query_encoded
         if url_params:
-            url_params = self.__check_and_fix_url_params(url_params)
+            url_params = self.__check_and_fix_url_params(url_params, required_fields)
             url = url + '&' + url_params
 
-        #  execute a get
-        self._info('RecordQuery.query: querying the table ' + self._table_name + ' with URL ' + url)
-        result = self._session.get(url, params={'sysparm_display_value': 'all'})
-        self._debug('RecordQuery.query: result of querying the table ' + self._table_name + ' with URL ' + url +
-                    ': ' + result.text)
+        return url
 
-        #  build an array of objects where each object represents a record
-        result_array = []
-        result = json.loads(result.text)
-        if 'result' not in result:
-            return RecordSet(self._session, result_array, self._table_name)
-        for record in result['result']:
-            result_array.append(record)
+    def __query_pages(self, url, params, page_size, offset=0, stream=False):
+        """
+        A generator which fetches the records of a query page by page, using ``sysparm_limit`` and
+        ``sysparm_offset``. A page is only fetched when the previous one has been consumed.
+        The iteration stops when ServiceNow does not announce a next page in the ``Link`` header, or,
+        if there is no ``Link`` header, when a page is not full.
 
-        #  build a RecordSet passing the array
-        result = RecordSet(self._session, result_array, self._table_name)
+        Yields:
+            tuple: (list of dictionaries with the records of the page, requests.Response)
+        """
+        while True:
+            result_array, response = self.__query_page(url, params, page_size, offset, stream)
+            yield result_array, response
+
+            row_count, last_row = self.__get_page_count_and_last_row(result_array)
+            offset += row_count
+            if not row_count:
+                break
+            if 'Link' in response.headers:
+                if 'next' not in response.links:
+                    break
+            elif row_count < page_size:
+                break
+
+    def __query_all_streamed(self, url, params):
+        """
+        A generator which fetches all the records of a query with a single streamed GET operation.
 
-        #  return the RecordSet
-        return result
+        Yields:
+            tuple: (ResultStreamParser, requests.Response)
+        """
+        yield self.__query_page(url, params, None, None, True)
+
+    def __query_pages_in_parallel(self, url, params, page_size, parallel_pages, prefetch_pages):
+        """
+        A generator which fetches the first page of a query, and then all the other pages in parallel,
+        with a WorkerPool of ``parallel_pages`` threads. At most ``prefetch_pages`` pages are fetched
+        ahead of the page being consumed. The pages are yielded in order.
+
+        Yields:
+            tuple: (list of dictionaries with the records of the page, requests.Response)
+        """
+        result_array, response = self.__query_page(url, params, page_size, 0)
+        yield result_array, response
+
+        total_count = response.headers.get('X-Total-Count')
+        if total_count is None:
+            # the offsets of the pages cannot be computed: we continue page by page
+            if len(result_array) == page_size:
+                for page in self.__query_pages(url, params, page_size, len(result_array)):
+                    yield page
+            return
+
+        pool = WorkerPool(parallel_pages)
+        futures = collections.deque()
+        try:
+            for offset in range(page_size, int(total_count), page_size):
+                if len(futures) >= prefetch_pages:
+                    yield futures.popleft().result()
+                futures.append(pool.submit(self.__query_page, url, params, page_size, offset))
+
+            while futures:
+                yield futures.popleft().result()
+        finally:
+            # if the iteration is stopped early, the pages not yet fetched are not needed anymore
+            for future in futures:
+                future.cancel()
+            pool.shutdown(wait=False)
+
+    def __query_pages_by_keyset(self, query_encoded, url_params, params, page_size, keyset_fields, last_values,
+                                stream=False):
+        """
+        A generator which fetches the records of a query page by page, ordered by the ``keyset_fields``.
+        Each page is queried with a condition selecting the records after the last record of the previous page,
+        instead of with an offset. The iteration stops when a page is not full.
+
+        Yields:
+            tuple: (list of dictionaries with the records of the page, requests.Response)
+        """
+        while True:
+            keyset_query = self.__build_keyset_query(query_encoded, keyset_fields, last_values)
+            url = self.__build_url(keyset_query, url_params, keyset_fields)
+            result_array, response = self.__query_page(url, params, page_size, 0, stream)
+            yield result_array, response
+
+            row_count, last_row = self.__get_page_count_and_last_row(result_array)
+            if row_count < page_size:
+                break
+            last_values = self._get_keyset_values(last_row, keyset_fields)
+
+    @classmethod
+    def __build_keyset_query(cls, query_encoded, keyset_fields, last_values):
+        """
+        Builds the encoded query of a page of a keyset query. For the fields f1, f2 and the last values v1, v2,
+        the condition is ``f1>v1 OR (f1=v1 AND f2>v2)``, written as one ``^NQ`` (new query) per term,
+        each one repeating the original encoded query.
+
+        Returns:
+            str: the encoded query
+        """
+        order_by = '^'.join(['ORDERBY' + field for field in keyset_fields])
+        if query_encoded:
+            query_encoded = query_encoded + '^'
+        else:
+            query_encoded = ''
+
+        if not last_values:
+            return query_encoded + order_by
+
+        terms = []
+        for i in range(len(keyset_fields)):
+            conditions = []
+            for j in range(i):
+                conditions.append(keyset_fields[j] + '=' + last_values[j])
+            conditions.append(keyset_fields[i] + '>' + last_values[i])
+            terms.append(query_encoded + '^'.join(conditions))
+
+        return '^NQ'.join(terms) + '^' + order_by
+
+    @classmethod
+    def __get_keyset_fields(cls, keyset):
+        """
+        Returns:
+            list: the keyset fields, with ``sys_id`` as last field. None if ``keyset`` is not set.
+        """
+        if not keyset:
+            return None
+        if isinstance(keyset, str) or isinstance(keyset, unicode):
+            keyset = keyset.split(',')
+
+        keyset_fields = [field.strip() for field in keyset if field.strip() and field.strip() != 'sys_id']
+        keyset_fields.append('sys_id')
+        return keyset_fields
+
+    @classmethod
+    def _get_keyset_values(cls, record_dict, keyset_fields):
+        """
+        Args:
+            record_dict (dict): the raw values of a record, as returned by ServiceNow
+            keyset_fields (list): the keyset fields
+
+        Returns:
+            list: the internal values of the keyset fields in the record
+        """
+        values = []
+        for field in keyset_fields:
+            value = record_dict.get(field)
+            if isinstance(value, dict):
+                value = value.get('value')
+            if value is None:
+                raise SnowClientException('RecordQuery.query: the field ' + field + ' of the keyset was not '
+                                          'returned by ServiceNow')
+            values.append(value)
+        return values
+
+    @classmethod
+    def _encode_cursor(cls, keyset_fields, last_values):
+        """
+        Returns:
+            str: an opaque cursor, which can be passed to ``RecordQuery.query`` to resume a keyset query
+        """
+        return base64.urlsafe_b64encode(json.dumps({'keyset': keyset_fields, 'last': last_values}))
+
+    @classmethod
+    def _decode_cursor(cls, cursor):
+        """
+        Returns:
+            tuple: (list of keyset fields, list of the last values or None)
+
+        Raises:
+            SnowClientException : if the cursor is not valid
+        """
+        try:
+            decoded_cursor = json.loads(base64.urlsafe_b64decode(str(cursor)))
+            keyset_fields = [str(field) for field in decoded_cursor['keyset']]
+            last_values = decoded_cursor['last']
+        except (TypeError, ValueError, KeyError):
+            raise SnowClientException('RecordQuery.query: invalid cursor ' + repr(cursor))
+
+        if not keyset_fields or (last_values is not None and len(last_values) != len(keyset_fields)):
+            raise SnowClientException('RecordQuery.query: invalid cursor ' + repr(cursor))
+        return keyset_fields, last_values
+
+    def __query_page(self, url, params, page_size, offset, stream=False):
+        """
+        Fetches a page of the records of a query, or all of them if ``page_size`` is None.
+
+        Returns:
+            tuple: (list of dictionaries with the records of the page, requests.Response).
+            If ``stream`` is True, a ResultStreamParser instead of the list, to be iterated before fetching
+            the next page.
+        """
+        params = dict(params)
+        if page_size:
+            params['sysparm_limit'] = page_size
+            params['sysparm_offset'] = offset
+        response = self._session.get(url, params=params, stream=stream)
+
+        if stream:
+            if offset is None:
+                self._debug('RecordQuery.query: streaming the result of querying the table %s with URL %s',
+                            self._table_name, url)
+            else:
+                self._debug('RecordQuery.query: streaming the result of querying the table %s with URL %s '
+                            'at offset %d', self._table_name, url, offset)
+            return ResultStreamParser(response), response
+
+        if self._is_debug_enabled():
+            self._debug('RecordQuery.query: result of querying the table %s with URL %s at offset %d: %s',
+                        self._table_name, url, offset, self._session._truncate_log_body(response.text))
+
+        result = json.loads(response.text)
+        return result.get('result', []), response
+
+    @classmethod
+    def __get_page_count_and_last_row(cls, result_array):
+        """
+        Args:
+            result_array (:obj:`list` or :obj:`ResultStreamParser`): the records of a page, already iterated
+
+        Returns:
+            tuple: (number of records in the page, last record of the page or None)
+        """
+        if isinstance(result_array, ResultStreamParser):
+            return result_array.get_item_count(), result_array.get_last_item()
+        if result_array:
+            return len(result_array), result_array[-1]
+        return 0, None
 
     def get_session(self):
         """
@@ -710,13 +1476,14 @@ class RecordQuery(SessionAware):
         return self._table_name
 
     @classmethod
-    def __check_and_fix_url_params(cls, url_params):
+    def __check_and_fix_url_params(cls, url_params, required_fields=None):
         """
             Checks for potentially dangerous URL parameters.
             For example, the parameter sysparm_fields should always include the sys_id and sys_class_name fields.
 
         Args:
             url_params (str): additional URL parameters passed to the REST API
+            required_fields (list, optional): other fields that sysparm_fields should include
 
         Returns:
             str: checked and eventually fixed URL paramaters
@@ -731,6 +1498,9 @@ class RecordQuery(SessionAware):
                     field_name_array.append('sys_id')
                 if 'sys_class_name' not in field_name_array:
                     field_name_array.append('sys_class_name')
+                for field_name in required_fields or []:
+                    if field_name not in field_name_array:
+                        field_name_array.append(field_name)
                 url_params = pattern.sub("sysparm_fields=" + ",".join(field_name_array), url_params)
 
         return url_params
@@ -753,6 +1523,9 @@ class RecordSet(SessionAware):
             session (SnowRestSession): a cern_snow_client.session.SnowRestSession object
             result_array (list): a list of dictionaries
             table_name (str): the name of a ServiceNow table, e.g. 'incident', from which to query from
+            display_value (:obj:`str`, optional): the ``display_value`` of the query. For ``'true'``,
+                the dictionaries hold both the values and the display values, and the records only get
+                the display values (see ``Record._keep_display_values``)
 
         Examples:
             >>> r = RecordQuery(s, 'incident')
@@ -771,10 +1544,18 @@ class RecordSet(SessionAware):
             >>>     print type(record)  # will print the Incident class
         """
 
-    def __init__(self, session, result_array, table_name):
+    display_value_column_suffix = '.display_value'
+    prefetch_chunk_size = 100
+
+    def __init__(self, session, result_array, table_name, display_value='all'):
         super(RecordSet, self).__init__(session)
         self._result_array = result_array
         self._table_name = table_name
+        self._display_value = display_value
+        self._prefetch_field_names = ()
+        self._prefetch_fields = None
+        self._prefetch_chunk_size = self.prefetch_chunk_size
+        self._prefetched_records = {}
 
         table_class_mapping = TableClassMapping.get()
         if table_name in table_class_mapping:
@@ -794,16 +1575,445 @@ class RecordSet(SessionAware):
 
         if self.n < len(self._result_array):
             record_dict = self._result_array[self.n]
-            if self._record_class is Record:
-                record = Record(self._session, table_name=self._table_name, values=record_dict)
-            else:
-                record = self._record_class(self._session, values=record_dict)
+            record = self._build_record(record_dict)
             self.n += 1
             return record
 
         else:
             raise StopIteration
 
+    def _build_record(self, record_dict):
+        """
+        Args:
+            record_dict (dict): the raw values of a record, as returned by ServiceNow
+
+        Returns:
+            Record : An instance of Record or of a subclass of Record.
+        """
+        if self._display_value == 'true':
+            record_dict = Record._keep_display_values(record_dict)
+        if self._record_class is Record:
+            record = Record(self._session, table_name=self._table_name, values=record_dict)
+        else:
+            record = self._record_class(self._session, values=record_dict)
+        # the values come from ServiceNow: they are not changes to send in an update
+        record.reset_changed_values()
+
+        for field_name in self._prefetch_field_names:
+            field = getattr(record, field_name, None)
+            if isinstance(field, RecordField) and field.is_reference():
+                field._set_record(self._prefetched_records.get((field.get_referenced_table(), field.get_value())))
+        return record
+
+    def _iter_rows(self):
+        """
+        Returns:
+            iterator: an iterator over the raw values (dictionaries) of the records
+        """
+        return iter(self._result_array)
+
+    def prefetch(self, *field_names, **kwargs):
+        """
+        Fetches the records referenced by some reference fields of the records of the RecordSet, with one query
+        per referenced table for up to ``chunk_size`` distinct records, instead of one ``Record.get`` per field
+        and per record. ``get_record()`` of these fields then returns the referenced records.
+        The reference fields need to be fetched with their links, i.e. without ``exclude_reference_link``.
+        For a LazyRecordSet, the referenced records are fetched page by page, while iterating, and only the ones
+        referenced by the current page are kept.
+
+        Args:
+            *field_names (str): the names of the reference fields, e.g. ``'assignment_group'``
+            fields (:obj:`list`, optional): the names of the fields of the referenced records to fetch.
+                By default, all the fields are fetched.
+            chunk_size (:obj:`int`, optional): the maximum number of records fetched by each query.
+                By default, ``RecordSet.prefetch_chunk_size``.
+
+        Returns:
+            RecordSet : this RecordSet
+
+        Raises:
+            SnowClientException : if any of the parameters is set incorrectly
+
+        Examples:
+            >>> record_set = IncidentQuery(s).query(query_encoded="active=true")
+            >>> record_set.prefetch('assignment_group', 'caller_id', fields=['name', 'email'])
+            >>> for record in record_set:
+            >>>     print record.number + ' ' + record.assignment_group.get_record().name
+        """
+        fields = kwargs.pop('fields', None)
+        chunk_size = kwargs.pop('chunk_size', self.prefetch_chunk_size)
+        if kwargs:
+            raise SnowClientException('RecordSet.prefetch: unexpected arguments ' + ', '.join(sorted(kwargs)))
+        if not field_names:
+            raise SnowClientException('RecordSet.prefetch: the names of the reference fields are needed')
+        if chunk_size < 1:
+            raise SnowClientException('RecordSet.prefetch: chunk_size should be a positive integer')
+
+        self._prefetch_field_names = field_names
+        self._prefetch_fields = fields
+        self._prefetch_chunk_size = chunk_size
+        self._prefetch_rows(self._result_array)
+        return self
+
+    def _prefetch_rows(self, rows, forget_others=False):
+        """
+        Fetches the records referenced by the fields given to ``prefetch`` in some rows, if not fetched yet.
+
+        Args:
+            rows (list): the raw values (dictionaries) of records
+            forget_others (:obj:`bool`, optional): if True, the records fetched before which are not referenced
+                by these rows are dropped
+        """
+        referenced_keys = set()
+        for record_dict in rows:
+            for field_name in self._prefetch_field_names:
+                raw_value = record_dict.get(field_name)
+                if not raw_value:
+                    continue
+                field = RecordField(raw_value)
+                key = (field.get_referenced_table(), field.get_value())
+                if key[0] and key[1]:
+                    referenced_keys.add(key)
+
+        if forget_others:
+            self._prefetched_records = dict([(key, record) for key, record in self._prefetched_records.items()
+                                             if key in referenced_keys])
+
+        sys_ids_by_table = {}
+        for key in referenced_keys:
+            if key not in self._prefetched_records:
+                sys_ids_by_table.setdefault(key[0], set()).add(key[1])
+
+        for table_name in sorted(sys_ids_by_table):
+            sys_ids = sorted(sys_ids_by_table[table_name])
+            for start in range(0, len(sys_ids), self._prefetch_chunk_size):
+                chunk = sys_ids[start:start + self._prefetch_chunk_size]
+                self._info('RecordSet.prefetch: fetching %d records of table %r', len(chunk), table_name)
+                # the records which are not found (deleted, not readable) are not looked for again
+                for sys_id in chunk:
+                    self._prefetched_records[(table_name, sys_id)] = None
+                record_set = RecordQuery(self._session, table_name).query(
+                    query_encoded='sys_idIN' + ','.join(chunk), fields=self._prefetch_fields)
+                for record in record_set:
+                    self._prefetched_records[(table_name, record.sys_id.get_value())] = record
+
+    def update_all(self, values, max_workers=None, use_batch=False, batch_chunk_size=50):
+        """
+        Updates all the records of the RecordSet in ServiceNow with the same values.
+        The ``sys_id`` and ``sys_class_name`` of the records are taken from the query results, so each record
+        is updated with a single operation. The records are updated one after the other, or, with ``max_workers``,
+        several at the same time, or, with ``use_batch``, in chunks sent through the ServiceNow Batch API
+        (see ``cern_snow_client.batch.RecordBatch``).
+
+        Args:
+            values (dict): the values of the fields to update, e.g. ``{'assignment_group': 'sys_id of a group'}``
+            max_workers (:obj:`int`, optional): the maximum number of records updated at the same time
+            use_batch (:obj:`bool`, optional): if True, the updates are sent through the Batch API
+            batch_chunk_size (:obj:`int`, optional): with ``use_batch``, the number of updates per batch request
+
+        Returns:
+            RecordSetOperationReport : the result of the update of each record.
+            For a LazyRecordSet, the records not iterated yet are fetched and updated.
+
+        Raises:
+            SnowClientException : if any of the parameters is set incorrectly
+
+        Examples:
+            >>> record_set = IncidentQuery(s).query(query_encoded="assignment_group=" + old_group_sys_id,
+            >>>                                     fields=['number'])
+            >>> report = record_set.update_all({'assignment_group': new_group_sys_id}, max_workers=8)
+            >>> for record, error in report.get_failed():
+            >>>     print record.number + ': ' + str(error)
+        """
+        def set_values(record):
+            for key in values:
+                setattr(record, key, values[key])
+
+        return self.__apply_to_all(set_values, max_workers, use_batch, batch_chunk_size)
+
+    def add_comment_all(self, comment, max_workers=None, use_batch=False, batch_chunk_size=50):
+        """
+        Adds the same comment to all the records of the RecordSet in ServiceNow.
+        See ``update_all`` for the parameters and the result.
+
+        Args:
+            comment (str): the new comment to be added
+        """
+        return self.update_all({'comments': comment}, max_workers, use_batch, batch_chunk_size)
+
+    def resolve_all(self, solution, close_code=None, max_workers=None, use_batch=False, batch_chunk_size=50):
+        """
+        Resolves all the tasks of the RecordSet in ServiceNow, as ``Task.resolve`` does for a single task.
+        See ``update_all`` for the parameters and the result.
+
+        Args:
+            solution (str): the text that will be added to the comments and which will be stored as the Solution
+            close_code (:obj:`str`, optional): the Close Code to use. If not set, the default Close Code will be
+                selected : "Restored" for Incidents and "Fulfilled" for Requests.
+
+        Raises:
+            SnowClientException : if the records of the RecordSet are not tasks
+
+        Examples:
+            >>> record_set = IncidentQuery(s).query(query_encoded="u_outage=" + outage_sys_id, fields=['number'])
+            >>> report = record_set.resolve_all('Service restored', max_workers=8)
+            >>> print str(len(report.get_succeeded())) + ' incidents resolved'
+        """
+        from task import Task
+
+        if not issubclass(self._record_class, Task):
+            raise SnowClientException('RecordSet.resolve_all: the records of the table ' + self._table_name +
+                                      ' are not tasks')
+
+        def set_resolve_values(record):
+            record._set_resolve_values(solution, close_code)
+
+        return self.__apply_to_all(set_resolve_values, max_workers, use_batch, batch_chunk_size)
+
+    def __apply_to_all(self, set_values, max_workers, use_batch, batch_chunk_size):
+        """
+        Builds each record, sets its new values with the ``set_values`` function and updates it in ServiceNow.
+
+        Returns:
+            RecordSetOperationReport : the result of the update of each record
+        """
+        if max_workers is not None and max_workers < 1:
+            raise SnowClientException('RecordSet: max_workers should be a positive integer')
+        if max_workers and use_batch:
+            raise SnowClientException('RecordSet: max_workers and use_batch cannot be used together')
+
+        report = RecordSetOperationReport()
+
+        if use_batch:
+            from batch import RecordBatch
+
+            batch = RecordBatch(self._session, batch_chunk_size)
+            records = []
+
+            def execute_batch():
+                results = batch.execute()
+                status_codes = batch.get_status_codes()
+                for record, result, status_code in zip(records, results, status_codes):
+                    if result:
+                        report._add(record, True)
+                    else:
+                        report._add(record, False, SnowClientException(
+                            'RecordSet: the update failed with status code ' + str(status_code)))
+                del records[:]
+
+            for record_dict in self._iter_rows():
+                record = self._build_record(record_dict)
+                try:
+                    set_values(record)
+                    batch.update(record)
+                    records.append(record)
+                except Exception as e:
+                    report._add(record, False, e)
+                # each chunk is sent as soon as it is full, before reading more records
+                if batch.get_pending_count() >= batch_chunk_size:
+                    execute_batch()
+
+            if batch.get_pending_count():
+                execute_batch()
+            return report
+
+        def update(record):
+            set_values(record)
+            if not record.update():
+                raise SnowClientException('RecordSet: the update of the record ' + str(record.sys_id) + ' failed')
+
+        if not max_workers:
+            for record_dict in self._iter_rows():
+                record = self._build_record(record_dict)
+                try:
+                    update(record)
+                    report._add(record, True)
+                except Exception as e:
+                    report._add(record, False, e)
+            return report
+
+        def add_result(record, future):
+            error = future.exception()
+            report._add(record, error is None, error)
+
+        pool = WorkerPool(max_workers)
+        # at most this number of records are built ahead of the updates, so that a LazyRecordSet
+        # is still read page by page
+        max_pending = 2 * max_workers
+        futures = collections.deque()
+        try:
+            for record_dict in self._iter_rows():
+                if len(futures) >= max_pending:
+                    add_result(*futures.popleft())
+                record = self._build_record(record_dict)
+                futures.append((record, pool.submit(update, record)))
+
+            while futures:
+                add_result(*futures.popleft())
+        finally:
+            pool.shutdown(wait=False)
+
+        return report
+
+    def to_columns(self, fields=None, display_value='false'):
+        """
+        Transposes the records into columns, without building Record objects.
+
+        Args:
+            fields (:obj:`list`, optional): the names of the fields to return. By default, all the fields
+                returned by ServiceNow.
+            display_value (:obj:`str`, optional): as in ``RecordQuery.query``, ``'false'`` (default) for the values
+                of the fields, ``'true'`` for their display values, or ``'all'`` for both: the display values are
+                then in additional columns named ``field_name + RecordSet.display_value_column_suffix``, e.g.
+                ``'incident_state.display_value'``. False and True are accepted for ``'false'`` and ``'true'``.
+
+        Returns:
+            dict: A dictionary ``{'field_name': [value of the 1st record, value of the 2nd record...]}``,
+            with unicode values, or None for the records without that field.
+            For a LazyRecordSet, the records not iterated yet are fetched and consumed.
+
+        Examples:
+            >>> record_set = IncidentQuery(s).query(query_encoded="active=false", fields=['incident_state'])
+            >>> columns = record_set.to_columns(['number', 'incident_state'], display_value='all')
+            >>> print columns['incident_state']  # [u'7', u'6', ...]
+            >>> print columns['incident_state.display_value']  # [u'Closed', u'Resolved', ...]
+        """
+        return self.__build_columns(fields, display_value)[1]
+
+    def to_numpy(self, field, display_value='false', dtype=None):
+        """
+        Returns the values of a field as a NumPy array, without building Record objects.
+        Needs the ``numpy`` package.
+
+        Args:
+            field (str): the name of the field
+            display_value (:obj:`str`, optional): ``'true'`` for the display values of the field instead of its
+                values (``'false'``, default). See ``to_columns``
+            dtype (:obj:`numpy.dtype`, optional): the type of the array, e.g. float. By default, object
+                (unicode values). With another type, empty values are converted like None, e.g. to NaN for float.
+
+        Returns:
+            numpy.ndarray : the values of the field, one per record.
+            For a LazyRecordSet, the records not iterated yet are fetched and consumed: use ``to_columns``
+            to get several fields at once.
+
+        Raises:
+            SnowClientException : if numpy is not installed
+
+        Examples:
+            >>> record_set = IncidentQuery(s).query(query_encoded="active=false", fields=['reassignment_count'])
+            >>> print record_set.to_numpy('reassignment_count', dtype=float).mean()
+        """
+        try:
+            import numpy
+        except ImportError:
+            raise SnowClientException('RecordSet.to_numpy: the numpy package is needed')
+
+        if display_value == 'all':
+            raise SnowClientException("RecordSet.to_numpy: display_value should be 'true' or 'false'")
+
+        column = self.to_columns([field], display_value)[field]
+        if dtype not in (None, object):
+            column = [value if value != u'' else None for value in column]
+        return numpy.array(column, dtype=dtype or object)
+
+    def to_dataframe(self, fields=None, display_value='false'):
+        """
+        Returns the records as a pandas DataFrame, with one column per field and one row per record,
+        without building Record objects. Needs the ``pandas`` package.
+
+        Args:
+            fields (:obj:`list`, optional): the names of the fields to return, in the order of the columns.
+                By default, all the fields returned by ServiceNow.
+            display_value (:obj:`str`, optional): see ``to_columns``
+
+        Returns:
+            pandas.DataFrame : the records, with unicode values.
+            For a LazyRecordSet, the records not iterated yet are fetched and consumed.
+
+        Raises:
+            SnowClientException : if pandas is not installed
+
+        Examples:
+            >>> record_set = IncidentQuery(s).query(query_encoded="active=false", page_size=10000,
+            >>>                                     fields=['assignment_group', 'incident_state'])
+            >>> df = record_set.to_dataframe(['assignment_group', 'incident_state'], display_value='true')
+            >>> print df.groupby('assignment_group').size()
+        """
+        try:
+            import pandas
+        except ImportError:
+            raise SnowClientException('RecordSet.to_dataframe: the pandas package is needed')
+
+        column_names, columns = self.__build_columns(fields, display_value)
+        return pandas.DataFrame(columns, columns=column_names)
+
+    def __build_columns(self, fields, display_value):
+        """
+        Returns:
+            tuple: (list of the column names, in order, dictionary of columns)
+        """
+        if display_value is False:
+            display_value = 'false'
+        elif display_value is True:
+            display_value = 'true'
+        if display_value not in ('false', 'true', 'all'):
+            raise SnowClientException("RecordSet: the \"display_value\" parameter should be 'all', 'true' or 'false'")
+
+        # only the columns returned are built: the values for 'false', the display values for 'true', both for 'all'
+        columns = None
+        display_columns = None
+        if display_value in ('false', 'all'):
+            columns = {}
+        if display_value in ('true', 'all'):
+            display_columns = {}
+        built_columns = [built for built in (columns, display_columns) if built is not None]
+
+        field_names = []
+        row_count = 0
+
+        if fields:
+            field_names = list(fields)
+            for field in field_names:
+                for built in built_columns:
+                    built[field] = []
+
+        for record_dict in self._iter_rows():
+            if self._display_value == 'true':
+                record_dict = Record._keep_display_values(record_dict)
+            if not fields:
+                for field in record_dict:
+                    if field not in built_columns[0]:
+                        field_names.append(field)
+                        for built in built_columns:
+                            built[field] = [None] * row_count
+
+            for field in field_names:
+                raw_value = record_dict.get(field)
+                if isinstance(raw_value, dict):
+                    value = raw_value.get('value', raw_value.get('display_value'))
+                    if columns is not None:
+                        columns[field].append(value)
+                    if display_columns is not None:
+                        display_columns[field].append(raw_value.get('display_value', value))
+                else:
+                    for built in built_columns:
+                        built[field].append(raw_value)
+            row_count += 1
+
+        if display_value == 'true':
+            return field_names, display_columns
+        elif display_value == 'all':
+            column_names = []
+            for field in field_names:
+                display_column_name = field + self.display_value_column_suffix
+                columns[display_column_name] = display_columns[field]
+                column_names.append(field)
+                column_names.append(display_column_name)
+            return column_names, columns
+        else:
+            return field_names, columns
+
     def get_session(self):
         """
         Returns:
@@ -825,3 +2035,156 @@ class RecordSet(SessionAware):
             type : The Python class (Task, Incident...) that is used to build the objects returned by ``next()``
         """
         return self._record_class
+
+
+class LazyRecordSet(RecordSet):
+    """
+        A RecordSet whose records are fetched lazily, page by page, while iterating.
+        Only the records of the current page are kept in memory. It can only be iterated once.
+        It is returned by ``RecordQuery.query`` when a ``page_size`` is provided.
+
+        Args:
+            session (SnowRestSession): a cern_snow_client.session.SnowRestSession object
+            pages (iterator): an iterator over tuples (list of dictionaries, requests.Response),
+                one for each page
+            table_name (str): the name of a ServiceNow table, e.g. 'incident', from which to query from
+            keyset_fields (list, optional): for a keyset query, the fields ordering the records
+            last_values (list, optional): for a keyset query resumed from a cursor, the values of the keyset
+                fields in the last record returned before
+            display_value (:obj:`str`, optional): see ``RecordSet``
+
+        Examples:
+            >>> r = RecordQuery(s, 'incident')
+            >>> record_set = r.query(query_encoded="active=false", page_size=1000)
+            >>> for record in record_set:
+            >>>     print record.number
+            >>> print record_set.get_total_count()  # the value of the X-Total-Count header
+    """
+
+    def __init__(self, session, pages, table_name, keyset_fields=None, last_values=None, display_value='all'):
+        super(LazyRecordSet, self).__init__(session, [], table_name, display_value)
+        self._pages = pages
+        self._rows = None
+        self._total_count = None
+        self._keyset_fields = keyset_fields
+        self._last_values = last_values
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        """
+        Returns:
+            Record : An instance of Record or of a subclass of Record.
+        """
+        return self._build_record(next(self._iter_rows()))
+
+    def _iter_rows(self):
+        """
+        Returns:
+            iterator: an iterator over the raw values (dictionaries) of the records not iterated yet
+        """
+        if self._rows is None:
+            self._rows = self.__iter_pages_rows()
+        return self._rows
+
+    def __iter_pages_rows(self):
+        for result_array, response in self._pages:
+            total_count = response.headers.get('X-Total-Count')
+            if total_count is not None and self._total_count is None:
+                self._total_count = int(total_count)
+            rows = result_array
+            try:
+                if self._prefetch_field_names:
+                    # the page needs to be read entirely to know the referenced records. The records of the
+                    # previous pages already hold theirs: only the ones of this page are kept
+                    rows = list(result_array)
+                    self._prefetch_rows(rows, forget_others=True)
+                for record_dict in rows:
+                    if self._keyset_fields:
+                        self._last_values = RecordQuery._get_keyset_values(record_dict, self._keyset_fields)
+                    yield record_dict
+            finally:
+                # a streamed page which is not iterated until the end needs to release its connection
+                if isinstance(result_array, ResultStreamParser):
+                    result_array.close()
+
+    def close(self):
+        """
+        Stops the iteration: the pages which have not been fetched yet will not be fetched.
+        Only needed when the iteration is stopped before reaching the last record.
+        """
+        if self._rows is not None:
+            self._rows.close()
+        if hasattr(self._pages, 'close'):
+            self._pages.close()
+
+    def get_total_count(self):
+        """
+        Returns:
+            int : The total number of records matching the query, as announced by ServiceNow in the
+            ``X-Total-Count`` header of the first page, once it has been fetched. None otherwise.
+            For a keyset query resumed from a cursor, the number of records after the cursor.
+        """
+        return self._total_count
+
+    def get_cursor(self):
+        """
+        Returns:
+            str : For a keyset query, a cursor pointing after the last record returned by the iteration so far,
+            which can be passed to ``RecordQuery.query`` to resume the query from there, e.g. after a crash.
+            None if the query is not a keyset query.
+        """
+        if not self._keyset_fields:
+            return None
+        return RecordQuery._encode_cursor(self._keyset_fields, self._last_values)
+
+
+class RecordSetOperationReport(object):
+    """
+    The result of a bulk operation on all the records of a RecordSet, such as ``RecordSet.update_all``.
+
+    Examples:
+        >>> report = record_set.add_comment_all('The outage is over')
+        >>> if not report.is_success():
+        >>>     for record, error in report.get_failed():
+        >>>         print record.sys_id + ': ' + str(error)
+    """
+
+    def __init__(self):
+        self._results = []
+
+    def _add(self, record, success, error=None):
+        self._results.append((record, success, error))
+
+    def get_results(self):
+        """
+        Returns:
+            list: for each record, in order, a tuple (Record, bool True if the operation succeeded,
+            exception or None)
+        """
+        return self._results
+
+    def get_succeeded(self):
+        """
+        Returns:
+            list: the records for which the operation succeeded
+        """
+        return [record for record, success, error in self._results if success]
+
+    def get_failed(self):
+        """
+        Returns:
+            list: a tuple (Record, exception) for each record for which the operation failed
+        """
+        return [(record, error) for record, success, error in self._results if not success]
+
+    def is_success(self):
+        """
+        Returns:
+            bool: True if the operation succeeded for all the records
+        """
+        for record, success, error in self._results:
+            if not success:
+                return False
+        return True
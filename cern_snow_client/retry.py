@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the cern-snow-client library.
+# Copyright (c) 2017 CERN
+# Authors:
+#  - James Clerc <james.clerc@cern.ch> <james.clerc@epitech.eu>
+#  - David Martin Clavo <david.martin.clavo@cern.ch>
+#
+# The cern-snow-client library is free software; you can redistribute it
+# and/or modify it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# The cern-snow-client library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with the cern-snow-client library.  If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+import random
+import time
+from email.utils import mktime_tz
+from email.utils import parsedate_tz
+
+import requests
+
+from common import SnowClientException
+
+
+class RetryPolicy(object):
+    """
+    Decides whether and when a REST operation which failed transiently is sent again by a SnowRestSession:
+    after a connection error, or after a response with one of the ``retry_status_codes``, such as
+    ``503 Service Unavailable`` during a maintenance of the instance.
+
+    GET and PUT operations are retried, as sending them again has the same effect. POST operations are only
+    retried if they have an ``idempotency_key_header`` header, which should then be handled by the endpoint.
+
+    The delay before each new attempt grows exponentially, with "full jitter": it is a random number of seconds
+    between 0 and ``backoff_base * 2 ** (attempt - 1)``, up to ``backoff_max``. If ServiceNow sends a
+    ``Retry-After`` header, it is used instead, up to ``backoff_max``.
+
+    Args:
+        max_attempts (:obj:`int`, optional): the maximum number of times an operation is sent.
+            By default 1, i.e. operations are not retried.
+        backoff_base (:obj:`float`, optional): the maximum number of seconds before the second attempt
+        backoff_max (:obj:`float`, optional): the maximum number of seconds between two attempts
+        retry_status_codes (:obj:`list`, optional): the HTTP status codes after which operations are retried
+        idempotency_key_header (:obj:`str`, optional): the name of the header making POST operations retriable
+
+    Raises:
+        SnowClientException : if any of the parameters is set incorrectly
+
+    Examples:
+        >>> s = SnowRestSession()
+        >>> s.set_retry_policy(RetryPolicy(max_attempts=5, backoff_base=1, backoff_max=60))
+    """
+
+    default_retry_status_codes = (429, 502, 503, 504)
+    retriable_exceptions = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+    def __init__(self, max_attempts=1, backoff_base=0.5, backoff_max=30, retry_status_codes=None,
+                 idempotency_key_header='Idempotency-Key'):
+        if max_attempts < 1:
+            raise SnowClientException('RetryPolicy.__init__: max_attempts should be a positive integer')
+        if backoff_base < 0 or backoff_max < 0:
+            raise SnowClientException('RetryPolicy.__init__: backoff_base and backoff_max should not be negative')
+
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        if retry_status_codes is None:
+            retry_status_codes = self.default_retry_status_codes
+        self.retry_status_codes = frozenset(retry_status_codes)
+        self.idempotency_key_header = idempotency_key_header
+
+    def can_retry(self, operation, headers, attempt):
+        """
+        Args:
+            operation (str): either 'get', 'post' or 'put'
+            headers (dict): the headers sent with the operation
+            attempt (int): the number of times the operation was sent already
+
+        Returns:
+            bool: True if the operation can be sent again
+        """
+        if attempt >= self.max_attempts:
+            return False
+        if operation == 'post':
+            return bool(self.idempotency_key_header and headers.get(self.idempotency_key_header))
+        return True
+
+    def should_retry_response(self, response):
+        """
+        Args:
+            response (requests.Response): the response to an operation
+
+        Returns:
+            bool: True if the status code of the response is one of ``retry_status_codes``
+        """
+        return response.status_code in self.retry_status_codes
+
+    def get_delay(self, attempt, response=None):
+        """
+        Args:
+            attempt (int): the number of times the operation was sent already
+            response (:obj:`requests.Response`, optional): the last response, if any
+
+        Returns:
+            float: the number of seconds to wait before sending the operation again
+        """
+        if response is not None:
+            retry_after = self.__parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after is not None:
+                return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    @staticmethod
+    def __parse_retry_after(retry_after):
+        """
+        Returns:
+            float: the number of seconds in a Retry-After header, which contains either a number of seconds
+            or a HTTP date, or None if there is no valid header
+        """
+        if not retry_after:
+            return None
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+        date = parsedate_tz(retry_after)
+        if date is None:
+            return None
+        return max(0.0, mktime_tz(date) - time.time())
@@ -20,16 +20,23 @@
 # In applying this license, CERN does not waive the privileges and immunities granted to it by virtue of its status
 # as an Intergovernmental Organization or submit itself to any jurisdiction.
 
+import atexit
 import cookielib
 import json
 import os
 import requests
 import subprocess
 import sys
+import tempfile
+import threading
+import time
+import weakref
 import yaml
 import uuid
 import logging
+import Queue
 from logging.handlers import RotatingFileHandler
+from requests.adapters import HTTPAdapter
 
 try:  # Python 2.7+
     from logging import NullHandler
@@ -39,7 +46,13 @@ except ImportError:
             pass
 
 from . import __version__
+from cache import LRUCache
 from common import SnowClientException
+from concurrency import AdaptiveConcurrencyLimiter
+from log_queue import QueueHandler
+from log_queue import QueueListener
+from rate_limit import RateLimiter
+from retry import RetryPolicy
 
 
 class SnowRestSession(object):
@@ -47,6 +60,9 @@ class SnowRestSession(object):
     This class behaves very similarly to a requests.Session object.
     It can be configured by loading a .yaml config file,
     or by setting attributes.
+
+    A SnowRestSession can be shared by several threads: the authentication state is initiated and refreshed
+    by only one of them at a time. In that case, ``pool_maxsize`` should be set to the number of threads.
     """
 
     def __init__(self):
@@ -65,8 +81,35 @@ class SnowRestSession(object):
         self.fresh_token = False
         self.store_cookie = True
         self.store_token = True
+        self.cookie_write_behind = False
+        self.cookie_flush_interval = 5
+        self.oauth_token_refresh_margin = 60
+
+        self._session_initiated = False
+        self._cookie_dirty = False
+        self._cookie_fingerprint = None
+        self._cookie_flush_timer = None
+        self._cookie_lock = threading.Lock()
+        self._flush_at_exit_registered = False
+        self._token_expires_at = None
+        self._auth_lock = threading.RLock()
+        self._auth_generation = 0
+
+        self.pool_connections = 10
+        self.pool_maxsize = 10
+        self.pool_block = False
+
+        self.retry_policy = RetryPolicy()
+        self.rate_limiter = None
+        self.concurrency_limiter = None
+
+        self.update_via_base_table = False
+        self._resolution_cache = None
+        self._record_cache = None
+        self.record_cache_revalidate = False
 
         self.session = requests.Session()
+        self._configure_adapter()
 
         self._log_enabled = False
         self._logger_name = 'snow-client.session_' + uuid.uuid4().hex[:-24]  # used to get a Logger
@@ -80,6 +123,11 @@ class SnowRestSession(object):
         self._log_file_size_bytes = 1000000
         self._log_file_rotations = 10
         self._log_file_encoding = 'utf-8'
+        self._log_body_max_length = 10000
+        self._log_async = False
+        self._log_queue_size = 10000
+        self._log_listener = None
+        self._log_flush_at_exit_registered = False
 
     def load_config_file(self, config_file_path):
         """
@@ -129,6 +177,9 @@ class SnowRestSession(object):
             if 'oauth_tokens_file' in config_file['session']:
                 self.oauth_token_file_path = config_file['session']['oauth_tokens_file']
 
+            if 'oauth_token_refresh_margin' in config_file['session']:
+                self.set_oauth_token_refresh_margin(config_file['session']['oauth_token_refresh_margin'])
+
         elif self.auth_type == 'basic':
             if 'user' in config_file['auth']:
                 self.basic_auth_user = config_file['auth']['user']
@@ -139,11 +190,59 @@ class SnowRestSession(object):
             if 'session' in config_file:
                 if 'cookie_file' in config_file['session']:
                     self.session_cookie_file_path = config_file['session']['cookie_file']
+                if 'cookie_write_behind' in config_file['session']:
+                    self.set_cookie_write_behind(config_file['session']['cookie_write_behind'])
+                if 'cookie_flush_interval' in config_file['session']:
+                    self.set_cookie_flush_interval(config_file['session']['cookie_flush_interval'])
         else:
             raise SnowRestSessionException(
                 "SnowRestSession.load_config_file: the property \"auth_type\" "
                 "must have a value of \"sso_auth\" or \"basic\"")
 
+        self.invalidate_session()
+
+        if 'session' in config_file:
+            if 'pool_connections' in config_file['session']:
+                self.pool_connections = config_file['session']['pool_connections']
+            if 'pool_maxsize' in config_file['session']:
+                self.pool_maxsize = config_file['session']['pool_maxsize']
+            if 'pool_block' in config_file['session']:
+                self.pool_block = config_file['session']['pool_block']
+            self._configure_adapter()
+
+            if 'resolution_cache_size' in config_file['session']:
+                self.set_resolution_cache(config_file['session']['resolution_cache_size'],
+                                          config_file['session'].get('resolution_cache_ttl'))
+            retry_options = {}
+            for option in ['max_attempts', 'backoff_base', 'backoff_max', 'retry_status_codes',
+                           'idempotency_key_header']:
+                key = option if option.startswith('retry_') else 'retry_' + option
+                if key in config_file['session']:
+                    retry_options[option] = config_file['session'][key]
+            if retry_options:
+                self.set_retry_policy(RetryPolicy(**retry_options))
+
+            if 'rate_limit' in config_file['session'] or 'rate_limit_tables' in config_file['session']:
+                self.set_rate_limiter(RateLimiter(
+                    rate=config_file['session'].get('rate_limit'),
+                    burst=config_file['session'].get('rate_limit_burst'),
+                    table_rates=config_file['session'].get('rate_limit_tables'),
+                    lock_directory=config_file['session'].get('rate_limit_lock_directory')))
+
+            if config_file['session'].get('adaptive_concurrency'):
+                limits = {}
+                for option in ['initial_limit', 'min_limit', 'max_limit']:
+                    if 'adaptive_concurrency_' + option in config_file['session']:
+                        limits[option] = config_file['session']['adaptive_concurrency_' + option]
+                self.set_concurrency_limiter(AdaptiveConcurrencyLimiter(**limits))
+
+            if 'record_cache_size' in config_file['session']:
+                self.set_record_cache(config_file['session']['record_cache_size'],
+                                      config_file['session'].get('record_cache_ttl'),
+                                      config_file['session'].get('record_cache_revalidate', False))
+            if 'update_via_base_table' in config_file['session']:
+                self.set_update_via_base_table(config_file['session']['update_via_base_table'])
+
         if 'log' in config_file:
             if 'log_enabled' in config_file['log'] and config_file['log']['log_enabled']:
                 self._log_enabled = True
@@ -159,6 +258,12 @@ class SnowRestSession(object):
                 self._log_file_rotations = config_file['log']['log_file_rotations']
             if 'log_file_encoding' in config_file['log']:
                 self._log_file_encoding = config_file['log']['log_file_encoding']
+            if 'log_body_max_length' in config_file['log']:
+                self._log_body_max_length = config_file['log']['log_body_max_length']
+            if 'log_async' in config_file['log']:
+                self._log_async = config_file['log']['log_async']
+            if 'log_queue_size' in config_file['log']:
+                self._log_queue_size = config_file['log']['log_queue_size']
             self._configure_handler()
 
     def set_instance(self, instance):
@@ -176,6 +281,7 @@ class SnowRestSession(object):
             self.instance = 'https://' + instance
         else:
             self.instance = instance
+        self.invalidate_session()
 
     def set_auth_type(self, auth_type):
         """
@@ -190,6 +296,7 @@ class SnowRestSession(object):
                 "SnowRestSession.set_auth_type: the parameter \"auth_type\" "
                 "must have a value of \"sso_auth\" or \"basic\"")
         self.auth_type = auth_type
+        self.invalidate_session()
 
     def set_sso_method(self, sso_method):
         """
@@ -211,6 +318,7 @@ class SnowRestSession(object):
         if sso_method == 'certificate':
             raise SnowRestSessionException("SnowRestSession.set_sso_method: certificate support is not yet implemented")
         self.sso_method = sso_method
+        self.invalidate_session()
 
     def set_oauth_client_id(self, oauth_client_id):
         """
@@ -219,6 +327,7 @@ class SnowRestSession(object):
             Needs set_auth_type('sso_auth') to have an effect.
         """
         self.oauth_client_id = oauth_client_id
+        self.invalidate_session()
 
     def set_oauth_client_secret(self, oauth_client_secret):
         """
@@ -229,6 +338,7 @@ class SnowRestSession(object):
             An OAuth client secret is sensitive information; please store it as securely as possible.
         """
         self.oauth_client_secret = oauth_client_secret
+        self.invalidate_session()
 
     def set_basic_auth_user(self, basic_auth_user):
         """
@@ -237,6 +347,7 @@ class SnowRestSession(object):
             Needs set_auth_type('basic') to have an effect.
         """
         self.basic_auth_user = basic_auth_user
+        self.invalidate_session()
 
     def set_basic_auth_password(self, basic_auth_password):
         """
@@ -246,6 +357,7 @@ class SnowRestSession(object):
             Needs set_auth_type('basic') to have an effect.
         """
         self.basic_auth_password = basic_auth_password
+        self.invalidate_session()
 
     def set_session_cookie_file_path(self, session_cookie_file_path):
         """
@@ -254,6 +366,7 @@ class SnowRestSession(object):
             If not provided, the cookies will not be persisted.
         """
         self.session_cookie_file_path = session_cookie_file_path
+        self.invalidate_session()
 
     def set_oauth_token_file_path(self, oauth_token_file_path):
         """
@@ -262,6 +375,234 @@ class SnowRestSession(object):
             will be persisted. If not provided, the OAuth tokens will not be persisted.
         """
         self.oauth_token_file_path = oauth_token_file_path
+        self.invalidate_session()
+
+    def set_oauth_token_refresh_margin(self, oauth_token_refresh_margin):
+        """
+        Args:
+            oauth_token_refresh_margin (float): the number of seconds before the expiry of the OAuth access token
+                (as announced by ServiceNow with ``expires_in``) at which the token is refreshed, before
+                performing the next operation. By default, 60 seconds.
+                Needs set_auth_type('sso_auth') to have an effect.
+        """
+        self.oauth_token_refresh_margin = oauth_token_refresh_margin
+
+    def set_pool_connections(self, pool_connections):
+        """
+        Args:
+            pool_connections (int): the number of connection pools (one per host) to cache. By default, 10.
+        """
+        self.pool_connections = pool_connections
+        self._configure_adapter()
+
+    def set_pool_maxsize(self, pool_maxsize):
+        """
+        Args:
+            pool_maxsize (int): the maximum number of connections to keep open to the ServiceNow instance.
+                When sharing this session between several threads, it should be at least the number of threads.
+                By default, 10.
+        """
+        self.pool_maxsize = pool_maxsize
+        self._configure_adapter()
+
+    def set_pool_block(self, pool_block):
+        """
+        Args:
+            pool_block (bool): if True, a thread waits for a free connection when ``pool_maxsize`` connections are
+                in use, instead of opening a connection which will not be kept open. By default, False.
+        """
+        self.pool_block = pool_block
+        self._configure_adapter()
+
+    def set_retry_policy(self, retry_policy):
+        """
+        Args:
+            retry_policy (RetryPolicy): decides whether and when the operations which fail transiently, e.g.
+                with a 503 status code or a connection error, are sent again. By default, they are not.
+                It can also be configured in the ``session`` block of the configuration file with the options
+                ``retry_max_attempts``, ``retry_backoff_base``, ``retry_backoff_max``, ``retry_status_codes``
+                and ``retry_idempotency_key_header``.
+
+        Examples:
+            >>> s = SnowRestSession()
+            >>> s.set_retry_policy(RetryPolicy(max_attempts=5, backoff_max=60))
+        """
+        self.retry_policy = retry_policy
+
+    def set_rate_limiter(self, rate_limiter):
+        """
+        Args:
+            rate_limiter (RateLimiter): limits the rate of the operations sent to ServiceNow, including retries.
+                It can be shared with other sessions. None (default) for no limit.
+                It can also be configured in the ``session`` block of the configuration file with the options
+                ``rate_limit``, ``rate_limit_burst``, ``rate_limit_tables`` and ``rate_limit_lock_directory``.
+
+        Examples:
+            >>> s = SnowRestSession()
+            >>> s.set_rate_limiter(RateLimiter(rate=20, table_rates={'incident': 5}))
+        """
+        self.rate_limiter = rate_limiter
+
+    def set_concurrency_limiter(self, concurrency_limiter):
+        """
+        Args:
+            concurrency_limiter (AdaptiveConcurrencyLimiter): limits the number of operations sent at the same
+                time by the threads using this session, adapting it to the load of the instance.
+                None (default) for no limit.
+                It can also be enabled in the ``session`` block of the configuration file with the option
+                ``adaptive_concurrency: true``, and the options ``adaptive_concurrency_initial_limit``,
+                ``adaptive_concurrency_min_limit`` and ``adaptive_concurrency_max_limit``.
+
+        Examples:
+            >>> s = SnowRestSession()
+            >>> s.set_pool_maxsize(32)
+            >>> s.set_concurrency_limiter(AdaptiveConcurrencyLimiter(max_limit=32))
+        """
+        self.concurrency_limiter = concurrency_limiter
+
+    def set_resolution_cache(self, max_entries, ttl=None):
+        """
+        Configures the cache which remembers the ``sys_id`` and ``sys_class_name`` of the records found
+        by a key, such as ``('number', 'INC0426232')``, so that updating them again, e.g. with ``Record.update``
+        or ``Task.resolve``, does not need to fetch them first.
+        A key is forgotten when the record is not found anymore, or when an update changes the field of the key.
+        By default, there is no resolution cache.
+
+        Args:
+            max_entries (int): the maximum number of keys to remember. 0 disables the cache.
+            ttl (:obj:`float`, optional): the number of seconds a key is remembered. If None, until it is evicted.
+
+        Examples:
+            >>> s = SnowRestSession()
+            >>> s.set_resolution_cache(10000, ttl=3600)
+        """
+        if max_entries:
+            self._resolution_cache = LRUCache(max_entries, ttl)
+        else:
+            self._resolution_cache = None
+
+    def get_resolution_cache(self):
+        """
+        Returns:
+            LRUCache : the cache mapping (table name, field name, field value) to (sys_id, sys_class_name),
+            or None if disabled. See ``set_resolution_cache``.
+        """
+        return self._resolution_cache
+
+    def set_record_cache(self, max_entries, ttl=None, revalidate=False):
+        """
+        Enables a cache of the records fetched with ``Record.get``, keyed by table and ``sys_id``, so that fetching
+        the same record again does not need any request to ServiceNow.
+        The records inserted or updated with this session are refreshed in the cache with the values returned by
+        ServiceNow, but the changes done by others are only seen once the cached records expire.
+        By default, there is no record cache.
+
+        Args:
+            max_entries (int): the maximum number of records to remember. 0 disables the cache.
+            ttl (:obj:`float`, optional): the number of seconds a record is remembered. If None, until it is evicted.
+            revalidate (:obj:`bool`, optional): if True, before returning a cached record, ``Record.get`` fetches
+                only its ``sys_mod_count`` and ``sys_updated_on`` fields, and fetches the whole record again
+                if they changed. By default, False: cached records are returned without any request.
+
+        Examples:
+            >>> s = SnowRestSession()
+            >>> s.set_record_cache(5000, ttl=600)
+            >>> # ... fetch records ...
+            >>> print s.get_record_cache().get_statistics()  # {'hits': 4210, 'misses': 790, ...}
+        """
+        if max_entries:
+            self._record_cache = LRUCache(max_entries, ttl)
+        else:
+            self._record_cache = None
+        self.record_cache_revalidate = revalidate
+
+    def get_record_cache(self):
+        """
+        Returns:
+            LRUCache : the cache mapping (table name, sys_id) to the fields of the records, as returned by ServiceNow,
+            or None if disabled. See ``set_record_cache``.
+        """
+        return self._record_cache
+
+    def set_update_via_base_table(self, update_via_base_table):
+        """
+        Args:
+            update_via_base_table (bool): if True, ``Record.update`` on a record of a base table such as ``task``
+                whose ``sys_class_name`` is not known sends the update to the base table directly, instead of
+                first fetching the ``sys_class_name`` to send it to the table of the record, e.g. ``incident``.
+                Only the fields of the base table can then be updated. By default, False.
+        """
+        self.update_via_base_table = update_via_base_table
+
+    def set_cookie_write_behind(self, cookie_write_behind):
+        """
+        Args:
+            cookie_write_behind (bool): if True, the basic authentication cookie file is not rewritten after every
+                response. Instead, the cookies are marked as changed when ServiceNow sets a different cookie, and
+                the file is written in the background after ``cookie_flush_interval`` seconds, when calling
+                ``.close()`` or when the Python interpreter exits.
+                Needs set_auth_type('basic') to have an effect.
+        """
+        self.cookie_write_behind = bool(cookie_write_behind)
+        if self.cookie_write_behind and not self._flush_at_exit_registered:
+            atexit.register(SnowRestSession._flush_cookies_at_exit, weakref.ref(self))
+            self._flush_at_exit_registered = True
+
+    def set_cookie_flush_interval(self, cookie_flush_interval):
+        """
+        Args:
+            cookie_flush_interval (float): the maximum number of seconds that changed cookies are kept only in
+                memory when ``cookie_write_behind`` is enabled.
+        """
+        self.cookie_flush_interval = cookie_flush_interval
+
+    def flush_cookies(self):
+        """
+        Writes the basic authentication cookie file if the cookies have changed since it was last written.
+        Only needed when ``cookie_write_behind`` is enabled; otherwise the file is written after every response
+        which changes the cookies.
+        """
+        with self._cookie_lock:
+            if self._cookie_flush_timer:
+                self._cookie_flush_timer.cancel()
+                self._cookie_flush_timer = None
+
+            if self._cookie_dirty:
+                self.__write_cookie_file()
+                self._cookie_dirty = False
+
+    def close(self):
+        """
+        Writes any pending cookie changes to the cookie file and closes the underlying ``requests.Session``.
+        With ``log_async``, writes the pending log records.
+        """
+        self.flush_cookies()
+        self.session.close()
+        if self._log_listener:
+            self._log_listener.flush()
+
+    @staticmethod
+    def _flush_cookies_at_exit(session_reference):
+        session = session_reference()
+        if session is not None:
+            session.flush_cookies()
+
+    @staticmethod
+    def _flush_log_at_exit(session_reference):
+        session = session_reference()
+        if session is not None and session._log_listener:
+            session._log_listener.flush()
+
+    def invalidate_session(self):
+        """
+        Discards the authentication state kept in memory (session cookies and OAuth tokens).
+        The next operation will initiate the session again, reading the cookie and token files
+        and logging in if needed.
+
+        The session is invalidated automatically when ServiceNow answers with a 401 status code,
+        or when the session cookies are known to have expired.
+        """
+        self._session_initiated = False
 
     def set_log_enabled(self, log_enabled):
         self._log_enabled = log_enabled
@@ -290,6 +631,17 @@ class SnowRestSession(object):
         self._log_file_encoding = log_file_encoding
         self._configure_handler()
 
+    def set_log_body_max_length(self, log_body_max_length):
+        self._log_body_max_length = log_body_max_length
+
+    def set_log_async(self, log_async):
+        self._log_async = log_async
+        self._configure_handler()
+
+    def set_log_queue_size(self, log_queue_size):
+        self._log_queue_size = log_queue_size
+        self._configure_handler()
+
     def is_logging_enabled(self):
         return self._log_enabled
 
@@ -302,7 +654,7 @@ class SnowRestSession(object):
     def get_log_handler(self):
         return self._log_handler
 
-    def get(self, url, headers=None, params=None):
+    def get(self, url, headers=None, params=None, stream=False):
         """
         Executes a raw GET operation and returns the result.
         Used to read or retrieve information.
@@ -317,6 +669,10 @@ class SnowRestSession(object):
             headers (:obj:`dict`, optional): any additional headers to be be passed. If not set, the 'Accept' header will be set to
                 'application/json'
             params (:obj:`dict`, optional): any additional URL parameters to be be passed
+            stream (:obj:`bool`, optional): if True, the body of the response is not downloaded immediately,
+                but while reading it, e.g. with ``response.iter_content()`` or with a
+                ``cern_snow_client.streaming.ResultStreamParser``. The response should then be closed once read:
+                with a concurrency limiter, the operation counts as in flight until then.
 
         Returns:
             requests.Response : If the status code is not 401, a ``requests.Response`` object is returned.
@@ -354,7 +710,7 @@ class SnowRestSession(object):
             >>>             incident = incident_array[0]
             >>>             print incident['short_description']  # will print "Test" (as a unicode object)
         """
-        result = self.__operation(operation='get', url=url, headers=headers, params=params)
+        result = self.__operation(operation='get', url=url, headers=headers, params=params, stream=stream)
         return result
 
     def post(self, url, headers=None, params=None, data=None):
@@ -536,10 +892,7 @@ class SnowRestSession(object):
                                                     'client_secret': self.oauth_client_secret})
 
             if token_request.status_code == 200:  # token request was successful
-                self.token_dic = json.loads(token_request.text)
-                if self.store_token:
-                    with open(self.oauth_token_file_path, 'w') as token_file:
-                        json.dump(self.token_dic, token_file)
+                self.__set_tokens(json.loads(token_request.text))
 
             else:  # token request failed. Possibly, an existing cookie file contained a timed out session
                 if self.fresh_cookie:  # we just performed a Single-Sign-On. There is a problem with token retrieval.
@@ -555,19 +908,18 @@ class SnowRestSession(object):
                                                             'client_secret': self.oauth_client_secret})
                     self.token_dic = None
                     if token_request.status_code == 200:
-                        self.token_dic = json.loads(token_request.text)
-                        if self.store_token:
-                            with open(self.oauth_token_file_path, 'w') as token_file:
-                                json.dump(self.token_dic, token_file)
-                        else:
-                            raise SnowRestSessionException(
-                                "SnowRestSession.__obtain_tokens: OAuth tokens could not be retrieved from ServiceNow. "
-                                "Please check the OAuth client id and OAuth client secret.")
+                        self.__set_tokens(json.loads(token_request.text))
+                    else:
+                        raise SnowRestSessionException(
+                            "SnowRestSession.__obtain_tokens: OAuth tokens could not be retrieved from ServiceNow. "
+                            "Please check the OAuth client id and OAuth client secret.")
 
         else:  # the tokens file is present. We try to load it
             try:
                 with open(self.oauth_token_file_path, 'r') as token_file:
-                    self.token_dic = json.load(token_file)
+                    token_dic = json.load(token_file)
+                # the access token was issued when the token file was written
+                self.__set_tokens(token_dic, issued_at=os.path.getmtime(self.oauth_token_file_path), store=False)
             except (IOError, ValueError) as e:
                 sys.stderr.write(
                     "SnowRestSession.__obtain_tokens: Issue when opening "
@@ -581,6 +933,8 @@ class SnowRestSession(object):
         Raises:
             SnowRestSessionException: if auth_type is not 'sso_auth' nor 'basic'
         """
+        self._auth_generation += 1
+
         if self.auth_type == 'sso_oauth':
             self.__cern_get_sso_cookie()
             self.__obtain_tokens()
@@ -589,13 +943,117 @@ class SnowRestSession(object):
             self.session.auth = (self.basic_auth_user, self.basic_auth_password)
             self.session.cookies = cookielib.MozillaCookieJar()
             if os.path.exists(self.session_cookie_file_path):
-                self.session.cookies.load(self.session_cookie_file_path, ignore_discard=True, ignore_expires=True)
+                # the expired cookies are skipped: otherwise they would make the session be initiated again
+                # before every operation (see __session_cookies_expired)
+                self.session.cookies.load(self.session_cookie_file_path, ignore_discard=True, ignore_expires=False)
+            self._cookie_fingerprint = self.__cookie_jar_fingerprint()
 
         else:
             raise SnowRestSessionException(
                 "SnowRestSession.__initiate_session: self.auth_type "
                 "has a value different from \"basic\" and \"sso_auth\"")
 
+    def __ensure_session(self):
+        """
+        Initiates the session only if there is no valid authentication state in memory,
+        so that the cookie and token files are not read before every operation.
+        Also refreshes the OAuth access token if it is about to expire.
+
+        Returns:
+            int: the generation of the authentication state which the operation will use. It changes every time
+            the session is initiated or the OAuth tokens change.
+        """
+        if self.__session_needs_initiation() or self.__token_needs_refresh():
+            with self._auth_lock:
+                # only one thread initiates the session or refreshes the token.
+                # The others find a valid authentication state once they get the lock
+                if self.__session_needs_initiation():
+                    # the cookies not written yet would be lost when the cookie file is read again
+                    self.flush_cookies()
+                    self.invalidate_session()
+                    self.__initiate_session()
+                    self._session_initiated = True
+
+                if self.__token_needs_refresh():
+                    self.__refresh_token()
+                    if self.__token_needs_refresh():
+                        # the refresh did not succeed: rely on the 401 status code to reauthenticate
+                        self._token_expires_at = None
+
+        return self._auth_generation
+
+    def __session_needs_initiation(self):
+        return not self._session_initiated or self.__session_cookies_expired()
+
+    def __token_needs_refresh(self):
+        return self.auth_type == 'sso_oauth' and self.__token_about_to_expire()
+
+    def __token_about_to_expire(self):
+        """
+        Returns:
+            bool: True if the expiry time of the OAuth access token is known, and is closer than
+            ``oauth_token_refresh_margin`` seconds
+        """
+        return (
+            self._token_expires_at is not None and
+            time.time() >= self._token_expires_at - self.oauth_token_refresh_margin
+        )
+
+    def __set_tokens(self, token_dic, issued_at=None, store=True):
+        """
+        Keeps in memory the OAuth tokens returned by ServiceNow, computes the absolute expiry time of the access
+        token, and saves the tokens in the token file if needed.
+
+        Args:
+            token_dic (dict): the parsed response of ``/oauth_token.do``
+            issued_at (:obj:`float`, optional): the time when the access token was issued. By default, now.
+            store (:obj:`bool`, optional): if False, the token file is not written
+        """
+        if issued_at is None:
+            issued_at = time.time()
+
+        self.token_dic = token_dic
+        self._token_expires_at = None
+        self._auth_generation += 1
+        if token_dic and 'expires_in' in token_dic:
+            try:
+                self._token_expires_at = issued_at + float(token_dic['expires_in'])
+            except (TypeError, ValueError):
+                pass
+
+        if store and self.store_token and self.oauth_token_file_path:
+            self.__write_file_atomically(
+                self.oauth_token_file_path,
+                lambda temporary_path: self.__dump_tokens(temporary_path, token_dic))
+
+    @staticmethod
+    def __dump_tokens(file_path, token_dic):
+        with open(file_path, 'w') as token_file:
+            json.dump(token_dic, token_file)
+
+    def __session_cookies_expired(self):
+        """
+        Returns:
+            bool: True if any of the cookies in memory has a known expiration date which has passed
+        """
+        for cookie in self.__cookies_snapshot():
+            if cookie.is_expired():
+                return True
+        return False
+
+    def __cookies_snapshot(self):
+        """
+        Returns:
+            list: the cookies in memory. The cookie jar is locked while copying, since other threads
+            may be storing the cookies of their responses at the same time.
+        """
+        cookie_jar = self.session.cookies
+        cookies_lock = getattr(cookie_jar, '_cookies_lock', None)
+        if cookies_lock is None:
+            return list(cookie_jar)
+        with cookies_lock:
+            return list(cookie_jar)
+
     def __refresh_token(self):
         """
         Requests an OAuth access token via the OAUTH refresh token.
@@ -611,9 +1069,7 @@ class SnowRestSession(object):
                                                 'refresh_token': self.token_dic['refresh_token']})
 
         if token_request.status_code == 200:
-            self.token_dic = json.loads(token_request.text)
-            with open(self.oauth_token_file_path, 'w') as token_file:
-                json.dump(self.token_dic, token_file)
+            self.__set_tokens(json.loads(token_request.text))
 
         else:
             token_request = self.session.post(self.instance + '/oauth_token.do',
@@ -621,20 +1077,94 @@ class SnowRestSession(object):
                                                     'client_id': self.oauth_client_id,
                                                     'client_secret': self.oauth_client_secret})
             if token_request.status_code == 200:
-                self.token_dic = json.loads(token_request.text)
-                with open(self.oauth_token_file_path, 'w') as token_file:
-                    json.dump(self.token_dic, token_file)
+                self.__set_tokens(json.loads(token_request.text))
             else:
                 if self.fresh_cookie:
                     raise SnowRestSessionException(
                         "SnowRestSession.__refresh_token: the OAuth client id and OAuth secret might not be valid")
 
-    def __save_cookie_basic(self):
+    def __save_cookie_basic(self, result):
         """
-        Persists the basic authentication cookie file.
+        Persists the basic authentication cookie file, if the response set a different cookie.
+        If ``cookie_write_behind`` is enabled, the file is only marked as changed, and written later
+        by ``flush_cookies``.
+
+        Args:
+            result (requests.Response): the response which may have set new cookies
         """
         self.fresh_cookie = True
-        self.session.cookies.save(self.session_cookie_file_path, ignore_discard=True, ignore_expires=True)
+
+        with self._cookie_lock:
+            if not self.__cookies_changed(result):
+                return
+
+            if not self.cookie_write_behind:
+                self.__write_cookie_file()
+                return
+
+            self._cookie_dirty = True
+            if not self._cookie_flush_timer:
+                self._cookie_flush_timer = threading.Timer(self.cookie_flush_interval, self.flush_cookies)
+                self._cookie_flush_timer.daemon = True
+                self._cookie_flush_timer.start()
+
+    def __cookies_changed(self, result):
+        """
+        Args:
+            result (requests.Response): the last response received, including any redirects
+
+        Returns:
+            bool: True if the response contained a Set-Cookie header which changed the cookies in memory
+        """
+        responses = list(result.history) + [result]
+        if not [response for response in responses if 'Set-Cookie' in response.headers]:
+            return False
+
+        fingerprint = self.__cookie_jar_fingerprint()
+        if fingerprint == self._cookie_fingerprint:
+            return False
+
+        self._cookie_fingerprint = fingerprint
+        return True
+
+    def __cookie_jar_fingerprint(self):
+        return sorted([(cookie.domain, cookie.path, cookie.name, cookie.value, cookie.expires)
+                       for cookie in self.__cookies_snapshot()])
+
+    def __write_cookie_file(self):
+        """
+        Writes the cookies in memory into the cookie file, by means of a temporary file in the same folder
+        which then replaces the cookie file, so that the cookie file is never left half written.
+        The expired cookies are not written.
+        """
+        cookie_jar = self.session.cookies
+        self.__write_file_atomically(
+            self.session_cookie_file_path,
+            lambda temporary_path: cookie_jar.save(temporary_path, ignore_discard=True, ignore_expires=False))
+
+    @staticmethod
+    def __write_file_atomically(file_path, write_function):
+        """
+        Args:
+            file_path (str): the path of the file to (over)write
+            write_function (function): a function which receives the path of a temporary file and writes
+                the contents into it
+        """
+        directory, file_name = os.path.split(os.path.abspath(file_path))
+        file_descriptor, temporary_path = tempfile.mkstemp(prefix='.' + file_name + '.', dir=directory)
+        os.close(file_descriptor)
+
+        try:
+            write_function(temporary_path)
+            try:
+                os.rename(temporary_path, file_path)
+            except OSError:  # on Windows, the destination file cannot exist
+                os.remove(file_path)
+                os.rename(temporary_path, file_path)
+        except Exception:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
 
     @staticmethod
     def __library_user_agent():
@@ -644,7 +1174,7 @@ class SnowRestSession(object):
             user_agent_header = user_agent_header + ' ' + default_headers['User-Agent']
         return user_agent_header
 
-    def __execute(self, operation, url, headers=None, params=None, data=None):
+    def __execute(self, operation, url, headers=None, params=None, data=None, stream=False):
         """
         Executes directly a REST Operation and returns the result
 
@@ -660,6 +1190,7 @@ class SnowRestSession(object):
                 by setting it to the OAuth access header.
             params (:obj:`dict`, optional): any additional URL parameters to be be passed
             data (object): the data to be sent in a post or put operation
+            stream (bool): for a get operation, whether to download the body of the response only when it is read
 
         Returns:
             requests.Response
@@ -678,8 +1209,8 @@ class SnowRestSession(object):
         if not url.startswith('https://'):
             url = self.instance + url
 
-        if not headers:
-            headers = {}
+        # the headers are copied, as the same dict may be used by several threads
+        headers = dict(headers or {})
         if 'User-Agent' not in headers:
             headers['User-Agent'] = self.__library_user_agent()
         if 'Accept' not in headers:
@@ -688,20 +1219,86 @@ class SnowRestSession(object):
             headers['Content-Type'] = 'application/json'
         if self.auth_type == 'sso_oauth':
             headers['Authorization'] = 'Bearer ' + self.token_dic['access_token']
-
-        if operation == 'get':
-            result = self.session.get(url, headers=headers, params=params)
-        elif operation == 'post':
-            result = self.session.post(url, headers=headers, params=params, data=data)
-        elif operation == 'put':
-            result = self.session.put(url, headers=headers, params=params, data=data)
-        else:
+        if operation not in ('get', 'post', 'put'):
             raise SnowRestSessionException("SnowRestSession.__execute: the operation paramater "
                                            "needs to be either \"get\", \"post\" or \"put\"")
 
+        retry_policy = self.retry_policy
+        attempt = 1
+        while True:
+            if self.rate_limiter:
+                self.rate_limiter.acquire(self.instance, url)
+            try:
+                result = self.__send(operation, url, headers, params, data, stream)
+            except retry_policy.retriable_exceptions as e:
+                if not retry_policy.can_retry(operation, headers, attempt):
+                    raise
+                delay = retry_policy.get_delay(attempt)
+                self._warning('SnowRestSession.__execute: %s %s failed (%s), attempt %d, retrying in %.1f seconds',
+                              operation.upper(), url, e, attempt, delay)
+            else:
+                if not (retry_policy.should_retry_response(result) and
+                        retry_policy.can_retry(operation, headers, attempt)):
+                    return result
+                delay = retry_policy.get_delay(attempt, result)
+                self._warning('SnowRestSession.__execute: %s %s returned the status code %d, attempt %d, '
+                              'retrying in %.1f seconds', operation.upper(), url, result.status_code, attempt, delay)
+                # the body of a streamed response needs to be consumed or closed to release the connection
+                result.close()
+
+            time.sleep(delay)
+            attempt += 1
+
+    def __send(self, operation, url, headers, params, data, stream):
+        """
+        Sends a REST operation once, within the limit of the concurrency limiter, if any.
+        A streamed response keeps its place in the limit until it is closed, as its body is downloaded
+        while it is read.
+
+        Returns:
+            requests.Response
+        """
+        concurrency_limiter = self.concurrency_limiter
+        if concurrency_limiter:
+            limited_operation = concurrency_limiter.acquire()
+        try:
+            if operation == 'get':
+                result = self.session.get(url, headers=headers, params=params, stream=stream)
+            elif operation == 'post':
+                result = self.session.post(url, headers=headers, params=params, data=data)
+            else:
+                result = self.session.put(url, headers=headers, params=params, data=data)
+        except Exception:
+            if concurrency_limiter:
+                concurrency_limiter.release(limited_operation, error=True)
+            raise
+
+        if concurrency_limiter:
+            if stream:
+                self.__release_when_closed(result, concurrency_limiter, limited_operation)
+            else:
+                concurrency_limiter.release(limited_operation, status_code=result.status_code)
         return result
 
-    def __operation(self, operation, url, headers=None, params=None, data=None):
+    @staticmethod
+    def __release_when_closed(response, concurrency_limiter, limited_operation):
+        """
+        Makes ``response.close()`` release the operation in the concurrency limiter, only the first time.
+        """
+        close = response.close
+        released = []
+
+        def close_and_release():
+            try:
+                close()
+            finally:
+                if not released:
+                    released.append(True)
+                    concurrency_limiter.release(limited_operation, status_code=response.status_code)
+
+        response.close = close_and_release
+
+    def __operation(self, operation, url, headers=None, params=None, data=None, stream=False):
         """
         Executes a REST Operation, taking care of reauthenticating if needed, and returns the result
 
@@ -715,6 +1312,7 @@ class SnowRestSession(object):
                 default (see __execute method)
             params (:obj:`dict`, optional): any additional URL parameters to be be passed
             data (object): the data to be sent in a post or put operation
+            stream (bool): for a get operation, whether to download the body of the response only when it is read
 
         Returns:
             requests.Response : if the status code is not 401, a requests.Response object is returned
@@ -722,131 +1320,192 @@ class SnowRestSession(object):
         Raises:
             SnowRestSessionException : if the operation could not be performed due to an authentication issue
         """
-        self.__initiate_session()
+        generation = self.__ensure_session()
 
-        result = self.__execute(operation, url, headers=headers, params=params, data=data)
+        result = self.__execute(operation, url, headers=headers, params=params, data=data, stream=stream)
 
         if result.status_code != 401:
             if self.auth_type == 'basic':
-                self.__save_cookie_basic()
+                self.__save_cookie_basic(result)
             return result
 
         else:
-            if self.auth_type == 'basic':
-                if not self.fresh_cookie:
-                    self.session.auth = (self.basic_auth_user, self.basic_auth_password)
-                    result = self.__execute(operation, url, headers=headers, params=params, data=data)
+            # the body of a streamed response needs to be consumed or closed to release the connection
+            result.close()
+            with self._auth_lock:
+                if self._session_initiated and self._auth_generation != generation:
+                    # another thread reauthenticated while this operation was in flight: we only need to retry
+                    result = self.__execute(operation, url, headers=headers, params=params, data=data, stream=stream)
                     if result.status_code != 401:
-                        self.__save_cookie_basic()
+                        if self.auth_type == 'basic':
+                            self.__save_cookie_basic(result)
                         return result
-                    else:
-                        raise SnowRestSessionException(
-                            "SnowRestSession.__operation: Your basic authentication "
-                            "user and password might not be valid")
-                else:
-                    raise SnowRestSessionException(
-                        "SnowRestSession.__operation: Your basic authentication "
-                        "user and password might not be valid")
-
-            elif self.auth_type == 'sso_auth':
 
-                if self.fresh_token:
-                    raise SnowRestSessionException(
-                        "SnowRestSession.__operation: failed to perform the operation. The current account might not "
-                        "be able to log in to ServiceNow or the OAuth client id and secret might not be valid")
+                # the authentication state in memory is not valid anymore. If the recovery below fails,
+                # the next operation will initiate the session from scratch
+                self.invalidate_session()
 
-                else:
-                    self.__refresh_token()
-                    token_request = self.session.post('post', self.instance + '/oauth_token.do',
-                                                      data={'grant_type': 'password',
-                                                            'client_id': self.oauth_client_id,
-                                                            'client_secret': self.oauth_client_secret})
-                    if token_request.status_code == 200:
-                        self.token_dic = json.loads(token_request.text)
-                        with open(self.oauth_token_file_path, 'w') as token_file:
-                            json.dump(self.token_dic, token_file)
-                        headers['Authorization'] = 'Bearer ' + self.token_dic['access_token']
-                        result = self.__execute(operation, url, headers=headers, params=params, data=data)
+                if self.auth_type == 'basic':
+                    if not self.fresh_cookie:
+                        self.session.auth = (self.basic_auth_user, self.basic_auth_password)
+                        result = self.__execute(operation, url, headers=headers, params=params, data=data,
+                                                stream=stream)
                         if result.status_code != 401:
+                            self._session_initiated = True
+                            self.__save_cookie_basic(result)
                             return result
                         else:
                             raise SnowRestSessionException(
-                                "SnowRestSession.__operation: failed to perform the operation. "
-                                "The current account might not be able to log in to ServiceNow or "
-                                "the OAuth client id and secret might not be valid")
+                                "SnowRestSession.__operation: Your basic authentication "
+                                "user and password might not be valid")
+                    else:
+                        raise SnowRestSessionException(
+                            "SnowRestSession.__operation: Your basic authentication "
+                            "user and password might not be valid")
+
+                elif self.auth_type == 'sso_oauth':
+
+                    if self.fresh_token:
+                        raise SnowRestSessionException(
+                            "SnowRestSession.__operation: failed to perform the operation. The current account "
+                            "might not be able to log in to ServiceNow or the OAuth client id and secret might not "
+                            "be valid")
 
                     else:
-                        if self.fresh_cookie:
-                            raise SnowRestSessionException(
-                                "SnowRestSession.__operation: OAuth tokens could not be retrieved from ServiceNow. "
-                                "Please check the OAuth client id and OAuth client secret.")
+                        self.__refresh_token()
+                        token_request = self.session.post(self.instance + '/oauth_token.do',
+                                                          data={'grant_type': 'password',
+                                                                'client_id': self.oauth_client_id,
+                                                                'client_secret': self.oauth_client_secret})
+                        if token_request.status_code == 200:
+                            self.__set_tokens(json.loads(token_request.text))
+                            result = self.__execute(operation, url, headers=headers, params=params, data=data,
+                                                    stream=stream)
+                            if result.status_code != 401:
+                                self._session_initiated = True
+                                return result
+                            else:
+                                raise SnowRestSessionException(
+                                    "SnowRestSession.__operation: failed to perform the operation. "
+                                    "The current account might not be able to log in to ServiceNow or "
+                                    "the OAuth client id and secret might not be valid")
+
                         else:
-                            os.remove(self.session_cookie_file_path)
-                            self.__cern_get_sso_cookie()
-                            token_request = self.session.post('post', self.instance + '/oauth_token.do',
-                                                              data={'grant_type': 'password',
-                                                                    'client_id': self.oauth_client_id,
-                                                                    'client_secret': self.oauth_client_secret})
-                            if token_request.status_code == 401:
+                            if self.fresh_cookie:
                                 raise SnowRestSessionException(
                                     "SnowRestSession.__operation: OAuth tokens could not be retrieved from ServiceNow. "
                                     "Please check the OAuth client id and OAuth client secret.")
                             else:
-                                self.token_dic = json.loads(token_request.text)
-                                with open(self.oauth_token_file_path, 'w') as token_file:
-                                    json.dump(self.token_dic, token_file)
-                                headers['Authorization'] = 'Bearer ' + self.token_dic['access_token']
-                                result = self.__execute(operation, url, headers=headers, params=params,
-                                                        data=data)
-                                if result.status_code != 401:
-                                    return result
-                                else:
+                                if os.path.exists(self.session_cookie_file_path):
+                                    os.remove(self.session_cookie_file_path)
+                                self.__cern_get_sso_cookie()
+                                token_request = self.session.post(self.instance + '/oauth_token.do',
+                                                                  data={'grant_type': 'password',
+                                                                        'client_id': self.oauth_client_id,
+                                                                        'client_secret': self.oauth_client_secret})
+                                if token_request.status_code == 401:
                                     raise SnowRestSessionException(
-                                        "SnowRestSession.__operation: failed to perform the operation. "
-                                        "The current account might not be able to log in to ServiceNow or "
-                                        "the OAuth client id and secret might not be valid")
-            else:
-                raise SnowRestSessionException(
-                    "SnowRestSession.__operation: self.auth_type has a value different from \"basic\" and \"sso_auth\"")
+                                        "SnowRestSession.__operation: OAuth tokens could not be retrieved "
+                                        "from ServiceNow. Please check the OAuth client id and OAuth client secret.")
+                                else:
+                                    self.__set_tokens(json.loads(token_request.text))
+                                    result = self.__execute(operation, url, headers=headers, params=params,
+                                                            data=data, stream=stream)
+                                    if result.status_code != 401:
+                                        self._session_initiated = True
+                                        return result
+                                    else:
+                                        raise SnowRestSessionException(
+                                            "SnowRestSession.__operation: failed to perform the operation. "
+                                            "The current account might not be able to log in to ServiceNow or "
+                                            "the OAuth client id and secret might not be valid")
+                else:
+                    raise SnowRestSessionException(
+                        "SnowRestSession.__operation: self.auth_type has a value different from "
+                        "\"basic\" and \"sso_auth\"")
+
+    def _configure_adapter(self):
+        self.session.mount('https://', HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=self.pool_block))
 
     def _configure_handler(self):
         self._logger.removeHandler(self._log_handler)
+        if self._log_listener:
+            # the records already queued are written by the previous file handler
+            self._log_listener.stop()
+            self._log_listener = None
 
         file_handler_attributes_known = bool(
             self._log_file_path and self._log_file_size_bytes and self._log_file_rotations
             and self._log_file_encoding and self._log_format)
 
         if file_handler_attributes_known:
-            self._log_handler = RotatingFileHandler(
+            file_handler = RotatingFileHandler(
                 self._log_file_path,
                 maxBytes=self._log_file_size_bytes,
                 backupCount=self._log_file_rotations - 1,
                 encoding=self._log_file_encoding)
-            self._log_handler.setFormatter(logging.Formatter(self._log_format))
+            file_handler.setFormatter(logging.Formatter(self._log_format))
+
+            if self._log_async:
+                # the file is written and rotated in a background thread, not in the threads doing requests
+                queue = Queue.Queue(self._log_queue_size)
+                self._log_handler = QueueHandler(queue)
+                self._log_listener = QueueListener(queue, file_handler)
+                self._log_listener.start()
+                if not self._log_flush_at_exit_registered:
+                    atexit.register(SnowRestSession._flush_log_at_exit, weakref.ref(self))
+                    self._log_flush_at_exit_registered = True
+            else:
+                self._log_handler = file_handler
 
         else:
             self._log_handler = NullHandler()
 
         self._logger.addHandler(self._log_handler)
 
-    def _debug(self, message):
-        self._log(logging.DEBUG, message)
+    def _debug(self, message, *args):
+        self._log(logging.DEBUG, message, *args)
 
-    def _info(self, message):
-        self._log(logging.INFO, message)
+    def _info(self, message, *args):
+        self._log(logging.INFO, message, *args)
 
-    def _warning(self, message):
-        self._log(logging.WARNING, message)
+    def _warning(self, message, *args):
+        self._log(logging.WARNING, message, *args)
 
-    def _error(self, message):
-        self._log(logging.ERROR, message)
+    def _error(self, message, *args):
+        self._log(logging.ERROR, message, *args)
 
-    def _critical(self, message):
-        self._log(logging.CRITICAL, message)
+    def _critical(self, message, *args):
+        self._log(logging.CRITICAL, message, *args)
 
-    def _log(self, level, message):
-        if self._log_enabled:
-            self._logger.log(level, message)
+    def _log(self, level, message, *args):
+        """
+        Logs a message, if logging is enabled for that level. The message is only formatted with the ``args``,
+        ``%``-style, when it is actually logged.
+        """
+        if self._is_log_enabled_for(level):
+            self._logger.log(level, message, *args)
+
+    def _is_log_enabled_for(self, level):
+        """
+        Returns:
+            bool: True if the messages of that level are logged. Messages expensive to build, such as those
+            containing the body of a response, should only be built if this is True.
+        """
+        return self._log_enabled and self._logger.isEnabledFor(level)
+
+    def _truncate_log_body(self, body):
+        """
+        Returns:
+            unicode: the body of a request or response, truncated to ``log_body_max_length`` characters
+            to be logged
+        """
+        if self._log_body_max_length is None or len(body) <= self._log_body_max_length:
+            return body
+        return body[:self._log_body_max_length] + '... (%d characters more)' % (len(body) - self._log_body_max_length)
 
 
 class SnowRestSessionException(SnowClientException):
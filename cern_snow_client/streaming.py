@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the cern-snow-client library.
+# Copyright (c) 2017 CERN
+# Authors:
+#  - James Clerc <james.clerc@cern.ch> <james.clerc@epitech.eu>
+#  - David Martin Clavo <david.martin.clavo@cern.ch>
+#
+# The cern-snow-client library is free software; you can redistribute it
+# and/or modify it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# The cern-snow-client library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with the cern-snow-client library.  If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+import codecs
+import json
+import re
+
+try:  # optional, faster incremental JSON parser
+    import ijson
+except ImportError:
+    ijson = None
+
+
+class ResultStreamParser(object):
+    """
+    An iterable which parses incrementally the JSON body of a ServiceNow REST API response, while it is being
+    downloaded, and returns one by one the elements of its top-level ``result`` array.
+    Only the element being parsed and a chunk of the body are kept in memory, instead of the whole body,
+    its decoded text and the whole parsed result.
+
+    The ``ijson`` package is used if it is installed. Otherwise, the elements are parsed with the standard
+    ``json`` module, one at a time.
+
+    Args:
+        response (requests.Response): a response obtained with ``stream=True``, whose body has not been read yet.
+            It is closed once the body has been parsed.
+        chunk_size (:obj:`int`, optional): the number of bytes read at a time
+        use_ijson (:obj:`bool`, optional): whether to use the ``ijson`` package. By default, if it is installed.
+
+    Raises:
+        ValueError : while iterating, if the body is not valid JSON
+
+    Examples:
+        >>> response = s.get('/api/now/v2/table/incident?sysparm_query=active=true', stream=True)
+        >>> for incident in ResultStreamParser(response):  # each incident is a dict
+        >>>     print incident['number']
+    """
+
+    chunk_size = 64 * 1024
+
+    whitespace_pattern = re.compile(r'[ \t\n\r]*')
+
+    def __init__(self, response, chunk_size=None, use_ijson=None):
+        self._response = response
+        self._chunk_size = chunk_size or self.chunk_size
+        if use_ijson is None:
+            use_ijson = ijson is not None
+        self._use_ijson = use_ijson
+        self._item_count = 0
+        self._last_item = None
+
+        self.__items = None
+        self.__chunks = None
+        self.__text_decoder = None
+        self.__buffer = u''
+        self.__position = 0
+        self.__eof = False
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        """
+        Returns:
+            object : the next element of the ``result`` array, usually a dict
+        """
+        if self.__items is None:
+            if self._use_ijson:
+                self.__items = self.__iter_items_with_ijson()
+            else:
+                self.__items = self.__iter_items_with_json()
+
+        item = next(self.__items)
+        self._item_count += 1
+        self._last_item = item
+        return item
+
+    def close(self):
+        """
+        Stops the parsing and closes the response.
+        """
+        if self.__items is not None:
+            self.__items.close()
+        self._response.close()
+
+    def get_item_count(self):
+        """
+        Returns:
+            int : the number of elements returned so far
+        """
+        return self._item_count
+
+    def get_last_item(self):
+        """
+        Returns:
+            object : the last element returned so far, or None
+        """
+        return self._last_item
+
+    def __iter_chunks(self):
+        return self._response.iter_content(chunk_size=self._chunk_size)
+
+    def __iter_items_with_ijson(self):
+        try:
+            for item in ijson.items(_ChunkReader(self.__iter_chunks()), 'result.item'):
+                yield item
+        finally:
+            self._response.close()
+
+    def __iter_items_with_json(self):
+        self.__chunks = self.__iter_chunks()
+        self.__text_decoder = codecs.getincrementaldecoder(self._response.encoding or 'utf-8')()
+        decoder = json.JSONDecoder()
+
+        try:
+            self.__expect(u'{')
+            while True:
+                character = self.__peek()
+                if character == u'}':
+                    break
+                elif character == u',':
+                    self.__position += 1
+                    continue
+
+                key = self.__decode(decoder)
+                self.__expect(u':')
+
+                if key == u'result' and self.__peek() == u'[':
+                    self.__position += 1
+                    while True:
+                        character = self.__peek()
+                        if character == u']':
+                            self.__position += 1
+                            break
+                        elif character == u',':
+                            self.__position += 1
+                            continue
+                        yield self.__decode(decoder)
+                else:
+                    # any other value is parsed and ignored
+                    self.__decode(decoder)
+        finally:
+            self._response.close()
+
+    def __fill(self):
+        """
+        Reads the next chunk of the body into the buffer.
+
+        Returns:
+            bool: False if the end of the body has been reached
+        """
+        if self.__eof:
+            return False
+
+        # the text already parsed is dropped
+        if self.__position > len(self.__buffer) // 2:
+            self.__buffer = self.__buffer[self.__position:]
+            self.__position = 0
+
+        for chunk in self.__chunks:
+            text = self.__text_decoder.decode(chunk)
+            if text:
+                self.__buffer += text
+                return True
+
+        self.__buffer += self.__text_decoder.decode(b'', True)
+        self.__eof = True
+        return False
+
+    def __peek(self):
+        """
+        Returns:
+            unicode: the next non whitespace character, without consuming it
+
+        Raises:
+            ValueError : if the end of the body has been reached
+        """
+        while True:
+            self.__position = self.whitespace_pattern.match(self.__buffer, self.__position).end()
+            if self.__position < len(self.__buffer):
+                return self.__buffer[self.__position]
+            if not self.__fill():
+                raise ValueError('ResultStreamParser: unexpected end of the JSON body')
+
+    def __expect(self, character):
+        if self.__peek() != character:
+            raise ValueError('ResultStreamParser: expected ' + repr(character) + ' at position ' +
+                             str(self.__position) + ' of the JSON body')
+        self.__position += 1
+
+    def __decode(self, decoder):
+        """
+        Returns:
+            object: the next JSON value, reading more chunks until it is complete
+        """
+        self.__peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.__buffer, idx=self.__position)
+            except ValueError:
+                if not self.__fill():
+                    raise
+                continue
+
+            # a number at the end of the buffer might continue in the next chunk
+            if end == len(self.__buffer) and self.__fill():
+                continue
+
+            self.__position = end
+            return value
+
+
+class _ChunkReader(object):
+    """
+    A minimal file-like object over an iterator of byte chunks, as needed by ``ijson``.
+    """
+
+    def __init__(self, chunks):
+        self.__chunks = chunks
+        self.__buffer = b''
+
+    def read(self, size=-1):
+        if size < 0:
+            data, self.__buffer = self.__buffer + b''.join(self.__chunks), b''
+            return data
+
+        while not self.__buffer:
+            chunk = next(self.__chunks, None)
+            if chunk is None:
+                return b''
+            self.__buffer = chunk
+
+        data, self.__buffer = self.__buffer[:size], self.__buffer[size:]
+        return data
@@ -155,6 +155,17 @@ class Task(Record):
             >>> t = Task(s)  # s is a SnowRestSession object
             >>> t.take_in_progress(key=('number', 'INC0426232'))
         """
+        self._set_take_in_progress_values(key)
+        result = self.update()
+        if not result and key:
+            self._forget_key(key)
+        return result
+
+    def _set_take_in_progress_values(self, key=None):
+        """
+        Sets the fields needed to take the task in progress, without sending them to ServiceNow.
+        See ``take_in_progress``.
+        """
 
         # if an incident, make : incident_state=3
         # if an request, make : u_current_task_state=4
@@ -171,18 +182,15 @@ class Task(Record):
 
         if not self.sys_class_name:
             if key:
-                self.get(key)
+                self._resolve_key(key)
             elif self.sys_id:
-                self.get(self.sys_id)
+                self._resolve_key(self.sys_id)
 
         if self.sys_class_name == 'incident':
             self.incident_state = '3'
         elif self.sys_class_name == 'u_request_fulfillment':
             self.u_current_task_state = '4'
 
-        result = self.update()
-        return result
-
     def resolve(self, solution, close_code=None, key=None):
         """
         Resolves a Task in ServiceNow.
@@ -216,6 +224,16 @@ class Task(Record):
             >>> t = Task(s)  # s is a SnowRestSession object
             >>> t.resolve('New comment', close_code='Works as designed', key=('number', 'INC0426232'))
         """
+        self._set_resolve_values(solution, close_code, key)
+        result = self.update()
+        if not result and key:
+            self._forget_key(key)
+        return result
+
+    def _set_resolve_values(self, solution, close_code=None, key=None):
+        """
+        Sets the fields needed to resolve the task, without sending them to ServiceNow. See ``resolve``.
+        """
 
         # if an incident, make : incident_state=6, comments=solution, u_close_code=close_code
         # if a request, make : u_current_task_state=9, comments=solution, u_close_code=close_code
@@ -233,9 +251,9 @@ class Task(Record):
 
         if not self.sys_class_name:
             if key:
-                self.get(key)
+                self._resolve_key(key)
             elif self.sys_id:
-                self.get(self.sys_id)
+                self._resolve_key(self.sys_id)
 
         if not close_code:
             if self.sys_class_name == 'incident':
@@ -251,8 +269,6 @@ class Task(Record):
             self.u_current_task_state = '9'
 
         self.comments = solution
-        result = self.update()
-        return result
 
 
 class TaskQuery(RecordQuery):
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the cern-snow-client library.
+# Copyright (c) 2017 CERN
+# Authors:
+#  - James Clerc <james.clerc@cern.ch> <james.clerc@epitech.eu>
+#  - David Martin Clavo <david.martin.clavo@cern.ch>
+#
+# The cern-snow-client library is free software; you can redistribute it
+# and/or modify it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# The cern-snow-client library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with the cern-snow-client library.  If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+import threading
+
+from common import SnowClientException
+from pool import WorkerPool
+
+
+class ThreadedSnowRestSession(object):
+    """
+    A thread pool facade over a SnowRestSession: each operation is executed by one of the threads of a WorkerPool,
+    so that many operations can be in flight at the same time without blocking the caller.
+    Each operation immediately returns a SnowFuture, whose ``.result()`` waits for and returns the result.
+
+    The operations themselves are not asynchronous: each of them blocks its thread until ServiceNow answers,
+    as Python 2 has no asyncio. The number of operations in flight is bounded by the number of threads.
+
+    All the operations share the authentication state of the wrapped SnowRestSession (cookie file, OAuth token
+    file or basic authentication), which is initiated only once.
+
+    Args:
+        session (SnowRestSession): a configured cern_snow_client.session.SnowRestSession object
+        max_concurrency (:obj:`int`, optional): the maximum number of operations executed at the same time.
+            By default, 10.
+        max_pending (:obj:`int`, optional): the maximum number of operations submitted and not yet finished.
+            When it is reached, submitting a new operation waits until another operation finishes.
+            By default, 10 times ``max_concurrency``.
+
+    Raises:
+        SnowClientException : if any of the parameters is set incorrectly
+
+    Examples:
+        Executing low level operations:
+
+        >>> a = ThreadedSnowRestSession(s, max_concurrency=16)  # s is a SnowRestSession object
+        >>> futures = [a.get('/api/now/v2/table/incident/' + sys_id) for sys_id in sys_ids]
+        >>> responses = [future.result() for future in futures]
+
+        Executing high level operations of Record, RecordQuery, Task... objects:
+
+        >>> with ThreadedSnowRestSession(s, max_concurrency=16) as a:
+        >>>     futures = []
+        >>>     for number in numbers:
+        >>>         inc = Incident(a.get_session())
+        >>>         futures.append(a.submit(inc.add_comment, 'New comment', key=('number', number)))
+        >>>     updated = [future.result() for future in futures]
+    """
+
+    def __init__(self, session, max_concurrency=10, max_pending=None):
+        if not session:
+            raise SnowClientException('ThreadedSnowRestSession.__init__: To create a ThreadedSnowRestSession instance '
+                                      'you need to provide a non-empty SnowRestSession object.')
+        if not max_pending:
+            max_pending = max_concurrency * 10
+        if max_pending < max_concurrency:
+            raise SnowClientException('ThreadedSnowRestSession.__init__: max_pending cannot be lower than '
+                                      'max_concurrency.')
+
+        self._session = session
+        self._pool = WorkerPool(max_concurrency)
+        self._pending = threading.BoundedSemaphore(max_pending)
+
+        # every thread should be able to keep its connection open
+        if session.pool_maxsize < max_concurrency:
+            session.set_pool_maxsize(max_concurrency)
+
+    def get(self, url, headers=None, params=None):
+        """
+        Executes in the background a raw GET operation. See SnowRestSession.get
+
+        Returns:
+            SnowFuture : the future requests.Response object
+        """
+        return self.submit(self._session.get, url, headers=headers, params=params)
+
+    def post(self, url, headers=None, params=None, data=None):
+        """
+        Executes in the background a raw POST operation. See SnowRestSession.post
+
+        Returns:
+            SnowFuture : the future requests.Response object
+        """
+        return self.submit(self._session.post, url, headers=headers, params=params, data=data)
+
+    def put(self, url, headers=None, params=None, data=None):
+        """
+        Executes in the background a raw PUT operation. See SnowRestSession.put
+
+        Returns:
+            SnowFuture : the future requests.Response object
+        """
+        return self.submit(self._session.put, url, headers=headers, params=params, data=data)
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Executes in the background any function, typically a high level operation such as ``Record.get``,
+        ``Record.insert``, ``Record.update``, ``RecordQuery.query``, ``Task.add_comment`` or ``Task.resolve``.
+        The objects involved should have been built with the session returned by ``.get_session()``.
+        A Record object should not be used by several operations at the same time.
+
+        Returns:
+            SnowFuture : the future value returned by the function
+        """
+        self._pending.acquire()
+        try:
+            future = self._pool.submit(function, *args, **kwargs)
+        except Exception:
+            self._pending.release()
+            raise
+        future.add_done_callback(self.__release_pending)
+        return future
+
+    def get_session(self):
+        """
+        Returns:
+            SnowRestSession : The session used to communicate with ServiceNow
+        """
+        return self._session
+
+    def close(self, wait=True):
+        """
+        Stops accepting operations. The wrapped SnowRestSession is not closed.
+
+        Args:
+            wait (:obj:`bool`, optional): if True (default), waits until the operations already submitted finish
+        """
+        self._pool.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close(wait=True)
+        return False
+
+    def __release_pending(self, future):
+        self._pending.release()
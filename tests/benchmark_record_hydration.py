@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the cern-snow-client library.
+# Copyright (c) 2017 CERN
+# Authors:
+#  - James Clerc <james.clerc@cern.ch> <james.clerc@epitech.eu>
+#  - David Martin Clavo <david.martin.clavo@cern.ch>
+#
+# The cern-snow-client library is free software; you can redistribute it
+# and/or modify it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# The cern-snow-client library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with the cern-snow-client library.  If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""
+Micro-benchmark of the hydration of a Record (``Record._set_values``) with a 200-field incident row.
+It compares the method protection done with ``dir(self)`` for every field to the per-class set of
+protected names, and the eager building of the RecordField objects to the lazy one.
+
+Usage (from the root of the repository):
+
+    python -m tests.benchmark_record_hydration
+"""
+
+import inspect
+import timeit
+
+from cern_snow_client.incident import Incident
+from cern_snow_client.record import RecordField
+from cern_snow_client.session import SnowRestSession
+
+
+def make_incident_row(field_count=200):
+    row = {
+        'sys_id': '0a0a8c0a015a591ddbed3676ea56fb21',
+        'sys_class_name': {'value': 'incident', 'display_value': 'Incident'},
+        'number': {'value': 'INC0426232', 'display_value': 'INC0426232'},
+    }
+    for i in range(field_count - len(row)):
+        if i % 4 == 0:
+            row['u_reference_%d' % i] = {
+                'value': 'ea56fb210a0a8c0a015a591ddbed3676',
+                'display_value': 'IT Service Management Support',
+                'link': 'https://cerntest.service-now.com/api/now/v2/table/u_cmdb_ci_functional_services/'
+                        'ea56fb210a0a8c0a015a591ddbed3676'
+            }
+        else:
+            row['u_field_%d' % i] = {'value': str(i), 'display_value': 'Value %d' % i}
+    return row
+
+
+def set_values_with_dir(record, values):
+    """
+    The previous implementation of ``Record._set_values``: a call to ``dir(self)`` for every field,
+    and a RecordField built for every field.
+    """
+    for key in values:
+        if key.startswith('_'):
+            continue
+        elif key in dir(record) and inspect.ismethod(record.__getattribute__(key)):
+            continue
+        object.__setattr__(record, key, RecordField(values[key]))
+
+
+def main(number=200):
+    session = SnowRestSession()
+    row = make_incident_row()
+
+    def hydrate_with_dir():
+        set_values_with_dir(Incident(session), row)
+
+    def hydrate():
+        Incident(session)._set_values(row)
+
+    def hydrate_and_read_all_fields():
+        record = Incident(session)
+        record._set_values(row)
+        for key in row:
+            getattr(record, key)
+
+    previous = min(timeit.repeat(hydrate_with_dir, repeat=3, number=number)) / number
+    results = [
+        ('dir(self) per field, eager RecordField', previous),
+        ('protected names set, lazy RecordField', min(timeit.repeat(hydrate, repeat=3, number=number)) / number),
+        ('protected names set, all fields read', min(timeit.repeat(hydrate_and_read_all_fields, repeat=3,
+                                                                   number=number)) / number),
+    ]
+
+    print('Hydration of a %d-field incident row:' % len(row))
+    for name, duration in results:
+        print('  %-42s %9.1f us/record  x%.1f' % (name, duration * 1e6, previous / duration))
+
+
+if __name__ == '__main__':
+    main()
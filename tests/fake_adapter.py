@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the cern-snow-client library.
+# Copyright (c) 2017 CERN
+# Authors:
+#  - James Clerc <james.clerc@cern.ch> <james.clerc@epitech.eu>
+#  - David Martin Clavo <david.martin.clavo@cern.ch>
+#
+# The cern-snow-client library is free software; you can redistribute it
+# and/or modify it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# The cern-snow-client library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with the cern-snow-client library.  If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+import requests
+from requests.adapters import BaseAdapter
+
+
+class FakeHeaders(object):
+    """
+    The minimal interface of an httplib.HTTPMessage needed by cookielib to extract cookies.
+    """
+
+    def __init__(self, set_cookies):
+        self.set_cookies = set_cookies
+
+    def getheaders(self, name):
+        if name.lower() == 'set-cookie':
+            return list(self.set_cookies)
+        return []
+
+    def get_all(self, name, default=None):
+        return self.getheaders(name) or default
+
+
+class FakeRaw(object):
+
+    def __init__(self, set_cookies):
+        self._original_response = self
+        self.msg = FakeHeaders(set_cookies)
+
+
+class FakeAdapter(BaseAdapter):
+    """
+    A requests transport adapter which does not perform any network access.
+    Each call to ``send`` returns the next canned response, and the prepared requests are recorded,
+    so that the behaviour of a SnowRestSession can be tested without a ServiceNow instance.
+    Alternatively, a responder function can compute the response of each request: it receives the prepared
+    request and returns a tuple (status_code, text, headers, set_cookies).
+    """
+
+    def __init__(self, responses=None, responder=None):
+        super(FakeAdapter, self).__init__()
+        self.responder = responder
+        self.responses = []
+        for response in responses or []:
+            self.add_response(*response)
+        self.requests = []
+        self.streams = []
+
+    def add_response(self, status_code=200, text='{"result": []}', headers=None, set_cookies=None):
+        self.responses.append((status_code, text, headers, set_cookies))
+
+    def send(self, request, **kwargs):
+        self.requests.append(request)
+        self.streams.append(kwargs.get('stream'))
+        if self.responder:
+            status_code, text, headers, set_cookies = self.responder(request)
+        elif self.responses:
+            status_code, text, headers, set_cookies = self.responses.pop(0)
+        else:
+            status_code, text, headers, set_cookies = 200, '{"result": []}', None, None
+
+        headers = dict(headers or {})
+        if set_cookies:
+            headers['Set-Cookie'] = ', '.join(set_cookies)
+
+        response = requests.Response()
+        response.status_code = status_code
+        response._content = text.encode('utf-8') if isinstance(text, unicode) else text
+        response._content_consumed = True
+        response.encoding = 'utf-8'
+        response.headers = requests.structures.CaseInsensitiveDict(headers)
+        response.raw = FakeRaw(set_cookies or [])
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+    @classmethod
+    def mount_on(cls, snow_session, responses=None, responder=None):
+        adapter = cls(responses, responder)
+        snow_session.session.mount('https://', adapter)
+        return adapter
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the cern-snow-client library.
+# Copyright (c) 2017 CERN
+# Authors:
+#  - James Clerc <james.clerc@cern.ch> <james.clerc@epitech.eu>
+#  - David Martin Clavo <david.martin.clavo@cern.ch>
+#
+# The cern-snow-client library is free software; you can redistribute it
+# and/or modify it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# The cern-snow-client library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with the cern-snow-client library.  If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+
+import base64
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from cern_snow_client.batch import RecordBatch
+from cern_snow_client.common import SnowClientException
+from cern_snow_client.incident import Incident
+from cern_snow_client.session import SnowRestSession
+from cern_snow_client.task import Task
+from tests.fake_adapter import FakeAdapter
+
+
+class TestBatch(unittest.TestCase):
+    """
+    Tests of the RecordBatch class, with a FakeAdapter which implements a minimal ServiceNow Batch API.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        s = SnowRestSession()
+        s.set_instance('cerntest.service-now.com')
+        s.auth_type = 'basic'
+        s.set_basic_auth_user('user')
+        s.set_basic_auth_password('password')
+        s.set_session_cookie_file_path(os.path.join(self.directory, 'basic_cookie.txt'))
+        self.session = s
+        self.adapter = FakeAdapter.mount_on(s, responder=self.respond)
+        self.batch_requests = []
+        self.failing_urls = set()
+        self.unparsable_urls = set()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def respond(self, request):
+        """
+        Executes each operation of a batch request: an insert returns a new sys_id, an update returns
+        the sys_id of its URL. The sent fields are returned as values.
+        """
+        batch_request = json.loads(request.body)
+        self.batch_requests.append(batch_request)
+
+        serviced_requests = []
+        for rest_request in batch_request['rest_requests']:
+            url = rest_request['url'].split('?')[0]
+            if url in self.failing_urls:
+                body = {'error': {'message': 'Operation Failed'}}
+                status_code = 403
+            elif url in self.unparsable_urls:
+                body = None
+                status_code = 200
+            else:
+                values = json.loads(base64.b64decode(rest_request['body']))
+                if rest_request['method'] == 'POST':
+                    values['sys_id'] = 'new_sys_id_' + rest_request['id']
+                    status_code = 201
+                else:
+                    values['sys_id'] = url.split('/')[-1]
+                    status_code = 200
+                values['sys_class_name'] = 'incident'
+                body = {'result': values}
+            serviced_requests.append({
+                'id': rest_request['id'],
+                'status_code': status_code,
+                'body': base64.b64encode(json.dumps(body) if body else '<html>Not JSON</html>'),
+            })
+
+        return 200, json.dumps({'batch_request_id': batch_request['batch_request_id'],
+                                'serviced_requests': serviced_requests}), None, None
+
+    def test_insert_and_update(self):
+        inc1 = Incident(self.session, {'short_description': 'New incident'})
+        inc2 = Incident(self.session)
+        inc2.comments = 'New comment'
+
+        batch = RecordBatch(self.session)
+        batch.insert(inc1)
+        self.assertTrue(batch.update(inc2, key='existing_sys_id'))
+        self.assertEquals(batch.get_pending_count(), 2)
+        self.assertEquals(len(self.adapter.requests), 0)
+
+        self.assertEquals(batch.execute(), [True, True])
+        self.assertEquals(batch.get_status_codes(), [201, 200])
+        self.assertEquals(batch.get_pending_count(), 0)
+        self.assertEquals(len(self.adapter.requests), 1)
+        self.assertTrue(self.adapter.requests[0].url.endswith('/api/now/v1/batch'))
+
+        rest_requests = self.batch_requests[0]['rest_requests']
+        self.assertEquals(rest_requests[0]['method'], 'POST')
+        self.assertEquals(rest_requests[0]['url'], '/api/now/v2/table/incident?sysparm_display_value=all')
+        self.assertEquals(rest_requests[1]['method'], 'PUT')
+        self.assertEquals(rest_requests[1]['url'],
+                          '/api/now/v2/table/incident/existing_sys_id?sysparm_display_value=all')
+
+        self.assertEquals(inc1.sys_id, 'new_sys_id_0')
+        self.assertEquals(inc1.short_description, 'New incident')
+        self.assertEquals(inc1.get_changed_fields(), {})
+        self.assertEquals(inc2.sys_id, 'existing_sys_id')
+        self.assertEquals(inc2.comments, 'New comment')
+
+    def test_chunks_and_failures(self):
+        self.failing_urls.add('/api/now/v2/table/incident/sys_id_3')
+
+        records = []
+        with RecordBatch(self.session, chunk_size=2) as batch:
+            for i in range(5):
+                record = Incident(self.session)
+                record.comments = 'Comment ' + str(i)
+                batch.update(record, key='sys_id_' + str(i))
+                records.append(record)
+
+        self.assertEquals(len(self.adapter.requests), 3)
+        self.assertEquals(batch.get_status_codes(), [200, 200, 200, 403, 200])
+        self.assertEquals([record.get_changed_fields() for record in records][3], {'comments': 'Comment 3'})
+        self.assertEquals(records[4].sys_id, 'sys_id_4')
+
+    def test_unparsable_result(self):
+        self.unparsable_urls.add('/api/now/v2/table/incident/sys_id_1')
+
+        records = []
+        batch = RecordBatch(self.session)
+        for i in range(3):
+            record = Incident(self.session)
+            record.comments = 'Comment ' + str(i)
+            batch.update(record, key='sys_id_' + str(i))
+            records.append(record)
+
+        self.assertEquals(batch.execute(), [True, False, True])
+        self.assertEquals(batch.get_status_codes(), [200, 200, 200])
+        self.assertEquals(records[1].get_changed_fields(), {'comments': 'Comment 1'})
+        self.assertEquals(records[2].sys_id, 'sys_id_2')
+
+    def test_invalid_operations(self):
+        batch = RecordBatch(self.session)
+        self.assertRaises(SnowClientException, batch.insert, Task(self.session))
+        self.assertRaises(SnowClientException, batch.update, Incident(self.session))
+        self.assertRaises(SnowClientException, RecordBatch, self.session, 0)
+        self.assertEquals(batch.execute(), [])
+        self.assertEquals(len(self.adapter.requests), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()  # for compatibility with Python2.6 unittest
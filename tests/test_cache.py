@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the cern-snow-client library.
+# Copyright (c) 2017 CERN
+# Authors:
+#  - James Clerc <james.clerc@cern.ch> <james.clerc@epitech.eu>
+#  - David Martin Clavo <david.martin.clavo@cern.ch>
+#
+# The cern-snow-client library is free software; you can redistribute it
+# and/or modify it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# The cern-snow-client library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with the cern-snow-client library.  If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+import time
+import unittest
+
+from cern_snow_client.cache import LRUCache
+from cern_snow_client.common import SnowClientException
+
+
+class TestCache(unittest.TestCase):
+
+    def test_get_set(self):
+        cache = LRUCache(10)
+        self.assertEquals(cache.get('a'), None)
+        self.assertEquals(cache.get('a', 0), 0)
+
+        cache.set('a', 1)
+        cache.set('a', 2)
+        self.assertEquals(cache.get('a'), 2)
+        self.assertEquals(len(cache), 1)
+
+        cache.invalidate('a')
+        cache.invalidate('b')
+        self.assertEquals(cache.get('a'), None)
+        self.assertEquals(len(cache), 0)
+
+    def test_lru_eviction(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        # 'a' becomes the most recently used
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEquals(cache.get('b'), None)
+        self.assertEquals(cache.get('a'), 1)
+        self.assertEquals(cache.get('c'), 3)
+        self.assertEquals(len(cache), 2)
+
+        cache.clear()
+        self.assertEquals(len(cache), 0)
+        cache.set('d', 4)
+        self.assertEquals(cache.get('d'), 4)
+
+    def test_ttl(self):
+        cache = LRUCache(10, ttl=0.05)
+        cache.set('a', 1)
+        self.assertEquals(cache.get('a'), 1)
+        time.sleep(0.1)
+        self.assertEquals(cache.get('a'), None)
+        self.assertEquals(len(cache), 0)
+
+    def test_statistics(self):
+        cache = LRUCache(2, ttl=0.05)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.set('c', 3)
+        cache.get('a')
+        cache.get('c')
+        time.sleep(0.1)
+        cache.get('b')
+
+        self.assertEquals(cache.get_statistics(), {
+            'hits': 1,
+            'misses': 2,
+            'evictions': 1,
+            'expirations': 1,
+            'entries': 1,
+        })
+
+    def test_bad_parameters(self):
+        self.assertRaises(SnowClientException, LRUCache, 0)
+        self.assertRaises(SnowClientException, LRUCache, 10, -1)
+
+
+if __name__ == '__main__':
+    unittest.main()  # for compatibility with Python2.6 unittest
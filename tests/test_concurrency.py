@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the cern-snow-client library.
+# Copyright (c) 2017 CERN
+# Authors:
+#  - James Clerc <james.clerc@cern.ch> <james.clerc@epitech.eu>
+#  - David Martin Clavo <david.martin.clavo@cern.ch>
+#
+# The cern-snow-client library is free software; you can redistribute it
+# and/or modify it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# The cern-snow-client library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with the cern-snow-client library.  If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+import threading
+import time
+import unittest
+
+from cern_snow_client.common import SnowClientException
+from cern_snow_client.concurrency import AdaptiveConcurrencyLimiter
+
+
+class TestConcurrency(unittest.TestCase):
+
+    def test_additive_increase(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=2, max_limit=4, latency_tolerance=None)
+        # a round of successful operations increases the limit by 1
+        for i in range(2):
+            operations = [limiter.acquire() for j in range(limiter.get_limit())]
+            for operation in operations:
+                limiter.release(operation, status_code=200)
+        self.assertEquals(limiter.get_limit(), 3)
+
+        for i in range(100):
+            operations = [limiter.acquire() for j in range(limiter.get_limit())]
+            for operation in operations:
+                limiter.release(operation, status_code=200)
+        self.assertEquals(limiter.get_limit(), 4)
+
+    def test_no_increase_below_limit(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=4, max_limit=16, latency_tolerance=None)
+        # the operations are sent one at a time: the limit is not what holds them back
+        for i in range(100):
+            limiter.release(limiter.acquire(), status_code=200)
+        self.assertEquals(limiter.get_limit(), 4)
+
+        # an operation started before the limit was reached was in flight when it was
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=2, increase=2, latency_tolerance=None)
+        operations = [limiter.acquire() for i in range(2)]
+        limiter.release(operations[0], status_code=200)
+        self.assertEquals(limiter.get_limit(), 3)
+
+    def test_multiplicative_decrease(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=16, min_limit=2)
+        operations = [limiter.acquire() for i in range(3)]
+
+        limiter.release(operations[0], status_code=503)
+        self.assertEquals(limiter.get_limit(), 8)
+        # the operations started before the decrease do not decrease the limit again
+        limiter.release(operations[1], status_code=429)
+        limiter.release(operations[2], error=True)
+        self.assertEquals(limiter.get_limit(), 8)
+
+        for status_code in (429, 502, 504):
+            limiter.release(limiter.acquire(), status_code=status_code)
+        self.assertEquals(limiter.get_limit(), 2)
+
+        # client errors are not a sign of overload
+        limiter.release(limiter.acquire(), status_code=404)
+        self.assertEquals(limiter.get_statistics()['decreases'], 4)
+        self.assertEquals(limiter.get_statistics()['in_flight'], 0)
+
+    def test_latency_decrease(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=10, max_limit=10, latency_window=5)
+        for i in range(5):
+            number, started_at = limiter.acquire()
+            limiter.release((number, started_at - 0.01), status_code=200)
+        self.assertEquals(limiter.get_limit(), 10)
+        self.assertTrue(0.009 < limiter.get_statistics()['p95_latency'] < 0.1)
+
+        for i in range(5):
+            number, started_at = limiter.acquire()
+            limiter.release((number, started_at - 0.5), status_code=200)
+        self.assertEquals(limiter.get_limit(), 5)
+
+    def test_latency_baseline_aging(self):
+        def release_with_latency(limiter, latency):
+            number, started_at = limiter.acquire()
+            limiter.release((number, started_at - latency), status_code=200)
+
+        limiters = [AdaptiveConcurrencyLimiter(initial_limit=10, max_limit=10, latency_window=5),
+                    AdaptiveConcurrencyLimiter(initial_limit=10, max_limit=10, latency_window=5, baseline_aging=0)]
+        for limiter in limiters:
+            for i in range(5):
+                release_with_latency(limiter, 0.01)
+            for i in range(150):
+                release_with_latency(limiter, 0.015)
+            self.assertEquals(limiter.get_limit(), 10)
+
+            # the instance got slower for good
+            for i in range(5):
+                release_with_latency(limiter, 0.025)
+
+        # the baseline followed the latencies of the last windows
+        self.assertEquals(limiters[0].get_limit(), 10)
+        self.assertEquals(limiters[1].get_limit(), 5)
+
+    def test_limit_concurrency(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=3, max_limit=3, latency_tolerance=None)
+        lock = threading.Lock()
+        running = [0]
+        maximum = [0]
+
+        def work():
+            operation = limiter.acquire()
+            with lock:
+                running[0] += 1
+                maximum[0] = max(maximum[0], running[0])
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+            limiter.release(operation, status_code=200)
+
+        threads = [threading.Thread(target=work) for i in range(12)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEquals(maximum[0], 3)
+
+    def test_bad_parameters(self):
+        self.assertRaises(SnowClientException, AdaptiveConcurrencyLimiter, 0)
+        self.assertRaises(SnowClientException, AdaptiveConcurrencyLimiter, 8, 1, 4)
+        self.assertRaises(SnowClientException, AdaptiveConcurrencyLimiter, decrease_factor=1)
+        self.assertRaises(SnowClientException, AdaptiveConcurrencyLimiter, latency_window=0)
+        self.assertRaises(SnowClientException, AdaptiveConcurrencyLimiter, baseline_aging=2)
+
+
+if __name__ == '__main__':
+    unittest.main()  # for compatibility with Python2.6 unittest
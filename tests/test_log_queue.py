@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the cern-snow-client library.
+# Copyright (c) 2017 CERN
+# Authors:
+#  - James Clerc <james.clerc@cern.ch> <james.clerc@epitech.eu>
+#  - David Martin Clavo <david.martin.clavo@cern.ch>
+#
+# The cern-snow-client library is free software; you can redistribute it
+# and/or modify it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# The cern-snow-client library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with the cern-snow-client library.  If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+import logging
+import Queue
+import unittest
+
+from cern_snow_client.log_queue import QueueHandler
+from cern_snow_client.log_queue import QueueListener
+
+
+class ListHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(self.format(record))
+
+
+class TestLogQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger('snow-client.test_log_queue')
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.propagate = False
+
+    def tearDown(self):
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+
+    def test_queue_listener(self):
+        queue = Queue.Queue(100)
+        list_handler = ListHandler()
+        list_handler.setFormatter(logging.Formatter('[%(levelname)s] %(message)s'))
+        list_handler.setLevel(logging.INFO)
+        self.logger.addHandler(QueueHandler(queue))
+        listener = QueueListener(queue, list_handler)
+        listener.start()
+
+        values = ['a']
+        self.logger.info('values: %s', values)
+        # the message is formatted when it is queued
+        values.append('b')
+        self.logger.debug('below the level of the handler')
+        try:
+            raise ValueError('failure')
+        except ValueError:
+            self.logger.exception('exception')
+        listener.flush()
+
+        self.assertEquals(list_handler.messages[0], "[INFO] values: ['a']")
+        self.assertTrue(list_handler.messages[1].startswith('[ERROR] exception\nTraceback'))
+        self.assertTrue('ValueError: failure' in list_handler.messages[1])
+        self.assertEquals(len(list_handler.messages), 2)
+
+        listener.stop()
+        self.logger.info('not written')
+        self.assertEquals(len(list_handler.messages), 2)
+
+    def test_dropped_records(self):
+        queue = Queue.Queue(3)
+        queue_handler = QueueHandler(queue)
+        self.logger.addHandler(queue_handler)
+
+        for i in range(5):
+            self.logger.info('message %d', i)
+
+        self.assertEquals(queue.qsize(), 3)
+        self.assertEquals(queue_handler.get_dropped_count(), 2)
+
+        list_handler = ListHandler()
+        listener = QueueListener(queue, list_handler)
+        listener.start()
+        listener.stop()
+        self.assertEquals(list_handler.messages, ['message 0', 'message 1', 'message 2'])
+
+
+if __name__ == '__main__':
+    unittest.main()  # for compatibility with Python2.6 unittest
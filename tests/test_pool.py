@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the cern-snow-client library.
+# Copyright (c) 2017 CERN
+# Authors:
+#  - James Clerc <james.clerc@cern.ch> <james.clerc@epitech.eu>
+#  - David Martin Clavo <david.martin.clavo@cern.ch>
+#
+# The cern-snow-client library is free software; you can redistribute it
+# and/or modify it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# The cern-snow-client library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with the cern-snow-client library.  If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+import threading
+import time
+import unittest
+
+from cern_snow_client.common import SnowClientException
+from cern_snow_client.pool import SnowFuture
+from cern_snow_client.pool import WorkerPool
+
+
+class TestPool(unittest.TestCase):
+
+    def test_submit(self):
+        with WorkerPool(4) as pool:
+            futures = [pool.submit(pow, i, 2) for i in range(20)]
+            self.assertEquals([future.result() for future in futures], [i * i for i in range(20)])
+
+    def test_exception(self):
+        def fail():
+            raise SnowClientException('failure')
+
+        with WorkerPool(2) as pool:
+            future = pool.submit(fail)
+            self.assertTrue(isinstance(future.exception(), SnowClientException))
+            self.assertRaises(SnowClientException, future.result)
+            self.assertTrue('failure' in future.get_traceback())
+
+    def test_max_workers(self):
+        lock = threading.Lock()
+        running = [0]
+        maximum = [0]
+
+        def work():
+            with lock:
+                running[0] += 1
+                maximum[0] = max(maximum[0], running[0])
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+
+        with WorkerPool(3) as pool:
+            futures = [pool.submit(work) for i in range(12)]
+            for future in futures:
+                future.result()
+
+        self.assertEquals(maximum[0], 3)
+
+    def test_submit_after_shutdown(self):
+        pool = WorkerPool(1)
+        pool.shutdown()
+        self.assertRaises(SnowClientException, pool.submit, pow, 2, 2)
+
+    def test_result_timeout(self):
+        future = SnowFuture()
+        self.assertRaises(SnowClientException, future.result, 0.01)
+        self.assertFalse(future.done())
+
+    def test_done_callback(self):
+        called = []
+        future = SnowFuture()
+        future.add_done_callback(called.append)
+        future._set_result(42)
+        future.add_done_callback(called.append)
+
+        self.assertEquals(called, [future, future])
+        self.assertEquals(future.result(), 42)
+
+    def test_cancel(self):
+        event = threading.Event()
+        with WorkerPool(1) as pool:
+            blocking_future = pool.submit(event.wait)
+            future = pool.submit(pow, 2, 2)
+            self.assertTrue(future.cancel())
+            event.set()
+
+        self.assertTrue(future.cancelled())
+        self.assertRaises(SnowClientException, future.result)
+        self.assertFalse(blocking_future.cancel())
+
+
+if __name__ == '__main__':
+    unittest.main()  # for compatibility with Python2.6 unittest
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the cern-snow-client library.
+# Copyright (c) 2017 CERN
+# Authors:
+#  - James Clerc <james.clerc@cern.ch> <james.clerc@epitech.eu>
+#  - David Martin Clavo <david.martin.clavo@cern.ch>
+#
+# The cern-snow-client library is free software; you can redistribute it
+# and/or modify it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# The cern-snow-client library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with the cern-snow-client library.  If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from cern_snow_client.common import SnowClientException
+from cern_snow_client.rate_limit import FileTokenBucket
+from cern_snow_client.rate_limit import RateLimiter
+from cern_snow_client.rate_limit import TokenBucket
+
+
+class TestRateLimit(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(50, capacity=5)
+        # the burst is served immediately
+        self.assertTrue(sum([bucket.acquire() for i in range(5)]) < 0.01)
+
+        start = time.time()
+        delays = [bucket.acquire() for i in range(5)]
+        self.assertTrue(time.time() - start >= 0.09)
+        self.assertTrue(delays[0] > 0)
+
+        self.assertRaises(SnowClientException, TokenBucket, 0)
+        self.assertRaises(SnowClientException, TokenBucket, 1, -1)
+
+    def test_file_token_bucket(self):
+        file_path = os.path.join(self.directory, 'bucket')
+        # two processes would have one FileTokenBucket each
+        bucket_1 = FileTokenBucket(file_path, 50, capacity=4)
+        bucket_2 = FileTokenBucket(file_path, 50, capacity=4)
+
+        delays = []
+        for i in range(4):
+            delays.append(bucket_1.acquire())
+            delays.append(bucket_2.acquire())
+
+        self.assertTrue(sum(delays[:4]) < 0.01)
+        self.assertTrue(sum(delays[4:]) > 0.05)
+
+    def test_rate_limiter(self):
+        limiter = RateLimiter(rate=1000, table_rates={'incident': 50})
+        for i in range(50):
+            limiter.acquire('https://cerntest.service-now.com', '/api/now/v2/table/u_request_fulfillment')
+
+        start = time.time()
+        for i in range(52):
+            limiter.acquire('https://cerntest.service-now.com', '/api/now/table/incident?sysparm_limit=1')
+        self.assertTrue(time.time() - start >= 0.03)
+
+        # the other instances have their own budget
+        self.assertEquals(limiter.acquire('https://cern.service-now.com', '/api/now/v2/table/incident'), 0)
+
+        self.assertRaises(SnowClientException, RateLimiter)
+
+    def test_rate_limiter_lock_directory(self):
+        lock_directory = os.path.join(self.directory, 'locks')
+        limiter = RateLimiter(rate=10, table_rates={'incident': 5}, lock_directory=lock_directory)
+        limiter.acquire('https://cerntest.service-now.com', '/api/now/v2/table/incident/1')
+
+        self.assertEquals(sorted(os.listdir(lock_directory)),
+                          ['cerntest.service-now.com.bucket', 'cerntest.service-now.com.incident.bucket'])
+
+
+if __name__ == '__main__':
+    unittest.main()  # for compatibility with Python2.6 unittest
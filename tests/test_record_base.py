@@ -251,3 +251,62 @@ class TestRecordBase(TestBase):
             self.assertTrue(type(record) is Task)
 
         self.assertTrue(records_found)
+
+    def base_test_get_query_pages(self, s):
+        r = RecordQuery(s, 'incident')
+
+        # Query the closed incidents with FE=IT Service Management Support, 5 records at a time
+        record_set = r.query(
+            query_encoded="u_functional_element=ea56fb210a0a8c0a015a591ddbed3676^active=false",
+            page_size=5)
+
+        sys_ids = set()
+        for record in record_set:
+            self.assertTrue(bool(record.sys_id))
+            self.assertTrue(record.sys_id not in sys_ids)
+            self.assertEquals(record.u_functional_element, 'ea56fb210a0a8c0a015a591ddbed3676')
+            self.assertTrue(type(record) is Incident)
+            sys_ids.add(record.sys_id)
+
+        self.assertTrue(len(sys_ids) > 5)
+        self.assertEquals(record_set.get_total_count(), len(sys_ids))
+
+    def base_test_get_query_parallel_pages(self, s):
+        r = RecordQuery(s, 'incident')
+        # the pages are ordered by sys_id by the library
+        query_encoded = "u_functional_element=ea56fb210a0a8c0a015a591ddbed3676^active=false"
+
+        numbers = [record.number for record in r.query(query_encoded=query_encoded, page_size=5)]
+        numbers_parallel = [record.number for record in r.query(query_encoded=query_encoded, page_size=5,
+                                                                parallel_pages=3)]
+
+        self.assertTrue(len(numbers) > 5)
+        self.assertEquals(numbers, numbers_parallel)
+
+    def base_test_get_query_keyset(self, s):
+        r = RecordQuery(s, 'incident')
+        query_encoded = "u_functional_element=ea56fb210a0a8c0a015a591ddbed3676^active=false"
+
+        record_set = r.query(query_encoded=query_encoded, page_size=5, keyset='sys_id')
+        sys_ids = [record_set.next().sys_id for i in range(7)]
+        cursor = record_set.get_cursor()
+        record_set.close()
+
+        record_set = r.query(query_encoded=query_encoded, page_size=5, cursor=cursor)
+        sys_ids.extend([record_set.next().sys_id for i in range(3)])
+
+        self.assertEquals(sys_ids, sorted(sys_ids))
+        self.assertEquals(len(set(sys_ids)), 10)
+
+    def base_test_get_query_fields(self, s):
+        r = RecordQuery(s, 'incident')
+        record_set = r.query(query_encoded="u_functional_element=ea56fb210a0a8c0a015a591ddbed3676^active=false",
+                             fields=['number', 'incident_state'], display_value='false',
+                             exclude_reference_link=True)
+
+        for record in record_set:
+            self.assertTrue(bool(record.sys_id))
+            self.assertEquals(record.sys_class_name, 'incident')
+            self.assertTrue(record.number.startswith('INC'))
+            self.assertEquals(record.incident_state.get_value(), record.incident_state.get_display_value())
+            self.assertFalse(hasattr(record, 'short_description'))
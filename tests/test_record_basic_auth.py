@@ -65,6 +65,26 @@ class TestRecordBasicAuthentication(unittest.TestCase, TestRecordBase):
         TestRecordBase.base_test_get_query(self, s)
         self.remove_cookie()
 
+    def test_record_query_pages(self):
+        s = self.make_good_session()
+        TestRecordBase.base_test_get_query_pages(self, s)
+        self.remove_cookie()
+
+    def test_record_query_parallel_pages(self):
+        s = self.make_good_session()
+        TestRecordBase.base_test_get_query_parallel_pages(self, s)
+        self.remove_cookie()
+
+    def test_record_query_keyset(self):
+        s = self.make_good_session()
+        TestRecordBase.base_test_get_query_keyset(self, s)
+        self.remove_cookie()
+
+    def test_record_query_fields(self):
+        s = self.make_good_session()
+        TestRecordBase.base_test_get_query_fields(self, s)
+        self.remove_cookie()
+
 
 if __name__ == '__main__':
     unittest.main()  # for compatibility with Python2.6 unittest
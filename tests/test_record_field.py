@@ -20,6 +20,7 @@
 # In applying this license, CERN does not waive the privileges and immunities granted to it by virtue of its status
 # as an Intergovernmental Organization or submit itself to any jurisdiction.
 
+import pickle
 import unittest
 from cern_snow_client.record import RecordField
 from cern_snow_client.common import SnowClientException
@@ -147,6 +148,36 @@ class TestRecordBasicAuthentication(unittest.TestCase):
         self.assertEquals(rf.get_value(), u'some_value')
         self.assertEquals(rf.get_display_value(), u'some_value')
 
+    def test_compact_representation(self):
+        link = 'https://cerntest.service-now.com/api/now/v2/table/sys_user_group/ea56fb210a0a8c0a015a591ddbed3676'
+        rf1 = RecordField({'value': u'ea56fb210a0a8c0a015a591ddbed3676', 'display_value': u'Service Desk',
+                           'link': link})
+        rf2 = RecordField({'value': u'0a0a8c0a015a591ddbed3676ea56fb21', 'display_value': 'Service Desk',
+                           'link': link})
+
+        self.assertFalse(hasattr(rf1, '__dict__'))
+        self.assertTrue(rf1.get_display_value() is rf2.get_display_value())
+        self.assertTrue(rf1.get_referenced_table() is rf2.get_referenced_table())
+        self.assertTrue(type(rf1.get_display_value()) is unicode)
+
+        rf = RecordField({'value': u'Same', 'display_value': u'Same'})
+        self.assertEquals(rf.get_display_value(), u'Same')
+        self.assertTrue(type(rf.get_display_value()) is unicode)
+
+    def test_pickle(self):
+        rf = RecordField({
+            'value': u'some_value',
+            'display_value': u'some_display_value',
+            'link': 'https://cerntest.service-now.com/api/now/v2/table/sys_user_group/some_value'
+        })
+
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            unpickled_rf = pickle.loads(pickle.dumps(rf, protocol))
+            self.assertTrue(type(unpickled_rf) is RecordField)
+            self.assertEquals(unpickled_rf, u'some_value')
+            self.assertEquals(unpickled_rf.get_display_value(), u'some_display_value')
+            self.assertEquals(unpickled_rf.get_referenced_table(), u'sys_user_group')
+
 
 if __name__ == '__main__':
     unittest.main()  # for compatibility with Python2.6 unittest
@@ -0,0 +1,806 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the cern-snow-client library.
+# Copyright (c) 2017 CERN
+# Authors:
+#  - James Clerc <james.clerc@cern.ch> <james.clerc@epitech.eu>
+#  - David Martin Clavo <david.martin.clavo@cern.ch>
+#
+# The cern-snow-client library is free software; you can redistribute it
+# and/or modify it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# The cern-snow-client library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with the cern-snow-client library.  If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+import base64
+import inspect
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from urlparse import parse_qs
+from urlparse import urlparse
+
+import requests
+
+from cern_snow_client.common import SnowClientException
+from cern_snow_client.incident import Incident
+from cern_snow_client.record import LazyRecordSet
+from cern_snow_client.record import Record
+from cern_snow_client.record import RecordField
+from cern_snow_client.record import RecordQuery
+from cern_snow_client.record import RecordSet
+from cern_snow_client.session import SnowRestSession
+from cern_snow_client.task import Task
+from tests.fake_adapter import FakeAdapter
+
+
+class TestRecordOffline(unittest.TestCase):
+    """
+    Tests of the Record, RecordQuery and RecordSet classes which do not need a ServiceNow instance:
+    the HTTP traffic goes through a FakeAdapter.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        s = SnowRestSession()
+        s.set_instance('cerntest.service-now.com')
+        s.auth_type = 'basic'
+        s.set_basic_auth_user('user')
+        s.set_basic_auth_password('password')
+        s.set_session_cookie_file_path(os.path.join(self.directory, 'basic_cookie.txt'))
+        self.session = s
+        self.adapter = FakeAdapter.mount_on(s)
+
+    def tearDown(self):
+        # some pages may still be being fetched in the background
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    @classmethod
+    def make_incident_row(cls, number, **values):
+        row = {
+            'sys_id': 'sys_id_' + str(number),
+            'sys_class_name': 'incident',
+            'number': 'INC%07d' % number,
+            'incident_state': {'value': '2', 'display_value': 'Assigned'},
+        }
+        row.update(values)
+        return row
+
+    def add_page(self, rows, total_count=None, next_page=False):
+        headers = {}
+        if total_count is not None:
+            headers['X-Total-Count'] = str(total_count)
+            headers['Link'] = '<https://cerntest.service-now.com/api/now/v2/table/incident>;rel="first"'
+            if next_page:
+                headers['Link'] += ',<https://cerntest.service-now.com/api/now/v2/table/incident>;rel="next"'
+        self.adapter.add_response(text=json.dumps({'result': rows}), headers=headers)
+
+    def get_request_params(self, request_index):
+        return parse_qs(urlparse(self.adapter.requests[request_index].url).query)
+
+    def test_query_pages(self):
+        self.add_page([self.make_incident_row(i) for i in range(0, 2)], total_count=5, next_page=True)
+        self.add_page([self.make_incident_row(i) for i in range(2, 4)], total_count=5, next_page=True)
+        self.add_page([self.make_incident_row(i) for i in range(4, 5)], total_count=5, next_page=False)
+
+        record_set = RecordQuery(self.session, 'incident').query(query_encoded='active=true', page_size=2)
+        self.assertTrue(isinstance(record_set, LazyRecordSet))
+        self.assertEquals(len(self.adapter.requests), 0)
+
+        numbers = []
+        for record in record_set:
+            self.assertTrue(type(record) is Incident)
+            numbers.append(record.number)
+
+        self.assertEquals(numbers, ['INC%07d' % i for i in range(5)])
+        self.assertEquals(record_set.get_total_count(), 5)
+        self.assertEquals(len(self.adapter.requests), 3)
+        self.assertEquals(self.get_request_params(1)['sysparm_offset'], ['2'])
+        self.assertEquals(self.get_request_params(1)['sysparm_limit'], ['2'])
+        self.assertEquals(self.get_request_params(1)['sysparm_query'], ['active=true^ORDERBYsys_id'])
+
+    def test_query_pages_order(self):
+        r = RecordQuery(self.session, 'incident')
+        for query_encoded, sysparm_query in [('active=true^ORDERBYnumber', 'active=true^ORDERBYnumber^ORDERBYsys_id'),
+                                             ('active=true^ORDERBYDESCsys_id', 'active=true^ORDERBYDESCsys_id')]:
+            self.add_page([])
+            list(r.query(query_encoded=query_encoded, page_size=2))
+            self.assertEquals(self.get_request_params(-1)['sysparm_query'], [sysparm_query])
+
+        # a single GET operation keeps the order of ServiceNow
+        self.add_page([])
+        list(r.query(query_encoded='active=true'))
+        self.assertEquals(self.get_request_params(-1)['sysparm_query'], ['active=true'])
+
+    def test_query_pages_without_link_header(self):
+        self.add_page([self.make_incident_row(i) for i in range(0, 2)])
+        self.add_page([self.make_incident_row(i) for i in range(2, 3)])
+
+        records = list(RecordQuery(self.session, 'incident').query(query_encoded='active=true', page_size=2))
+
+        self.assertEquals(len(records), 3)
+        self.assertEquals(len(self.adapter.requests), 2)
+
+    def respond_with_pages(self, total_count):
+        def responder(request):
+            params = parse_qs(urlparse(request.url).query)
+            offset = int(params['sysparm_offset'][0])
+            limit = int(params['sysparm_limit'][0])
+            rows = [self.make_incident_row(i) for i in range(offset, min(offset + limit, total_count))]
+            return 200, json.dumps({'result': rows}), {'X-Total-Count': str(total_count)}, None
+        self.adapter.responder = responder
+
+    def test_query_parallel_pages(self):
+        self.respond_with_pages(total_count=95)
+
+        record_set = RecordQuery(self.session, 'incident').query(
+            query_encoded='active=true', page_size=10, parallel_pages=4, prefetch_pages=6)
+        numbers = [record.number for record in record_set]
+
+        self.assertEquals(numbers, ['INC%07d' % i for i in range(95)])
+        self.assertEquals(record_set.get_total_count(), 95)
+        self.assertEquals(len(self.adapter.requests), 10)
+        for i in range(10):
+            self.assertEquals(self.get_request_params(i)['sysparm_query'], ['active=true^ORDERBYsys_id'])
+
+    def test_query_parallel_pages_bounded_prefetch(self):
+        self.respond_with_pages(total_count=1000)
+
+        record_set = RecordQuery(self.session, 'incident').query(
+            query_encoded='active=true', page_size=10, parallel_pages=2, prefetch_pages=3)
+        for i in range(15):
+            record_set.next()
+        record_set.close()
+
+        # the first page, then at most 3 pages ahead of the page being iterated
+        self.assertTrue(len(self.adapter.requests) <= 1 + 1 + 3)
+        self.assertRaises(StopIteration, record_set.next)
+
+    def respond_with_keyset_pages(self, total_count):
+        def responder(request):
+            params = parse_qs(urlparse(request.url).query)
+            limit = int(params['sysparm_limit'][0])
+            rows = [self.make_incident_row(i) for i in range(total_count)]
+            # the rows after the last sys_id of the previous page, assuming that the keyset is only sys_id
+            query = params['sysparm_query'][0]
+            if 'sys_id>' in query:
+                last_sys_id = query.split('sys_id>')[1].split('^')[0]
+                rows = [row for row in rows if row['sys_id'] > last_sys_id]
+            return 200, json.dumps({'result': rows[:limit]}), {'X-Total-Count': str(len(rows))}, None
+        self.adapter.responder = responder
+
+    def test_query_keyset(self):
+        self.respond_with_keyset_pages(total_count=5)
+
+        record_set = RecordQuery(self.session, 'incident').query(
+            query_encoded='active=true', page_size=2, keyset='sys_id')
+        records = list(record_set)
+
+        self.assertEquals(len(records), 5)
+        self.assertEquals(len(self.adapter.requests), 3)
+        self.assertEquals(record_set.get_total_count(), 5)
+        self.assertEquals(self.get_request_params(0)['sysparm_query'], ['active=true^ORDERBYsys_id'])
+        self.assertEquals(self.get_request_params(1)['sysparm_query'], ['active=true^sys_id>sys_id_1^ORDERBYsys_id'])
+        self.assertEquals(self.get_request_params(1)['sysparm_offset'], ['0'])
+
+    def test_query_keyset_resume_from_cursor(self):
+        self.respond_with_keyset_pages(total_count=5)
+
+        record_set = RecordQuery(self.session, 'incident').query(
+            query_encoded='active=true', page_size=2, keyset='sys_id')
+        self.assertEquals(record_set.next().sys_id, 'sys_id_0')
+        self.assertEquals(record_set.next().sys_id, 'sys_id_1')
+        self.assertEquals(record_set.next().sys_id, 'sys_id_2')
+        cursor = record_set.get_cursor()
+        record_set.close()
+
+        record_set = RecordQuery(self.session, 'incident').query(query_encoded='active=true', cursor=cursor)
+        self.assertEquals([record.sys_id for record in record_set], ['sys_id_3', 'sys_id_4'])
+        self.assertEquals(record_set.get_cursor(), RecordQuery._encode_cursor(['sys_id'], ['sys_id_4']))
+
+    def test_query_keyset_composite(self):
+        self.add_page([self.make_incident_row(0, sys_updated_on={'value': '2017-01-01 10:00:00',
+                                                                  'display_value': '01-01-2017 11:00:00'})])
+
+        record_set = RecordQuery(self.session, 'incident').query(
+            query_encoded='active=true', url_params='sysparm_fields=number', page_size=1,
+            keyset=['sys_updated_on', 'sys_id'])
+        record_set.next()
+        self.assertRaises(StopIteration, record_set.next)
+
+        params = self.get_request_params(1)
+        self.assertEquals(params['sysparm_query'], [
+            'active=true^sys_updated_on>2017-01-01 10:00:00^NQ'
+            'active=true^sys_updated_on=2017-01-01 10:00:00^sys_id>sys_id_0^ORDERBYsys_updated_on^ORDERBYsys_id'])
+        self.assertEquals(params['sysparm_fields'], ['number,sys_id,sys_class_name,sys_updated_on'])
+
+    def test_query_keyset_invalid(self):
+        r = RecordQuery(self.session, 'incident')
+        self.assertRaises(SnowClientException, r.query, query_encoded='active=true', keyset='sys_id',
+                          parallel_pages=2)
+        self.assertRaises(SnowClientException, r.query, query_encoded='active=true^ORDERBYnumber', keyset='sys_id')
+        self.assertRaises(SnowClientException, r.query, query_encoded='active=true', cursor='invalid')
+        cursor = RecordQuery._encode_cursor(['sys_id'], ['sys_id_1'])
+        self.assertRaises(SnowClientException, r.query, query_encoded='active=true', cursor=cursor,
+                          keyset='sys_updated_on')
+
+    def test_record_fields_materialized_lazily(self):
+        self.add_page(self.make_incident_row(1, short_description='Test'))
+
+        r = Record(self.session, 'incident')
+        r.get('sys_id_1')
+
+        self.assertTrue(type(r.sys_id) is RecordField)
+        self.assertTrue('incident_state' not in r.__dict__)
+        self.assertTrue('incident_state' in dir(r))
+        self.assertEquals(r.incident_state.get_display_value(), 'Assigned')
+        self.assertTrue(r.__dict__['incident_state'] is r.incident_state)
+        self.assertFalse(hasattr(r, 'unknown_field'))
+        self.assertRaises(AttributeError, getattr, r, '_unknown_private_attribute')
+
+        r.short_description = 'Changed'
+        self.assertEquals(r.short_description, 'Changed')
+        self.assertEquals(r.get_changed_fields(), {'short_description': 'Changed'})
+
+        r._set_values({'incident_state': {'value': '6', 'display_value': 'Resolved'}, 'get': 'not a method'})
+        self.assertEquals(r.incident_state, '6')
+        self.assertTrue(inspect.ismethod(r.get))
+
+    def test_protected_names(self):
+        protected_names = Task._get_protected_names()
+
+        self.assertTrue(protected_names is Task._get_protected_names())
+        self.assertTrue('resolve' in protected_names)
+        self.assertTrue('get' in protected_names)
+        self.assertFalse('_set_values' in protected_names)
+        self.assertFalse('resolve' in Record._get_protected_names())
+
+        t = Task(self.session, values={'resolve': 'not a method', 'short_description': 'Test'})
+        self.assertTrue(inspect.ismethod(t.resolve))
+        self.assertEquals(t.short_description, 'Test')
+
+    def test_to_columns(self):
+        rows = [self.make_incident_row(1), self.make_incident_row(2, short_description='Test')]
+        record_set = RecordSet(self.session, rows, 'incident')
+
+        columns = record_set.to_columns()
+        self.assertEquals(columns['number'], ['INC0000001', 'INC0000002'])
+        self.assertEquals(columns['incident_state'], ['2', '2'])
+        self.assertEquals(columns['short_description'], [None, 'Test'])
+
+        columns = record_set.to_columns(['incident_state', 'unknown_field'], display_value='true')
+        self.assertEquals(columns, {'incident_state': ['Assigned', 'Assigned'], 'unknown_field': [None, None]})
+        self.assertEquals(record_set.to_columns(['incident_state'], display_value=True),
+                          {'incident_state': ['Assigned', 'Assigned']})
+        self.assertEquals(record_set.to_columns(['incident_state'], display_value='false'),
+                          record_set.to_columns(['incident_state'], display_value=False))
+
+        columns = record_set.to_columns(['incident_state'], display_value='all')
+        self.assertEquals(columns, {'incident_state': ['2', '2'],
+                                    'incident_state.display_value': ['Assigned', 'Assigned']})
+        self.assertRaises(SnowClientException, record_set.to_columns, display_value='value')
+
+    def test_to_columns_lazy_record_set(self):
+        self.respond_with_pages(total_count=5)
+
+        record_set = RecordQuery(self.session, 'incident').query(query_encoded='active=true', page_size=2)
+        self.assertEquals(record_set.next().number, 'INC0000000')
+
+        columns = record_set.to_columns(['number'])
+        self.assertEquals(columns['number'], ['INC%07d' % i for i in range(1, 5)])
+        self.assertRaises(StopIteration, record_set.next)
+
+    def test_to_numpy_and_to_dataframe(self):
+        rows = [self.make_incident_row(1, reassignment_count='2'), self.make_incident_row(2, reassignment_count='')]
+        record_set = RecordSet(self.session, rows, 'incident')
+
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        if numpy is None:
+            self.assertRaises(SnowClientException, record_set.to_numpy, 'reassignment_count')
+        else:
+            array = record_set.to_numpy('reassignment_count', dtype=float)
+            self.assertEquals(array[0], 2.0)
+            self.assertTrue(numpy.isnan(array[1]))
+            self.assertEquals(list(record_set.to_numpy('incident_state', display_value='true')),
+                              ['Assigned', 'Assigned'])
+
+        try:
+            import pandas
+        except ImportError:
+            pandas = None
+        if pandas is None:
+            self.assertRaises(SnowClientException, record_set.to_dataframe)
+        else:
+            df = record_set.to_dataframe(['number', 'incident_state'], display_value='all')
+            self.assertEquals(list(df.columns), ['number', 'number.display_value',
+                                                 'incident_state', 'incident_state.display_value'])
+            self.assertEquals(list(df['incident_state.display_value']), ['Assigned', 'Assigned'])
+
+    def test_query_stream(self):
+        self.add_page([self.make_incident_row(i) for i in range(3)])
+
+        record_set = RecordQuery(self.session, 'incident').query(query_encoded='active=true', stream=True)
+        self.assertTrue(isinstance(record_set, LazyRecordSet))
+        self.assertEquals([record.number for record in record_set], ['INC%07d' % i for i in range(3)])
+        self.assertTrue('sysparm_limit' not in self.get_request_params(0))
+
+    def test_query_pages_stream(self):
+        self.respond_with_keyset_pages(total_count=5)
+
+        record_set = RecordQuery(self.session, 'incident').query(
+            query_encoded='active=true', page_size=2, keyset='sys_id', stream=True)
+        self.assertEquals([record.sys_id for record in record_set], ['sys_id_%d' % i for i in range(5)])
+        self.assertEquals(len(self.adapter.requests), 3)
+        self.assertEquals(record_set.get_cursor(), RecordQuery._encode_cursor(['sys_id'], ['sys_id_4']))
+
+        self.respond_with_pages(total_count=5)
+        record_set = RecordQuery(self.session, 'incident').query(query_encoded='active=true', page_size=2,
+                                                                 stream=True)
+        self.assertEquals(len(list(record_set)), 5)
+        self.assertRaises(SnowClientException, RecordQuery(self.session, 'incident').query,
+                          query_encoded='active=true', parallel_pages=2, stream=True)
+
+    def respond_to_updates(self, failing_sys_ids=()):
+        """
+        Answers PUT operations, directly or through the Batch API, with the sent values.
+        """
+        def execute(method, url, body):
+            sys_id = url.split('?')[0].split('/')[-1]
+            if method != 'PUT' or sys_id in failing_sys_ids:
+                return 403, {'error': {'message': 'Operation Failed'}}
+            values = json.loads(body)
+            values['sys_id'] = sys_id
+            return 200, {'result': values}
+
+        def responder(request):
+            if request.url.endswith('/api/now/v1/batch'):
+                serviced_requests = []
+                for rest_request in json.loads(request.body)['rest_requests']:
+                    status_code, result = execute(rest_request['method'], rest_request['url'],
+                                                  base64.b64decode(rest_request['body']))
+                    serviced_requests.append({'id': rest_request['id'], 'status_code': status_code,
+                                              'body': base64.b64encode(json.dumps(result))})
+                return 200, json.dumps({'serviced_requests': serviced_requests}), None, None
+            status_code, result = execute(request.method, request.url, request.body)
+            return status_code, json.dumps(result), None, None
+
+        self.adapter.responder = responder
+
+    def test_update_all(self):
+        self.respond_to_updates(failing_sys_ids=['sys_id_2'])
+        rows = [self.make_incident_row(i) for i in range(5)]
+
+        for kwargs in [{}, {'max_workers': 3}, {'use_batch': True, 'batch_chunk_size': 2}]:
+            self.adapter.requests = []
+            report = RecordSet(self.session, rows, 'incident').update_all({'assignment_group': 'group'}, **kwargs)
+
+            self.assertFalse(report.is_success())
+            self.assertEquals([record.sys_id for record in report.get_succeeded()],
+                              ['sys_id_0', 'sys_id_1', 'sys_id_3', 'sys_id_4'])
+            self.assertEquals([record.sys_id for record, error in report.get_failed()], ['sys_id_2'])
+            self.assertTrue(isinstance(report.get_failed()[0][1], SnowClientException))
+            self.assertEquals(report.get_succeeded()[0].assignment_group, 'group')
+
+            # a single operation per record, sending only the changed field
+            if kwargs.get('use_batch'):
+                self.assertEquals(len(self.adapter.requests), 3)
+            else:
+                self.assertEquals(len(self.adapter.requests), 5)
+                for request in self.adapter.requests:
+                    self.assertEquals(request.method, 'PUT')
+                    self.assertEquals(json.loads(request.body), {'assignment_group': 'group'})
+
+    def make_counted_lazy_record_set(self, row_count, rows_read):
+        """
+        Returns a LazyRecordSet of one record per page, counting the records read in ``rows_read[0]``.
+        """
+        def pages():
+            for i in range(row_count):
+                rows_read[0] += 1
+                yield [self.make_incident_row(i)], requests.Response()
+        return LazyRecordSet(self.session, pages(), 'incident')
+
+    def test_update_all_reads_lazily(self):
+        self.respond_to_updates()
+        responder = self.adapter.responder
+        rows_read = [0]
+        rows_ahead = []
+
+        def counting_responder(request):
+            rows_ahead.append(rows_read[0] - len(rows_ahead))
+            return responder(request)
+        self.adapter.responder = counting_responder
+
+        record_set = self.make_counted_lazy_record_set(50, rows_read)
+        report = record_set.update_all({'assignment_group': 'group'}, max_workers=2)
+
+        self.assertTrue(report.is_success())
+        self.assertEquals(len(report.get_succeeded()), 50)
+        # the records are read at most 2 * max_workers ahead of the updates
+        self.assertTrue(max(rows_ahead) <= 5)
+
+    def test_update_all_batch_reads_lazily(self):
+        self.respond_to_updates()
+        responder = self.adapter.responder
+        rows_read = []
+
+        def counting_responder(request):
+            rows_read.append(rows[0])
+            return responder(request)
+        self.adapter.responder = counting_responder
+
+        rows = [0]
+        record_set = self.make_counted_lazy_record_set(25, rows)
+        report = record_set.update_all({'assignment_group': 'group'}, use_batch=True, batch_chunk_size=10)
+
+        self.assertEquals(len(report.get_succeeded()), 25)
+        # each chunk is sent once full, the last one at the end
+        self.assertEquals(rows_read, [10, 20, 25])
+
+    def test_resolve_all(self):
+        self.respond_to_updates()
+        rows = [self.make_incident_row(i) for i in range(3)]
+
+        report = RecordSet(self.session, rows, 'incident').resolve_all('Solution', max_workers=2)
+
+        self.assertTrue(report.is_success())
+        self.assertEquals(len(self.adapter.requests), 3)
+        for request in self.adapter.requests:
+            self.assertEquals(json.loads(request.body), {'incident_state': '6', 'u_close_code': 'Restored',
+                                                         'comments': 'Solution'})
+
+        report = RecordSet(self.session, rows, 'incident').add_comment_all('Comment')
+        self.assertEquals(len(report.get_succeeded()), 3)
+        self.assertRaises(SnowClientException, RecordSet(self.session, rows, 'sys_user').resolve_all, 'Solution')
+        self.assertRaises(SnowClientException, RecordSet(self.session, rows, 'incident').update_all, {},
+                          max_workers=2, use_batch=True)
+
+    def test_get_fields(self):
+        self.add_page([self.make_incident_row(1)])
+
+        r = Record(self.session, 'incident')
+        self.assertTrue(r.get(('number', 'INC0000001'), fields=['number'], display_value='false',
+                              exclude_reference_link=True))
+
+        params = self.get_request_params(0)
+        self.assertEquals(params['sysparm_fields'], ['number,sys_id,sys_class_name'])
+        self.assertEquals(params['sysparm_display_value'], ['false'])
+        self.assertEquals(params['sysparm_exclude_reference_link'], ['true'])
+        self.assertEquals(r.number, 'INC0000001')
+        self.assertRaises(SnowClientException, r.get, 'sys_id_1', display_value='value')
+
+    def test_resolve_with_display_values(self):
+        row = {
+            'sys_id': {'value': 'sys_id_1', 'display_value': 'sys_id_1'},
+            'sys_class_name': {'value': 'incident', 'display_value': 'Incident'},
+            'number': {'value': 'INC0000001', 'display_value': 'INC0000001'},
+            'incident_state': {'value': '2', 'display_value': 'Assigned'},
+            'assignment_group': self.make_reference('sys_user_group', 'group_1', 'Group'),
+        }
+        self.add_page(row)
+        self.add_page(self.make_incident_row(1))
+
+        t = Task(self.session)
+        self.assertTrue(t.get('sys_id_1', display_value='true'))
+        self.assertEquals(self.get_request_params(0)['sysparm_display_value'], ['all'])
+        # sys_class_name keeps its value, not the label of the table
+        self.assertEquals(t.sys_class_name, 'incident')
+        self.assertEquals(t.incident_state, 'Assigned')
+        self.assertEquals(t.assignment_group, 'Group')
+        self.assertEquals(t.assignment_group.get_referenced_table(), 'sys_user_group')
+
+        self.assertTrue(t.resolve('Solution'))
+        self.assertTrue(self.adapter.requests[1].url.split('?')[0].endswith('/table/incident/sys_id_1'))
+        self.assertEquals(json.loads(self.adapter.requests[1].body)['incident_state'], '6')
+        self.assertEquals(json.loads(self.adapter.requests[1].body)['u_close_code'], 'Restored')
+
+        # the same for the records of a query
+        self.add_page([row])
+        record_set = RecordQuery(self.session, 'incident').query(query_encoded='active=true', display_value='true')
+        self.assertEquals(record_set.to_columns(['sys_class_name', 'incident_state']),
+                          {'sys_class_name': ['incident'], 'incident_state': ['Assigned']})
+        self.respond_to_updates()
+        report = record_set.resolve_all('Solution')
+        self.assertEquals(len(report.get_succeeded()), 1)
+        self.assertTrue(self.adapter.requests[3].url.split('?')[0].endswith('/table/incident/sys_id_1'))
+        self.assertEquals(json.loads(self.adapter.requests[3].body)['incident_state'], '6')
+
+    def test_query_fields(self):
+        self.add_page([self.make_incident_row(1)])
+
+        r = RecordQuery(self.session, 'incident')
+        records = list(r.query(query_encoded='active=true', fields=['number', 'sys_id']))
+
+        self.assertEquals(len(records), 1)
+        params = self.get_request_params(0)
+        self.assertEquals(params['sysparm_fields'], ['number,sys_id,sys_class_name'])
+        self.assertEquals(params['sysparm_display_value'], ['all'])
+        self.assertTrue('sysparm_exclude_reference_link' not in params)
+        self.assertRaises(SnowClientException, r.query, query_encoded='active=true', fields=['number'],
+                          url_params='sysparm_fields=short_description')
+
+    def test_resolve_fetches_only_sys_class_name(self):
+        self.add_page([{'sys_id': 'sys_id_1', 'sys_class_name': 'incident'}])
+        self.add_page(self.make_incident_row(1))
+
+        t = Task(self.session)
+        t.resolve('Solution', key=('number', 'INC0000001'))
+
+        self.assertEquals(self.get_request_params(0)['sysparm_fields'], ['sys_class_name,sys_id'])
+        self.assertEquals(self.adapter.requests[1].method, 'PUT')
+        self.assertTrue(self.adapter.requests[1].url.split('?')[0].endswith('/table/incident/sys_id_1'))
+        self.assertEquals(json.loads(self.adapter.requests[1].body)['incident_state'], '6')
+
+    def test_resolve_uses_resolution_cache(self):
+        self.assertTrue(self.session.get_resolution_cache() is None)
+        self.session.set_resolution_cache(100, 300)
+        self.add_page([{'sys_id': 'sys_id_1', 'sys_class_name': 'incident'}])
+        self.add_page(self.make_incident_row(1))
+        self.add_page(self.make_incident_row(1))
+
+        Task(self.session).resolve('Solution', key=('number', 'INC0000001'))
+        self.assertEquals(len(self.adapter.requests), 2)
+
+        # the key was remembered: only the PUT is needed
+        Task(self.session).resolve('Solution', key=('number', 'INC0000001'))
+        self.assertEquals(len(self.adapter.requests), 3)
+        self.assertEquals(self.adapter.requests[2].method, 'PUT')
+        self.assertTrue(self.adapter.requests[2].url.split('?')[0].endswith('/table/incident/sys_id_1'))
+
+        self.session.set_resolution_cache(0)
+        self.assertTrue(self.session.get_resolution_cache() is None)
+        self.add_page([{'sys_id': 'sys_id_1', 'sys_class_name': 'incident'}])
+        self.add_page(self.make_incident_row(1))
+        Task(self.session).resolve('Solution', key=('number', 'INC0000001'))
+        self.assertEquals(len(self.adapter.requests), 5)
+        self.assertEquals(self.adapter.requests[3].method, 'GET')
+
+    def test_resolution_cache_forgets_missing_records(self):
+        self.session.set_resolution_cache(100)
+        self.add_page([{'sys_id': 'sys_id_1', 'sys_class_name': 'incident'}])
+        self.add_page(self.make_incident_row(1))
+        Task(self.session).resolve('Solution', key=('number', 'INC0000001'))
+        self.assertEquals(len(self.session.get_resolution_cache()), 2)
+
+        # the record was deleted since: the update does not find it
+        self.adapter.add_response(status_code=404, text=json.dumps({'error': {'message': 'No Record found'}}))
+        self.assertFalse(Task(self.session).resolve('Solution', key=('number', 'INC0000001')))
+        self.assertEquals(len(self.session.get_resolution_cache()), 0)
+
+        # so the next update resolves the key again
+        self.add_page([{'sys_id': 'sys_id_2', 'sys_class_name': 'incident'}])
+        self.add_page(self.make_incident_row(2))
+        Task(self.session).resolve('Solution', key=('number', 'INC0000001'))
+        self.assertEquals(self.adapter.requests[3].method, 'GET')
+        self.assertTrue(self.adapter.requests[4].url.split('?')[0].endswith('/table/incident/sys_id_2'))
+
+        # a get which does not find the record forgets it as well
+        self.add_page([])
+        self.assertFalse(Record(self.session, 'incident').get(('number', 'INC0000001')))
+        self.assertTrue(self.session.get_resolution_cache().get(('incident', 'number', u'INC0000001')) is None)
+
+    def test_resolution_cache_forgets_changed_keys(self):
+        self.session.set_resolution_cache(100)
+        self.add_page([{'sys_id': 'sys_id_1', 'sys_class_name': 'incident'}])
+        self.add_page(self.make_incident_row(1))
+
+        r = Record(self.session, 'incident')
+        r.number = 'INC0000002'
+        self.assertTrue(r.update(('number', 'INC0000001')))
+
+        cache = self.session.get_resolution_cache()
+        self.assertTrue(cache.get(('incident', 'number', u'INC0000001')) is None)
+        self.assertEquals(cache.get(('incident', 'sys_id', u'sys_id_1')), (u'sys_id_1', u'incident'))
+
+    def test_update_via_base_table(self):
+        self.add_page({'sys_id': 'sys_id_1', 'sys_class_name': 'incident'})
+        self.add_page(self.make_incident_row(1))
+
+        t = Task(self.session)
+        t.sys_id = 'sys_id_1'
+        t.short_description = 'Test'
+        t.update()
+
+        self.assertEquals(self.adapter.requests[0].method, 'GET')
+        self.assertTrue(self.adapter.requests[1].url.split('?')[0].endswith('/table/incident/sys_id_1'))
+
+        self.session.set_update_via_base_table(True)
+        self.add_page(self.make_incident_row(1))
+
+        t = Task(self.session)
+        t.sys_id = 'sys_id_1'
+        t.short_description = 'Test'
+        t.update()
+
+        self.assertEquals(len(self.adapter.requests), 3)
+        self.assertEquals(self.adapter.requests[2].method, 'PUT')
+        self.assertTrue(self.adapter.requests[2].url.split('?')[0].endswith('/table/task/sys_id_1'))
+
+
+    def test_record_cache(self):
+        self.session.set_record_cache(100)
+        self.session.set_resolution_cache(100)
+        self.add_page(self.make_incident_row(1, short_description='Test'))
+
+        for i in range(3):
+            r = Record(self.session, 'incident')
+            self.assertTrue(r.get('sys_id_1'))
+            self.assertEquals(r.short_description, 'Test')
+        self.assertEquals(len(self.adapter.requests), 1)
+
+        # by number: the second get finds the sys_id in the resolution cache
+        r = Record(self.session, 'incident')
+        self.add_page([self.make_incident_row(1, short_description='Test')])
+        self.assertTrue(r.get(('number', 'INC0000001')))
+        self.assertTrue(r.get(('number', 'INC0000001')))
+        self.assertEquals(len(self.adapter.requests), 2)
+
+        r = Record(self.session, 'incident')
+        self.assertTrue(r.get('sys_id_1', fields=['number']))
+        self.assertEquals(r.number, 'INC0000001')
+        self.assertFalse(hasattr(r, 'short_description'))
+        self.assertEquals(len(self.adapter.requests), 2)
+
+        # other display values are not cached
+        self.add_page(self.make_incident_row(1, short_description='Test'))
+        r.get('sys_id_1', display_value='false')
+        self.assertEquals(len(self.adapter.requests), 3)
+
+        self.assertEquals(self.session.get_record_cache().get_statistics()['hits'], 4)
+
+    def test_record_cache_refreshed_by_update(self):
+        self.session.set_record_cache(100)
+        self.add_page(self.make_incident_row(1, short_description='Test'))
+        self.add_page(self.make_incident_row(1, short_description='Updated'))
+
+        r = Record(self.session, 'incident')
+        r.get('sys_id_1')
+        r.short_description = 'Updated'
+        r.update()
+
+        r = Record(self.session, 'incident')
+        r.get('sys_id_1')
+        self.assertEquals(r.short_description, 'Updated')
+        self.assertEquals(len(self.adapter.requests), 2)
+
+        # an update through the task table makes the incident row stale
+        self.session.set_update_via_base_table(True)
+        self.add_page(self.make_incident_row(1, short_description='Through task'))
+        self.add_page(self.make_incident_row(1, short_description='Through task'))
+        t = Task(self.session)
+        t.short_description = 'Through task'
+        t.update('sys_id_1')
+
+        r = Record(self.session, 'incident')
+        r.get('sys_id_1')
+        self.assertEquals(r.short_description, 'Through task')
+        self.assertEquals(len(self.adapter.requests), 4)
+        self.assertEquals(self.adapter.requests[3].method, 'GET')
+
+    def test_record_cache_revalidate(self):
+        self.session.set_record_cache(100, revalidate=True)
+        row = self.make_incident_row(1, sys_mod_count={'value': '3', 'display_value': '3'},
+                                     sys_updated_on={'value': '2017-06-01 10:00:00', 'display_value': '01-06-2017'})
+        self.add_page(row)
+        self.add_page({'sys_mod_count': '3', 'sys_updated_on': '2017-06-01 10:00:00'})
+        self.add_page({'sys_mod_count': '4', 'sys_updated_on': '2017-06-01 11:00:00'})
+        row['sys_mod_count'] = {'value': '4', 'display_value': '4'}
+        self.add_page(row)
+
+        r = Record(self.session, 'incident')
+        r.get('sys_id_1')
+        # not changed: the record is taken from the cache
+        r.get('sys_id_1')
+        self.assertEquals(len(self.adapter.requests), 2)
+        self.assertEquals(self.get_request_params(1)['sysparm_fields'], ['sys_mod_count,sys_updated_on'])
+        self.assertEquals(self.get_request_params(1)['sysparm_display_value'], ['false'])
+
+        # changed: the whole record is fetched again
+        r.get('sys_id_1')
+        self.assertEquals(len(self.adapter.requests), 4)
+        self.assertTrue('sysparm_fields' not in self.get_request_params(3))
+        self.assertEquals(r.sys_mod_count, '4')
+
+    @classmethod
+    def make_reference(cls, table_name, sys_id, display_value):
+        return {
+            'value': sys_id,
+            'display_value': display_value,
+            'link': 'https://cerntest.service-now.com/api/now/v2/table/' + table_name + '/' + sys_id,
+        }
+
+    def respond_with_referenced_records(self):
+        def responder(request):
+            params = parse_qs(urlparse(request.url).query)
+            table_name = urlparse(request.url).path.split('/')[-1]
+            sys_ids = params['sysparm_query'][0][len('sys_idIN'):].split(',')
+            rows = [{'sys_id': sys_id, 'name': 'Name of ' + sys_id} for sys_id in sys_ids if sys_id != 'user_deleted']
+            if table_name == 'incident':
+                rows = [self.make_incident_row(i, assignment_group=self.make_reference(
+                    'sys_user_group', 'group_' + str(i % 2), 'Group')) for i in range(3)]
+            return 200, json.dumps({'result': rows}), {}, None
+        self.adapter.responder = responder
+
+    def test_prefetch(self):
+        self.respond_with_referenced_records()
+        rows = []
+        for i in range(5):
+            rows.append(self.make_incident_row(
+                i,
+                assignment_group=self.make_reference('sys_user_group', 'group_' + str(i % 2), 'Group'),
+                caller_id=self.make_reference('sys_user', 'user_deleted' if i == 4 else 'user_' + str(i), 'User'),
+                short_description='Test'))
+        record_set = RecordSet(self.session, rows, 'incident')
+
+        self.assertTrue(record_set.prefetch('assignment_group', 'caller_id', 'short_description', chunk_size=3,
+                                            fields=['name']) is record_set)
+        # sys_user_group: 2 distinct records, sys_user: 5 distinct records in chunks of 3
+        self.assertEquals(len(self.adapter.requests), 3)
+        self.assertEquals(self.get_request_params(0)['sysparm_query'], ['sys_idINuser_0,user_1,user_2'])
+        self.assertEquals(self.get_request_params(0)['sysparm_fields'], ['name,sys_id,sys_class_name'])
+        self.assertEquals(self.get_request_params(2)['sysparm_query'], ['sys_idINgroup_0,group_1'])
+
+        records = list(record_set)
+        self.assertEquals(len(self.adapter.requests), 3)
+        self.assertEquals(records[1].assignment_group.get_record().name, 'Name of group_1')
+        self.assertEquals(records[3].caller_id.get_record().sys_id, 'user_3')
+        self.assertEquals(records[4].caller_id.get_record(), None)
+        self.assertEquals(records[0].short_description.get_record(), None)
+
+        self.assertRaises(SnowClientException, record_set.prefetch)
+        self.assertRaises(SnowClientException, record_set.prefetch, 'caller_id', field=['name'])
+
+    def test_prefetch_lazy_record_set(self):
+        self.respond_with_referenced_records()
+
+        record_set = RecordQuery(self.session, 'incident').query(query_encoded='active=true', page_size=10)
+        record_set.prefetch('assignment_group')
+        self.assertEquals(len(self.adapter.requests), 0)
+
+        records = list(record_set)
+        self.assertEquals(len(self.adapter.requests), 2)
+        self.assertEquals(records[2].assignment_group.get_record().name, 'Name of group_0')
+
+    def test_prefetch_lazy_record_set_pages(self):
+        def responder(request):
+            params = parse_qs(urlparse(request.url).query)
+            if urlparse(request.url).path.endswith('/sys_user_group'):
+                sys_ids = params['sysparm_query'][0][len('sys_idIN'):].split(',')
+                rows = [{'sys_id': sys_id, 'name': 'Name of ' + sys_id} for sys_id in sys_ids]
+            else:
+                # the incidents reference the groups 0, 1, 1, 2, 2
+                offset = int(params['sysparm_offset'][0])
+                rows = [self.make_incident_row(i, assignment_group=self.make_reference(
+                    'sys_user_group', 'group_' + str(i // 2 + i % 2), 'Group'))
+                    for i in range(offset, min(offset + 2, 5))]
+            return 200, json.dumps({'result': rows}), {}, None
+        self.adapter.responder = responder
+
+        record_set = RecordQuery(self.session, 'incident').query(query_encoded='active=true', page_size=2)
+        record_set.prefetch('assignment_group')
+        records = list(record_set)
+
+        self.assertEquals([record.assignment_group.get_record().name for record in records],
+                          ['Name of group_' + str(i // 2 + i % 2) for i in range(5)])
+        group_queries = [self.get_request_params(i)['sysparm_query'][0] for i in range(len(self.adapter.requests))
+                         if self.adapter.requests[i].url.split('?')[0].endswith('/sys_user_group')]
+        # group_1 is kept for the second page, which needs it as well
+        self.assertEquals(group_queries, ['sys_idINgroup_0,group_1', 'sys_idINgroup_2'])
+        self.assertEquals(sorted(record_set._prefetched_records), [('sys_user_group', 'group_2')])
+
+if __name__ == '__main__':
+    unittest.main()  # for compatibility with Python2.6 unittest
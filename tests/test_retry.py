@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the cern-snow-client library.
+# Copyright (c) 2017 CERN
+# Authors:
+#  - James Clerc <james.clerc@cern.ch> <james.clerc@epitech.eu>
+#  - David Martin Clavo <david.martin.clavo@cern.ch>
+#
+# The cern-snow-client library is free software; you can redistribute it
+# and/or modify it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# The cern-snow-client library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with the cern-snow-client library.  If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+import time
+import unittest
+from email.utils import formatdate
+
+import requests
+
+from cern_snow_client.common import SnowClientException
+from cern_snow_client.retry import RetryPolicy
+
+
+class TestRetry(unittest.TestCase):
+
+    def make_response(self, status_code, retry_after=None):
+        response = requests.Response()
+        response.status_code = status_code
+        if retry_after is not None:
+            response.headers['Retry-After'] = retry_after
+        return response
+
+    def test_can_retry(self):
+        policy = RetryPolicy(max_attempts=3)
+        self.assertTrue(policy.can_retry('get', {}, 1))
+        self.assertTrue(policy.can_retry('put', {}, 2))
+        self.assertFalse(policy.can_retry('get', {}, 3))
+        self.assertFalse(policy.can_retry('post', {}, 1))
+        self.assertTrue(policy.can_retry('post', {'Idempotency-Key': 'key'}, 1))
+
+        self.assertFalse(RetryPolicy().can_retry('get', {}, 1))
+
+    def test_should_retry_response(self):
+        policy = RetryPolicy(max_attempts=3)
+        for status_code in (429, 502, 503, 504):
+            self.assertTrue(policy.should_retry_response(self.make_response(status_code)))
+        for status_code in (200, 400, 401, 404, 500):
+            self.assertFalse(policy.should_retry_response(self.make_response(status_code)))
+
+        policy = RetryPolicy(max_attempts=3, retry_status_codes=[500])
+        self.assertTrue(policy.should_retry_response(self.make_response(500)))
+        self.assertFalse(policy.should_retry_response(self.make_response(503)))
+
+    def test_get_delay(self):
+        policy = RetryPolicy(max_attempts=10, backoff_base=1, backoff_max=5)
+        for i in range(100):
+            self.assertTrue(0 <= policy.get_delay(1) <= 1)
+            self.assertTrue(0 <= policy.get_delay(3) <= 4)
+            self.assertTrue(0 <= policy.get_delay(8) <= 5)
+
+        self.assertEquals(policy.get_delay(1, self.make_response(503, '3')), 3)
+        self.assertEquals(policy.get_delay(1, self.make_response(503, '120')), 5)
+        delay = policy.get_delay(1, self.make_response(503, formatdate(time.time() + 2, usegmt=True)))
+        self.assertTrue(0 < delay <= 2)
+        self.assertTrue(0 <= policy.get_delay(1, self.make_response(503, 'invalid')) <= 1)
+
+    def test_bad_parameters(self):
+        self.assertRaises(SnowClientException, RetryPolicy, 0)
+        self.assertRaises(SnowClientException, RetryPolicy, 3, -1)
+
+
+if __name__ == '__main__':
+    unittest.main()  # for compatibility with Python2.6 unittest
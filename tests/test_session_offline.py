@@ -0,0 +1,505 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the cern-snow-client library.
+# Copyright (c) 2017 CERN
+# Authors:
+#  - James Clerc <james.clerc@cern.ch> <james.clerc@epitech.eu>
+#  - David Martin Clavo <david.martin.clavo@cern.ch>
+#
+# The cern-snow-client library is free software; you can redistribute it
+# and/or modify it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# The cern-snow-client library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with the cern-snow-client library.  If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from urlparse import parse_qs
+from urlparse import urlparse
+
+import requests
+
+from cern_snow_client.concurrency import AdaptiveConcurrencyLimiter
+from cern_snow_client.log_queue import QueueHandler
+from cern_snow_client.rate_limit import RateLimiter
+from cern_snow_client.record import RecordQuery
+from cern_snow_client.retry import RetryPolicy
+from cern_snow_client.session import SnowRestSession
+from cern_snow_client.threaded_session import ThreadedSnowRestSession
+from tests.fake_adapter import FakeAdapter
+
+
+class TestSessionOffline(unittest.TestCase):
+    """
+    Tests of the SnowRestSession which do not need a ServiceNow instance: the HTTP traffic goes through
+    a FakeAdapter.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def make_basic_session(self, responses=None):
+        s = SnowRestSession()
+        s.set_instance('cerntest.service-now.com')
+        s.auth_type = 'basic'
+        s.set_basic_auth_user('user')
+        s.set_basic_auth_password('password')
+        s.set_session_cookie_file_path(os.path.join(self.directory, 'basic_cookie.txt'))
+        adapter = FakeAdapter.mount_on(s, responses)
+        return s, adapter
+
+    def make_sso_oauth_session(self, token_age, expires_in=1800):
+        cookie_file_path = os.path.join(self.directory, 'sso_oauth_cookie.txt')
+        with open(cookie_file_path, 'w') as cookie_file:
+            cookie_file.write('# Netscape HTTP Cookie File\n')
+            for name in ['glide_user_activity', 'glide_session_store', 'glide_user_route', 'JSESSIONID',
+                         'BIGipServerpool_cern']:
+                cookie_file.write('cerntest.service-now.com\tFALSE\t/\tTRUE\t4102444800\t' + name + '\tvalue\n')
+
+        token_file_path = os.path.join(self.directory, 'token_file.txt')
+        with open(token_file_path, 'w') as token_file:
+            json.dump({'access_token': 'old_access', 'refresh_token': 'refresh', 'expires_in': expires_in},
+                      token_file)
+        issued_at = time.time() - token_age
+        os.utime(token_file_path, (issued_at, issued_at))
+
+        s = SnowRestSession()
+        s.set_instance('cerntest.service-now.com')
+        s.auth_type = 'sso_oauth'
+        s.set_oauth_client_id('client_id')
+        s.set_oauth_client_secret('client_secret')
+        s.set_session_cookie_file_path(cookie_file_path)
+        s.set_oauth_token_file_path(token_file_path)
+        adapter = FakeAdapter.mount_on(s)
+        return s, adapter
+
+    def test_session_initiated_once(self):
+        s, adapter = self.make_basic_session()
+        s.get('/api/now/v2/table/incident')
+        cookie_jar = s.session.cookies
+
+        s.get('/api/now/v2/table/incident')
+        s.put('/api/now/v2/table/incident/abc', data='{}')
+
+        self.assertTrue(s.session.cookies is cookie_jar)
+        self.assertEquals(len(adapter.requests), 3)
+
+    def test_invalidate_session(self):
+        s, adapter = self.make_basic_session()
+        s.get('/api/now/v2/table/incident')
+        cookie_jar = s.session.cookies
+
+        s.invalidate_session()
+        s.get('/api/now/v2/table/incident')
+
+        self.assertFalse(s.session.cookies is cookie_jar)
+
+    def test_setters_invalidate_session(self):
+        s, adapter = self.make_basic_session()
+        s.get('/api/now/v2/table/incident')
+        cookie_jar = s.session.cookies
+
+        s.set_basic_auth_password('other_password')
+        s.get('/api/now/v2/table/incident')
+
+        self.assertFalse(s.session.cookies is cookie_jar)
+        self.assertEquals(s.session.auth, ('user', 'other_password'))
+
+    def test_cookie_write_behind(self):
+        s, adapter = self.make_basic_session()
+        s.set_cookie_write_behind(True)
+        s.set_cookie_flush_interval(3600)
+        cookie_file_path = s.session_cookie_file_path
+
+        adapter.add_response(set_cookies=['JSESSIONID=1; Path=/'])
+        s.get('/api/now/v2/table/incident')
+        self.assertFalse(os.path.exists(cookie_file_path))
+
+        s.close()
+        self.assertTrue(os.path.exists(cookie_file_path))
+        self.assertTrue('JSESSIONID' in open(cookie_file_path).read())
+        self.assertEquals(os.listdir(self.directory), ['basic_cookie.txt'])
+
+    def test_cookie_write_behind_unchanged_cookies(self):
+        s, adapter = self.make_basic_session()
+        s.set_cookie_write_behind(True)
+        s.set_cookie_flush_interval(3600)
+
+        adapter.add_response(set_cookies=['JSESSIONID=1; Path=/'])
+        s.get('/api/now/v2/table/incident')
+        s.flush_cookies()
+        os.utime(s.session_cookie_file_path, (1000000000, 1000000000))
+
+        adapter.add_response(set_cookies=['JSESSIONID=1; Path=/'])
+        s.get('/api/now/v2/table/incident')
+        s.flush_cookies()
+
+        self.assertEquals(os.path.getmtime(s.session_cookie_file_path), 1000000000)
+
+    def test_cookie_file_written_after_every_response(self):
+        s, adapter = self.make_basic_session()
+
+        adapter.add_response(set_cookies=['JSESSIONID=1; Path=/'])
+        s.get('/api/now/v2/table/incident')
+
+        self.assertTrue('JSESSIONID' in open(s.session_cookie_file_path).read())
+        self.assertEquals(os.listdir(self.directory), ['basic_cookie.txt'])
+
+        # the file is not written again while the cookies do not change
+        os.utime(s.session_cookie_file_path, (1000000000, 1000000000))
+        s.get('/api/now/v2/table/incident')
+        adapter.add_response(set_cookies=['JSESSIONID=1; Path=/'])
+        s.get('/api/now/v2/table/incident')
+        self.assertEquals(os.path.getmtime(s.session_cookie_file_path), 1000000000)
+
+        adapter.add_response(set_cookies=['JSESSIONID=2; Path=/'])
+        s.get('/api/now/v2/table/incident')
+        self.assertTrue(os.path.getmtime(s.session_cookie_file_path) > 1000000000)
+
+    def test_expired_cookie_in_file(self):
+        s, adapter = self.make_basic_session()
+        with open(s.session_cookie_file_path, 'w') as cookie_file:
+            cookie_file.write('# Netscape HTTP Cookie File\n')
+            cookie_file.write('cerntest.service-now.com\tFALSE\t/\tTRUE\t1000000000\tglide_expired\tvalue\n')
+            cookie_file.write('cerntest.service-now.com\tFALSE\t/\tTRUE\t4102444800\tglide_valid\tvalue\n')
+
+        s.get('/api/now/v2/table/incident')
+        cookie_jar = s.session.cookies
+        self.assertEquals([cookie.name for cookie in cookie_jar], ['glide_valid'])
+
+        # the expired cookie does not make the session be initiated again, and is not written back
+        adapter.add_response(set_cookies=['JSESSIONID=1; Path=/'])
+        s.get('/api/now/v2/table/incident')
+        self.assertTrue(s.session.cookies is cookie_jar)
+        self.assertTrue('glide_expired' not in open(s.session_cookie_file_path).read())
+
+    def test_cookies_flushed_before_initiation(self):
+        s, adapter = self.make_basic_session()
+        s.set_cookie_write_behind(True)
+        s.set_cookie_flush_interval(3600)
+
+        adapter.add_response(set_cookies=['JSESSIONID=1; Path=/', 'glide_expiring=1; Path=/; Max-Age=1'])
+        s.get('/api/now/v2/table/incident')
+        self.assertFalse(os.path.exists(s.session_cookie_file_path))
+
+        # the cookie expires: the session is initiated again, with the cookies received before
+        for cookie in s.session.cookies:
+            if cookie.name == 'glide_expiring':
+                cookie.expires = int(time.time()) - 1
+        s.get('/api/now/v2/table/incident')
+        self.assertEquals([cookie.name for cookie in s.session.cookies], ['JSESSIONID'])
+        s.close()
+
+    def test_oauth_token_not_refreshed_before_margin(self):
+        s, adapter = self.make_sso_oauth_session(token_age=60)
+        s.get('/api/now/v2/table/incident')
+
+        self.assertEquals(len(adapter.requests), 1)
+        self.assertEquals(adapter.requests[0].headers['Authorization'], 'Bearer old_access')
+
+    def test_oauth_token_refreshed_before_expiry(self):
+        s, adapter = self.make_sso_oauth_session(token_age=1790)
+        s.set_oauth_token_refresh_margin(60)
+        adapter.add_response(text=json.dumps({'access_token': 'new_access', 'refresh_token': 'refresh',
+                                              'expires_in': 1800}))
+        adapter.add_response()
+        s.get('/api/now/v2/table/incident')
+        s.get('/api/now/v2/table/incident')
+
+        self.assertEquals(len(adapter.requests), 3)
+        self.assertTrue(adapter.requests[0].url.endswith('/oauth_token.do'))
+        self.assertTrue('grant_type=refresh_token' in adapter.requests[0].body)
+        self.assertEquals(adapter.requests[1].headers['Authorization'], 'Bearer new_access')
+        self.assertEquals(adapter.requests[2].headers['Authorization'], 'Bearer new_access')
+        self.assertEquals(json.load(open(s.oauth_token_file_path))['access_token'], 'new_access')
+
+    def test_oauth_token_refreshed_once_by_concurrent_threads(self):
+        s, adapter = self.make_sso_oauth_session(token_age=1790)
+        adapter.add_response(text=json.dumps({'access_token': 'new_access', 'refresh_token': 'refresh',
+                                              'expires_in': 1800}))
+
+        threads = [threading.Thread(target=s.get, args=('/api/now/v2/table/incident',)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        token_requests = [request for request in adapter.requests if request.url.endswith('/oauth_token.do')]
+        self.assertEquals(len(token_requests), 1)
+        self.assertEquals(len(adapter.requests), 9)
+        for request in adapter.requests[1:]:
+            self.assertEquals(request.headers['Authorization'], 'Bearer new_access')
+
+    def test_stream_after_single_sign_on_again(self):
+        s, adapter = self.make_sso_oauth_session(token_age=60)
+        cookie_file_contents = open(s.session_cookie_file_path).read()
+
+        def call_cern_get_sso_cookie():
+            with open(s.session_cookie_file_path, 'w') as cookie_file:
+                cookie_file.write(cookie_file_contents)
+        # the cern-get-sso-cookie command is only available in CERN Linux environments
+        s._SnowRestSession__call_cern_get_sso_cookie = call_cern_get_sso_cookie
+
+        adapter.add_response(status_code=401)
+        # neither the refresh token nor the password grant work before the Single-Sign-On
+        for i in range(3):
+            adapter.add_response(status_code=401)
+        adapter.add_response(text=json.dumps({'access_token': 'new_access', 'refresh_token': 'refresh',
+                                              'expires_in': 1800}))
+        adapter.add_response(text=json.dumps({'result': [{'number': 'INC0000001'}]}))
+
+        response = s.get('/api/now/v2/table/incident', stream=True)
+        self.assertEquals(len(adapter.requests), 6)
+        self.assertEquals(adapter.requests[5].headers['Authorization'], 'Bearer new_access')
+        self.assertEquals(adapter.streams[5], True)
+        self.assertEquals(response.status_code, 200)
+
+    def test_connection_pool_configuration(self):
+        s = SnowRestSession()
+        s.set_pool_connections(2)
+        s.set_pool_maxsize(32)
+        s.set_pool_block(True)
+
+        adapter = s.session.get_adapter('https://cerntest.service-now.com')
+        self.assertEquals(adapter._pool_connections, 2)
+        self.assertEquals(adapter._pool_maxsize, 32)
+        self.assertEquals(adapter._pool_block, True)
+
+    def test_headers_not_modified(self):
+        s, adapter = self.make_basic_session()
+        headers = {'X-Test': 'value'}
+        s.get('/api/now/v2/table/incident', headers=headers)
+
+        self.assertEquals(headers, {'X-Test': 'value'})
+        self.assertEquals(adapter.requests[0].headers['X-Test'], 'value')
+
+    def test_threaded_session(self):
+        s, adapter = self.make_basic_session()
+        for i in range(20):
+            adapter.add_response(text='{"result": {"number": "INC%d"}}' % i)
+
+        with ThreadedSnowRestSession(s, max_concurrency=4, max_pending=8) as a:
+            futures = [a.get('/api/now/v2/table/incident/%d' % i) for i in range(20)]
+            responses = [future.result() for future in futures]
+            future = a.submit(len, responses)
+
+        self.assertEquals(len(adapter.requests), 20)
+        self.assertEquals([response.status_code for response in responses], [200] * 20)
+        self.assertEquals(future.result(), 20)
+        self.assertEquals(s.pool_maxsize, 10)
+
+
+    def test_lazy_log_formatting(self):
+        class Argument(object):
+            formatted = 0
+
+            def __str__(self):
+                Argument.formatted += 1
+                return 'argument'
+
+        s, adapter = self.make_basic_session()
+        log_file_path = os.path.join(self.directory, 'log.txt')
+        s.set_log_enabled(True)
+        s.set_log_level('INFO')
+        s.set_log_file_path(log_file_path)
+        s.set_log_body_max_length(20)
+
+        s._debug('not logged: %s', Argument())
+        self.assertEquals(Argument.formatted, 0)
+        s._info('logged: %s', Argument())
+        self.assertTrue(Argument.formatted > 0)
+
+        s.set_log_level('DEBUG')
+        adapter.add_response(text=json.dumps({'result': [{'short_description': 'x' * 100}]}))
+        RecordQuery(s, 'incident').query(query_encoded='active=true')
+        s.get_log_handler().flush()
+
+        with open(log_file_path) as log_file:
+            log = log_file.read()
+        self.assertTrue('not logged' not in log)
+        self.assertTrue('logged: argument' in log)
+        self.assertTrue('{"result": [{"short_... (' in log)
+        self.assertTrue('x' * 30 not in log)
+
+    def test_log_query_stream(self):
+        s, adapter = self.make_basic_session()
+        log_file_path = os.path.join(self.directory, 'log.txt')
+        s.set_log_enabled(True)
+        s.set_log_level('DEBUG')
+        s.set_log_file_path(log_file_path)
+
+        adapter.add_response(text=json.dumps({'result': [{'number': 'INC0000001'}]}))
+        record_set = RecordQuery(s, 'incident').query(query_encoded='active=true', stream=True)
+        self.assertEquals([record.number for record in record_set], ['INC0000001'])
+        s.get_log_handler().flush()
+
+        with open(log_file_path) as log_file:
+            log = log_file.read()
+        self.assertTrue('streaming the result of querying the table incident with URL' in log)
+        self.assertTrue('at offset' not in log)
+
+    def test_log_async(self):
+        s, adapter = self.make_basic_session()
+        log_file_path = os.path.join(self.directory, 'log.txt')
+        s.set_log_enabled(True)
+        s.set_log_level('INFO')
+        s.set_log_async(True)
+        s.set_log_file_path(log_file_path)
+        self.assertTrue(isinstance(s.get_log_handler(), QueueHandler))
+
+        for i in range(10):
+            s._info('message %d', i)
+        s.close()
+
+        with open(log_file_path) as log_file:
+            lines = log_file.read().splitlines()
+        self.assertEquals(len(lines), 10)
+        self.assertTrue(lines[9].endswith('[INFO] message 9'))
+        self.assertEquals(s.get_log_handler().get_dropped_count(), 0)
+
+        s.set_log_async(False)
+        self.assertFalse(isinstance(s.get_log_handler(), QueueHandler))
+
+    def test_retry(self):
+        s, adapter = self.make_basic_session()
+        s.set_retry_policy(RetryPolicy(max_attempts=3, backoff_base=0))
+        adapter.add_response(status_code=503, headers={'Retry-After': '0'})
+        adapter.add_response(status_code=429)
+        adapter.add_response(text='{"result": {"number": "INC1"}}')
+
+        response = s.get('/api/now/v2/table/incident/1')
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(len(adapter.requests), 3)
+
+        # after max_attempts, the last response is returned
+        for i in range(3):
+            adapter.add_response(status_code=504)
+        self.assertEquals(s.put('/api/now/v2/table/incident/1', data='{}').status_code, 504)
+        self.assertEquals(len(adapter.requests), 6)
+
+    def test_retry_post(self):
+        s, adapter = self.make_basic_session()
+        s.set_retry_policy(RetryPolicy(max_attempts=3, backoff_base=0))
+
+        adapter.add_response(status_code=503)
+        self.assertEquals(s.post('/api/now/v2/table/incident', data='{}').status_code, 503)
+        self.assertEquals(len(adapter.requests), 1)
+
+        adapter.add_response(status_code=503)
+        adapter.add_response(status_code=201)
+        response = s.post('/api/now/v2/table/incident', data='{}', headers={'Idempotency-Key': 'key'})
+        self.assertEquals(response.status_code, 201)
+        self.assertEquals(len(adapter.requests), 3)
+
+    def test_retry_connection_error(self):
+        s, adapter = self.make_basic_session()
+        s.set_retry_policy(RetryPolicy(max_attempts=2, backoff_base=0))
+        failures = [requests.exceptions.ConnectionError('reset')] * 3
+
+        def responder(request):
+            if failures:
+                raise failures.pop()
+            return 200, '{"result": []}', None, None
+        adapter.responder = responder
+
+        self.assertRaises(requests.exceptions.ConnectionError, s.get, '/api/now/v2/table/incident')
+        self.assertEquals(len(adapter.requests), 2)
+        self.assertEquals(s.get('/api/now/v2/table/incident').status_code, 200)
+        self.assertEquals(len(adapter.requests), 4)
+
+    def test_retry_configuration(self):
+        config_file_path = os.path.join(self.directory, 'config.yaml')
+        with open(config_file_path, 'w') as config_file:
+            config_file.write('instance: cerntest.service-now.com\n'
+                              'auth:\n'
+                              '    type: basic\n'
+                              'session:\n'
+                              '    retry_max_attempts: 5\n'
+                              '    retry_backoff_max: 60\n'
+                              '    retry_status_codes: [503]\n')
+        s = SnowRestSession()
+        s.load_config_file(config_file_path)
+
+        self.assertEquals(s.retry_policy.max_attempts, 5)
+        self.assertEquals(s.retry_policy.backoff_max, 60)
+        self.assertEquals(s.retry_policy.retry_status_codes, frozenset([503]))
+
+    def test_rate_limiter(self):
+        s, adapter = self.make_basic_session()
+        s.set_rate_limiter(RateLimiter(rate=100, burst=1))
+
+        start = time.time()
+        for i in range(6):
+            s.get('/api/now/v2/table/incident')
+        self.assertTrue(time.time() - start >= 0.05)
+        self.assertEquals(len(adapter.requests), 6)
+
+    def test_concurrency_limiter(self):
+        s, adapter = self.make_basic_session()
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=2, max_limit=2, latency_tolerance=None)
+        s.set_concurrency_limiter(limiter)
+        lock = threading.Lock()
+        running = [0]
+        maximum = [0]
+
+        def responder(request):
+            with lock:
+                running[0] += 1
+                maximum[0] = max(maximum[0], running[0])
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+            params = parse_qs(urlparse(request.url).query)
+            offset = int(params['sysparm_offset'][0])
+            rows = [{'sys_id': str(i)} for i in range(offset, min(offset + 10, 80))]
+            return 200, json.dumps({'result': rows}), {'X-Total-Count': '80'}, None
+        adapter.responder = responder
+
+        record_set = RecordQuery(s, 'incident').query(query_encoded='active=true', page_size=10, parallel_pages=6)
+        self.assertEquals(len(list(record_set)), 80)
+        self.assertEquals(maximum[0], 2)
+
+        adapter.responder = None
+        adapter.add_response(status_code=503)
+        s.get('/api/now/v2/table/incident')
+        self.assertEquals(limiter.get_limit(), 1)
+        self.assertEquals(limiter.get_statistics()['in_flight'], 0)
+
+    def test_concurrency_limiter_stream(self):
+        s, adapter = self.make_basic_session()
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=2, latency_tolerance=None)
+        s.set_concurrency_limiter(limiter)
+        adapter.add_response(text=json.dumps({'result': [{'number': 'INC0000001'}, {'number': 'INC0000002'}]}))
+
+        # a streamed query is in flight until its body has been parsed
+        record_set = RecordQuery(s, 'incident').query(query_encoded='active=true', stream=True)
+        self.assertEquals(record_set.next().number, 'INC0000001')
+        self.assertEquals(limiter.get_statistics()['in_flight'], 1)
+        self.assertEquals(len(list(record_set)), 1)
+        self.assertEquals(limiter.get_statistics()['in_flight'], 0)
+
+        response = s.get('/api/now/v2/table/incident', stream=True)
+        self.assertEquals(limiter.get_statistics()['in_flight'], 1)
+        response.close()
+        response.close()
+        self.assertEquals(limiter.get_statistics()['in_flight'], 0)
+
+if __name__ == '__main__':
+    unittest.main()  # for compatibility with Python2.6 unittest
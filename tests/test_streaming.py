@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the cern-snow-client library.
+# Copyright (c) 2017 CERN
+# Authors:
+#  - James Clerc <james.clerc@cern.ch> <james.clerc@epitech.eu>
+#  - David Martin Clavo <david.martin.clavo@cern.ch>
+#
+# The cern-snow-client library is free software; you can redistribute it
+# and/or modify it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# The cern-snow-client library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with the cern-snow-client library.  If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+
+import json
+import unittest
+
+from cern_snow_client.streaming import ResultStreamParser
+from cern_snow_client.streaming import ijson
+
+
+class FakeStreamedResponse(object):
+    """
+    The minimal interface of a requests.Response obtained with stream=True.
+    """
+
+    def __init__(self, content, encoding='utf-8'):
+        self.content = content
+        self.encoding = encoding
+        self.closed = False
+        self.read_size = 0
+
+    def iter_content(self, chunk_size=1):
+        for position in range(0, len(self.content), chunk_size):
+            self.read_size = position + chunk_size
+            yield self.content[position:position + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+class TestStreaming(unittest.TestCase):
+
+    body = json.dumps({
+        'result': [
+            {'number': 'INC0000001', 'short_description': u'Café [1], {2}', 'reassignment_count': 12345},
+            {'number': 'INC0000002', 'watch_list': ['a', 'b'], 'incident_state': {'value': '2',
+                                                                                  'display_value': 'Assigned'}},
+            123456789,
+            None,
+        ],
+        'other': {'result': ['not', 'a', 'record']},
+    }, indent=1, ensure_ascii=False).encode('utf-8')
+
+    def test_parse_in_chunks(self):
+        expected = json.loads(self.body)['result']
+
+        for chunk_size in [1, 2, 3, 7, 64, 100000]:
+            response = FakeStreamedResponse(self.body)
+            parser = ResultStreamParser(response, chunk_size=chunk_size, use_ijson=False)
+            self.assertEquals(list(parser), expected)
+            self.assertEquals(parser.get_item_count(), 4)
+            self.assertTrue(parser.get_last_item() is None)
+            self.assertTrue(response.closed)
+
+    def test_parse_incrementally(self):
+        body = json.dumps({'result': [{'number': 'INC%07d' % i} for i in range(1000)]})
+        response = FakeStreamedResponse(body)
+        parser = ResultStreamParser(response, chunk_size=100, use_ijson=False)
+
+        self.assertEquals(parser.next(), {'number': 'INC0000000'})
+        self.assertTrue(response.read_size < 1000)
+        self.assertEquals(parser.get_item_count(), 1)
+
+        parser.close()
+        self.assertTrue(response.closed)
+
+    def test_no_result(self):
+        for body in ['{"result": []}', '{}', '{"error": {"message": "No Record found"}, "status": "failure"}',
+                     '{"result": {"number": "INC0000001"}}']:
+            self.assertEquals(list(ResultStreamParser(FakeStreamedResponse(body), use_ijson=False)), [])
+
+    def test_invalid_json(self):
+        for body in ['', '[]', '{"result": [{"number": "INC0000001"}', '{"result": [{"number": INC0000001}]}']:
+            parser = ResultStreamParser(FakeStreamedResponse(body), chunk_size=4, use_ijson=False)
+            self.assertRaises(ValueError, list, parser)
+
+    def test_ijson(self):
+        if ijson is None:
+            return
+        body = json.dumps({'result': [{'number': 'INC%07d' % i} for i in range(100)]})
+        parser = ResultStreamParser(FakeStreamedResponse(body), chunk_size=10, use_ijson=True)
+        self.assertEquals(list(parser), json.loads(body)['result'])
+
+
+if __name__ == '__main__':
+    unittest.main()  # for compatibility with Python2.6 unittest